@@ -0,0 +1,82 @@
+# Local embedding functions for the RAG pipeline
+#
+# Everything here runs offline: a sentence-transformers model when one is
+# installed and already downloaded, otherwise a hashing embedder that needs
+# nothing beyond NumPy. Both return L2-normalized float32 rows, so cosine
+# similarity is a plain dot product.
+
+import re
+import zlib
+import numpy as np
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+HASH_DIM = 512
+BATCH_SIZE = 64
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalize(X):
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return (X / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class HashingEmbedder:
+    # Signed feature hashing of word unigrams and bigrams with sublinear tf:
+    # no vocabulary to fit, so adding documents never changes old vectors
+    def __init__(self, dim=HASH_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        words = TOKEN.findall(text.lower())
+        return words + [a + " " + b for a, b in zip(words, words[1:])]
+
+    # crc32 rather than hash(): stable across processes and Python versions
+    def _hash(self, feature):
+        h = zlib.crc32(feature.encode("utf-8"))
+        return h % self.dim, 1.0 if h >> 31 else -1.0
+
+    def embed_documents(self, texts, batch_size=BATCH_SIZE):
+        X = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            counts = {}
+            for feat in self._features(text):
+                counts[feat] = counts.get(feat, 0) + 1
+            for feat, n in counts.items():
+                j, sign = self._hash(feat)
+                X[i, j] += sign * (1.0 + np.log(n))
+        return _normalize(X)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name=DEFAULT_MODEL, device="cpu"):
+        from sentence_transformers import SentenceTransformer
+        # local_files_only: never reach for the network from an edge board
+        self.model = SentenceTransformer(model_name, device=device, local_files_only=True)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name}"
+
+    def embed_documents(self, texts, batch_size=BATCH_SIZE):
+        X = self.model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True,
+                              convert_to_numpy=True, show_progress_bar=False)
+        return X.astype(np.float32)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def get_embedding_function(name=None):
+    """`name`: "hashing", a sentence-transformers model name, or None for the best available."""
+    if name == "hashing":
+        return HashingEmbedder()
+    try:
+        return SentenceTransformerEmbedder(name or DEFAULT_MODEL)
+    except Exception as e:
+        if name:
+            raise
+        print(f"Local embedding model unavailable ({e.__class__.__name__}); using hashing embedder")
+        return HashingEmbedder()
@@ -1,6 +1,6 @@
 # RAG Augmenting LLM with specialized and mutable knowledge
 
-# In general : 
+# In general :
     # Prompt -> LLM -> Response
 
 # RAG
@@ -12,87 +12,232 @@
 
 # Working
 
-    # 1. Load the documents 
+    # 1. Load the documents
     # 2. Chunk the documents (realtive information)
     # 3. Embed the chunks
     # 4. Create a Vector database (for easy retrieval)
 
+# Everything runs offline: a local embedding model (embeddings.py) and a
+# vector store persisted as NumPy + JSONL. Re-running only parses PDFs whose
+# file changed and only embeds pages whose text changed.
 
-# loading the pdf
 import argparse
 import os
+import json
+import time
+import glob
+import hashlib
 import shutil
-from langchain_community.document_loaders import PyPDFDirectoryLoader
+import numpy as np
+from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.schema.document import Document
-# from get_embedding_function import get_embedding_function
-from langchain_community.vectorstores import Chroma
+from embeddings import get_embedding_function, BATCH_SIZE
+from vector_index import build_index, remove_index, index_options, VectorIndex, DTYPES
 
 
 DATA_PATH = '/home/snakkill/Projects/LLM/RAG/data/'
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-# we can use any document loader, here we are using PyPDFDirectoryLoader for loading pdfs
+STORE_PATH = '/home/snakkill/Projects/LLM/RAG/store/'
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
 
-def load_docs():
-    doc_loader = PyPDFDirectoryLoader(DATA_PATH)
-    return doc_loader.load()
+# loading the pdf, one page at a time
+# PyPDFLoader is what PyPDFDirectoryLoader used per file; going file by file
+# lets unchanged PDFs be skipped without parsing them at all
 
+def list_pdfs(data_path):
+    return sorted(glob.glob(os.path.join(data_path, "**", "*.pdf"), recursive=True))
 
-# print(docs[0])
+def load_pages(pdf_path):
+    return [(doc.metadata.get('page', i), doc.page_content) for i, doc in enumerate(PyPDFLoader(pdf_path).load())]
 
 # Splitting the documents
 
 # we using RecursiveCharacterTextSplitter for splitting the documents, a built in splitter in langchain
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.schema.document import Document
-
-def split_documents(docs: list[Document]):
-    txt_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50,
+def get_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
         length_function=len,
         is_separator_regex=False,
     )
-    return txt_splitter.split_documents(docs)
-
 
-docs = load_docs()
-chunks = split_documents(docs)
-# print(chunks[0])
-
-# Embedding the chunks
+# indexing the chunks
+# deterministic ids: the same page text always yields the same ids
 
-from langchain_community.embeddings.bedrock import BedrockEmbeddings
+def chunk_id(source, page, index):
+    return f'{source}:{page}:{index}'
 
-def get_embedding_function():
-    embeddings = BedrockEmbeddings(
-        credentials_profile_name='default', region_name="us-west-2"
-    )
-    return embeddings
+def page_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 # Building the vector database
 
-from get_embedding_funcition import get_embedding_function
-from langchain.vectorstores.chroma import Chroma
-
-def add_to_chroma(chunks: list[Document]):
-    db = Chroma(
-        persist_directory=CHROMA+PATH,embedding_function=get_embedding_function()
-    )
-    db.add_documents(new_chunks,ids=new_chunk_ids)
-
-    db.persist()
-
-# indexing the chunks
-last_page_id =None
-current_chunk_index = 0
-
-for chunk in chunks:
-    source = chunk.metadata.get('source')
-    page = chunk.metadata.get('page')
-    current_page_id = f'{source}_{page}'
-    if current_page_id == last_page_id:
-        current_chunk_index += 1
-    else:
-        current_chunk_index = 0
-    chunk.metadata['id'] = chunk_id
\ No newline at end of file
+class VectorStore:
+    """Normalized float32 embeddings (.npy) + one JSON record per chunk (.jsonl) + manifest."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []   # {"id", "source", "page", "text"}, row-aligned with vectors
+        self.vectors = None
+        self.manifest = {"embedder": None, "files": {}}
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        try:
+            with open(self._file('manifest.json')) as f:
+                self.manifest = json.load(f)
+            with open(self._file('chunks.jsonl')) as f:
+                self.records = [json.loads(line) for line in f if line.strip()]
+            self.vectors = np.load(self._file('embeddings.npy'))
+            if self.vectors.size == 0:
+                self.vectors = None
+        except FileNotFoundError:
+            self.records, self.vectors = [], None
+            self.manifest = {"embedder": None, "files": {}}
+
+    def __len__(self):
+        return len(self.records)
+
+    def delete(self, ids):
+        ids = set(ids)
+        if not ids:
+            return
+        keep = [i for i, r in enumerate(self.records) if r['id'] not in ids]
+        self.records = [self.records[i] for i in keep]
+        self.vectors = self.vectors[keep] if self.vectors is not None else None
+
+    def add(self, records, vectors):
+        if not records:
+            return
+        self.records.extend(records)
+        self.vectors = vectors if self.vectors is None else np.vstack([self.vectors, vectors])
+
+    # Written to temporaries and renamed, so a crash never leaves a half store
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        vectors = self.vectors if self.vectors is not None else np.zeros((0, 0), np.float32)
+        with open(self._file('embeddings.npy.tmp'), 'wb') as f:
+            np.save(f, vectors)
+        with open(self._file('chunks.jsonl.tmp'), 'w') as f:
+            for r in self.records:
+                f.write(json.dumps(r) + '\n')
+        with open(self._file('manifest.json.tmp'), 'w') as f:
+            json.dump(self.manifest, f)
+        for name in ('embeddings.npy', 'chunks.jsonl', 'manifest.json'):
+            os.replace(self._file(name + '.tmp'), self._file(name))
+
+    def search(self, query_vector, k=4):
+        if not self.records:
+            return []
+        scores = self.vectors @ query_vector
+        top = np.argsort(-scores)[:k]
+        return [(self.records[i], float(scores[i])) for i in top]
+
+
+def ingest(data_path, store, embedder, batch_size=BATCH_SIZE):
+    t0 = time.time()
+    splitter = get_splitter()
+    if store.manifest.get('embedder') != embedder.name:
+        if len(store):
+            print(f"Embedder changed ({store.manifest.get('embedder')} -> {embedder.name}); re-embedding everything")
+        store.delete([r['id'] for r in store.records])
+        store.vectors = None
+        store.manifest = {"embedder": embedder.name, "files": {}}
+
+    files = store.manifest['files']
+    seen, stale_ids, new_records = set(), [], []
+    pages_total = pages_changed = files_skipped = 0
+
+    for pdf in list_pdfs(data_path):
+        source = os.path.relpath(pdf, data_path)
+        seen.add(source)
+        st = os.stat(pdf)
+        entry = files.get(source)
+        if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+            files_skipped += 1
+            pages_total += len(entry['pages'])
+            continue
+
+        old_pages = entry['pages'] if entry else {}
+        pages = {}
+        for page, text in load_pages(pdf):
+            key = str(page)
+            h = page_hash(text)
+            pages_total += 1
+            old = old_pages.get(key)
+            if old and old['hash'] == h:
+                pages[key] = old
+                continue
+            pages_changed += 1
+            if old:
+                stale_ids += old['chunks']
+            ids = []
+            for i, chunk in enumerate(splitter.split_text(text)):
+                ids.append(chunk_id(source, page, i))
+                new_records.append({'id': ids[-1], 'source': source, 'page': page, 'text': chunk})
+            pages[key] = {'hash': h, 'chunks': ids}
+        # pages that no longer exist (the PDF got shorter)
+        for key in old_pages.keys() - pages.keys():
+            stale_ids += old_pages[key]['chunks']
+        files[source] = {'mtime': st.st_mtime, 'size': st.st_size, 'pages': pages}
+
+    for source in list(files.keys() - seen):
+        for page in files.pop(source)['pages'].values():
+            stale_ids += page['chunks']
+
+    store.delete(stale_ids)
+    t_embed = time.time()
+    texts = [r['text'] for r in new_records]
+    vectors = [embedder.embed_documents(texts[i:i + batch_size], batch_size)
+               for i in range(0, len(texts), batch_size)]
+    store.add(new_records, np.vstack(vectors) if vectors else None)
+    t_embed = time.time() - t_embed
+    store.save()
+
+    elapsed = time.time() - t0
+    return {'pages': pages_total, 'pages_embedded': pages_changed, 'files_skipped': files_skipped,
+            'chunks_added': len(new_records), 'chunks_removed': len(stale_ids), 'chunks_total': len(store),
+            'embed_time': t_embed, 'elapsed': elapsed,
+            'pages_per_s': pages_changed / elapsed if elapsed > 0 else 0.0}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Incrementally index a folder of PDFs into a local vector store.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--store', default=STORE_PATH)
+    parser.add_argument('--embedder', help='"hashing" or a local sentence-transformers model (default: best available).')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--reset', action='store_true', help='Drop the store and re-index from scratch.')
+    parser.add_argument('--index_dtype', choices=DTYPES, default='float16',
+                        help='Storage of the memory-mapped retrieval index (vector_index.py).')
+    parser.add_argument('--nlist', type=int, default=0, help='IVF lists for approximate search (0: exact only).')
+    parser.add_argument('--query', help='Run one search against the store after indexing.')
+    parser.add_argument('-k', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.store):
+        shutil.rmtree(args.store)
+    embedder = get_embedding_function(args.embedder)
+    store = VectorStore(args.store)
+    stats = ingest(args.data, store, embedder, args.batch_size)
+    print(f"{stats['pages']} pages ({stats['files_skipped']} unchanged PDFs skipped), "
+          f"{stats['pages_embedded']} pages embedded: +{stats['chunks_added']} / -{stats['chunks_removed']} chunks, "
+          f"{stats['chunks_total']} in store")
+    print(f"Ingest {stats['elapsed']:.2f}s ({stats['embed_time']:.2f}s embedding) → {stats['pages_per_s']:.1f} pages/s")
+
+    if not len(store):
+        remove_index(args.store)   # every PDF gone: don't keep serving their chunks
+    elif (args.reset or stats['chunks_added'] or stats['chunks_removed']
+          or index_options(args.store) != (args.index_dtype, args.nlist)):
+        build_index(args.store, args.index_dtype, args.nlist)
+
+    if args.query and not len(store):
+        print(f"{args.store} is empty; nothing to search")
+    elif args.query:
+        index = VectorIndex(args.store)
+        ids, scores = index.search(embedder.embed_query(args.query), args.k)
+        for record, score in zip(index.records(ids[0]), scores[0]):
+            print(f"{score:.3f}  {record['id']}  {record['text'][:80]!r}")
@@ -0,0 +1,186 @@
+# Question answering over the pdf_rag store on the edge inference path
+#
+#   retrieve : embed the question, top-k chunks from the memory-mapped index
+#   pack     : fit chunks into the token budget left by the n_ctx the
+#              configuration selector (run_score_algo.py) picks
+#   generate : llama.cpp on the pooled n_ctx instance, with the KV state of
+#              frequently retrieved chunks restored instead of re-evaluated
+#
+# Every stage is timed and logged per question.
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src" / "python"))
+sys.path.insert(0, str(ROOT / "bash_scripts" / "runs"))
+from embeddings import get_embedding_function
+from vector_index import VectorIndex
+from cost_estimator import CostEstimator
+from prefix_cache import PrefixStateCache, split_prompt
+from model_pool import ModelPool
+from run_score_algo import (MODEL_PATH, MAX_TOKENS, PREFIX_CACHE_MB, RAM_BUDGET_MB, DEFAULT_CTX,
+                            select_config, set_cpu_freq, set_core_affinity, get_cpu_temp)
+
+STORE_PATH = '/home/snakkill/Projects/LLM/RAG/store/'
+TOP_K = 8
+HOT_AFTER = 3        # retrievals before a chunk counts as hot and moves to the prefix
+SEPARATOR = '\n\n'
+SAFETY_TOKENS = 16   # slack for tokens merging differently across chunk joins
+
+
+class HotChunks:
+    """Retrieval counts; hot chunks keep the rank they got when they became hot,
+    so the same hot set always packs in the same order (same prefix, cache hit)."""
+
+    def __init__(self, hot_after=HOT_AFTER):
+        self.hot_after = hot_after
+        self.counts = {}
+        self.rank = {}
+
+    def record(self, ids):
+        for cid in ids:
+            self.counts[cid] = self.counts.get(cid, 0) + 1
+            if self.counts[cid] >= self.hot_after and cid not in self.rank:
+                self.rank[cid] = len(self.rank)
+
+    def is_hot(self, cid):
+        return cid in self.rank
+
+
+class RagPipeline:
+    def __init__(self, store_path, model_path=MODEL_PATH, embedder=None, k=TOP_K, max_tokens=MAX_TOKENS,
+                 nprobe=None, prefix_cache_mb=PREFIX_CACHE_MB):
+        self.index = VectorIndex(store_path)
+        self.embedder = get_embedding_function(embedder)
+        self.estimator = CostEstimator(model_path, max_tokens)
+        self.pool = ModelPool(model_path, ctx_buckets=[1024, 2048, DEFAULT_CTX], ram_budget_mb=RAM_BUDGET_MB)
+        self.hot = HotChunks()
+        self.k = k
+        self.nprobe = nprobe
+        self.max_tokens = max_tokens
+        self.prefix_cache_mb = prefix_cache_mb
+
+    def retrieve(self, question):
+        ids, scores = self.index.search(self.embedder.embed_query(question), self.k, self.nprobe)
+        chunks = self.index.records(ids[0])
+        for chunk, score in zip(chunks, scores[0]):
+            chunk['score'] = float(score)
+        return chunks
+
+    def budget(self, n_ctx, question):
+        _, prompt = split_prompt('', question)
+        return n_ctx - self.max_tokens - self.estimator.count(prompt, add_bos=True) - SAFETY_TOKENS
+
+    # Best-scoring chunks that fit, then hot ones first in their fixed rank,
+    # the rest by score. Returns (chunks, hot prefix count, context tokens).
+    def pack(self, chunks, budget):
+        sep = self.estimator.count(SEPARATOR)
+        chosen, used = [], 0
+        for chunk in chunks:
+            cost = self.estimator.count(chunk['text']) + (sep if chosen else 0)
+            if used + cost <= budget:
+                chosen.append(chunk)
+                used += cost
+        hot = sorted((c for c in chosen if self.hot.is_hot(c['id'])), key=lambda c: self.hot.rank[c['id']])
+        cold = [c for c in chosen if not self.hot.is_hot(c['id'])]
+        return hot + cold, len(hot), used
+
+    def answer(self, question):
+        t = {}
+        t0 = time.time()
+        chunks = self.retrieve(question)
+        t['retrieve_time'] = time.time() - t0
+
+        # load of the unpacked top-k is an upper bound; the chosen n_ctx then
+        # sets the budget, so packing can only lower the load the config was picked for
+        t0 = time.time()
+        full = SEPARATOR.join(c['text'] for c in chunks)
+        K = self.estimator.estimate(full, question).K
+        ambient = get_cpu_temp()
+        cores, freq, n_ctx, est_L, est_T = select_config(K, ambient)
+        self.hot.record(c['id'] for c in chunks)
+        packed, n_hot, context_tokens = self.pack(chunks, self.budget(n_ctx, question))
+        t['pack_time'] = time.time() - t0
+
+        t0 = time.time()
+        set_cpu_freq(freq)
+        model = self.pool.get(n_ctx)
+        llm = model.llm
+        if model.prefix_cache is None:
+            model.prefix_cache = PrefixStateCache(llm, self.prefix_cache_mb)
+        core_report = set_core_affinity(llm, cores)
+        t['setup_time'] = time.time() - t0
+
+        context = SEPARATOR.join(c['text'] for c in packed)
+        _, prompt = split_prompt(context, question)
+        t0 = time.time()
+        prefix_stats = {}
+        if n_hot:
+            # "Context: <hot chunks>" is a string prefix of the prompt
+            hot_prefix = 'Context: ' + SEPARATOR.join(c['text'] for c in packed[:n_hot]) + SEPARATOR
+            prefix_stats = model.prefix_cache.prepare(hot_prefix, prompt)
+        out = llm(prompt=prompt, max_tokens=self.max_tokens)
+        t['generate_time'] = time.time() - t0
+
+        return {
+            'question': question,
+            'response': out['choices'][0]['text'].strip(),
+            'chunks': [c['id'] for c in packed],
+            'dropped_chunks': [c['id'] for c in chunks if c not in packed],
+            'hot_chunks': n_hot,
+            'context_tokens': context_tokens,
+            'completion_tokens': out.get('usage', {}).get('completion_tokens'),
+            'config': {'cores': cores, 'freq_mhz': freq, 'n_ctx': n_ctx, 'n_threads': core_report['n_threads']},
+            'est_latency': est_L, 'est_temp': est_T, 'temp_start': ambient, 'temp_end': get_cpu_temp(),
+            **prefix_stats, **t,
+            'total_time': sum(t.values()),
+        }
+
+
+def load_questions(path):
+    with open(path) as f:
+        items = json.load(f)
+    return [item if isinstance(item, str) else item['question'] for item in items]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='retrieve → pack → generate over a pdf_rag store.')
+    parser.add_argument('--store', default=STORE_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--embedder', help='Must match the one the store was built with.')
+    parser.add_argument('--question')
+    parser.add_argument('--questions', help='JSON list of questions or {question: ...} items.')
+    parser.add_argument('-k', type=int, default=TOP_K)
+    parser.add_argument('--nprobe', type=int, help='Approximate search over this many IVF lists.')
+    parser.add_argument('--max_tokens', type=int, default=MAX_TOKENS)
+    parser.add_argument('--out', help='Append one JSON record per question here.')
+    args = parser.parse_args()
+
+    questions = [args.question] if args.question else load_questions(args.questions)
+    rag = RagPipeline(args.store, args.model, args.embedder, args.k, args.max_tokens, args.nprobe)
+    stages = ('retrieve_time', 'pack_time', 'setup_time', 'generate_time')
+    totals = dict.fromkeys(stages, 0.0)
+    out = open(args.out, 'a') if args.out else None
+    try:
+        for i, question in enumerate(questions):
+            r = rag.answer(question)
+            for s in stages:
+                totals[s] += r[s]
+            print(f"Q{i + 1}: n_ctx={r['config']['n_ctx']} {len(r['chunks'])} chunks / {r['context_tokens']} tok "
+                  f"({r['hot_chunks']} hot, {r.get('prefix_hit_tokens', 0)} tok reused) | "
+                  + " ".join(f"{s.split('_')[0]} {r[s]:.2f}s" for s in stages))
+            print(f"  → {r['response'][:120]}")
+            if out:
+                out.write(json.dumps(r) + '\n')
+                out.flush()
+    finally:
+        if out:
+            out.close()
+    n = max(len(questions), 1)
+    print("Mean per stage: " + ", ".join(f"{s} {v / n:.3f}s" for s, v in totals.items()))
+    for bucket, model in rag.pool.models.items():
+        print(f"Prefix cache n_ctx={bucket}: {model.prefix_cache.stats()}")
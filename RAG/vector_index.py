@@ -0,0 +1,215 @@
+# Compact retriever over the chunks indexed by pdf_rag.py
+#
+# Embeddings are stored quantized (float16, or int8 with a per-row scale) in
+# plain .npy files opened with mmap_mode="r": loading is a few header reads,
+# and pages are only faulted in as a search touches them, so the index costs
+# almost no RAM next to the GGUF weights. Exact search is a float32 matmul
+# over blocks of rows; the optional IVF mode clusters the rows (k-means over
+# normalized vectors) and scans only the nprobe closest lists.
+
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+
+INDEX_DIR = 'index'
+BLOCK_ROWS = 4096    # rows dequantized per matmul; keeps the float32 scratch in cache
+DTYPES = ('float32', 'float16', 'int8')
+KMEANS_ITERS = 10
+KMEANS_SAMPLE = 64   # training points per list
+
+
+def quantize(X, dtype):
+    if dtype == 'int8':
+        scale = np.abs(X).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        return np.round(X / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+    return X.astype(dtype), None
+
+# Spherical k-means: trained on a sample, then every row assigned once
+def kmeans(X, nlist, iters=KMEANS_ITERS, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = X[rng.choice(len(X), min(len(X), nlist * KMEANS_SAMPLE), replace=False)]
+    C = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(sample @ C.T, axis=1)
+        for j in range(nlist):
+            members = sample[assign == j]
+            if len(members):
+                c = members.sum(axis=0)
+                C[j] = c / max(np.linalg.norm(c), 1e-12)
+    assign = np.concatenate([np.argmax(X[i:i + BLOCK_ROWS] @ C.T, axis=1)
+                             for i in range(0, len(X), BLOCK_ROWS)])
+    return C.astype(np.float32), assign
+
+
+def build_index(store_path, dtype='float16', nlist=0, seed=0):
+    """Write <store>/index/ from the store's float32 embeddings and chunks.jsonl."""
+    if dtype not in DTYPES:
+        raise ValueError(f'dtype must be one of {DTYPES}')
+    final = os.path.join(store_path, INDEX_DIR)
+    # built beside the live index and swapped in whole, so a reader never
+    # sees new vectors with old offsets or a crash leaves a half index
+    out = final + '.tmp'
+    shutil.rmtree(out, ignore_errors=True)
+    os.makedirs(out)
+    X = np.load(os.path.join(store_path, 'embeddings.npy'), mmap_mode='r')
+    X = np.asarray(X, dtype=np.float32)
+
+    # byte offset of every chunk record, so results are read without loading the JSONL
+    offsets, pos = [], 0
+    with open(os.path.join(store_path, 'chunks.jsonl'), 'rb') as f:
+        for line in f:
+            if line.strip():
+                offsets.append(pos)
+            pos += len(line)
+    if len(offsets) != len(X):
+        raise ValueError(f'{len(offsets)} chunk records but {len(X)} embeddings in {store_path}')
+
+    # nlist is what was built (0 when there are too few rows), nlist_requested what was asked for
+    meta = {'dtype': dtype, 'rows': len(X), 'dim': int(X.shape[1]) if X.ndim == 2 else 0, 'nlist': 0,
+            'nlist_requested': nlist}
+    rows = np.arange(len(X))
+    if nlist and len(X) > nlist:
+        C, assign = kmeans(X, nlist, seed=seed)
+        # rows of one list are contiguous, so probing a list is one slice
+        rows = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[rows], np.arange(nlist + 1))
+        np.save(os.path.join(out, 'ivf_centroids.npy'), C)
+        np.save(os.path.join(out, 'ivf_bounds.npy'), bounds.astype(np.int64))
+        meta['nlist'] = nlist
+    Q, scale = quantize(X[rows], dtype)
+    np.save(os.path.join(out, 'vectors.npy'), Q)
+    np.save(os.path.join(out, 'rows.npy'), rows.astype(np.int64))
+    np.save(os.path.join(out, 'offsets.npy'), np.array(offsets, dtype=np.int64))
+    if scale is not None:
+        np.save(os.path.join(out, 'scales.npy'), scale)
+    with open(os.path.join(out, 'index.json'), 'w') as f:
+        json.dump(meta, f)
+    # a directory can't be os.replace()d over a non-empty one: move the old aside first
+    old = final + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(final):
+        os.rename(final, old)
+    os.rename(out, final)
+    shutil.rmtree(old, ignore_errors=True)
+    return meta
+
+def remove_index(store_path):
+    shutil.rmtree(os.path.join(store_path, INDEX_DIR), ignore_errors=True)
+
+# (dtype, requested nlist) of the index on disk, or None without one
+def index_options(store_path):
+    try:
+        with open(os.path.join(store_path, INDEX_DIR, 'index.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta['dtype'], meta.get('nlist_requested', meta['nlist'])
+
+
+class VectorIndex:
+    def __init__(self, store_path):
+        self.store_path = store_path
+        path = os.path.join(store_path, INDEX_DIR)
+        with open(os.path.join(path, 'index.json')) as f:
+            self.meta = json.load(f)
+
+        def load(name):
+            p = os.path.join(path, name)
+            return np.load(p, mmap_mode='r') if os.path.exists(p) else None
+
+        self.vectors = load('vectors.npy')
+        self.rows = load('rows.npy')
+        self.offsets = load('offsets.npy')
+        self.scales = load('scales.npy')
+        self.centroids = load('ivf_centroids.npy')
+        self.bounds = load('ivf_bounds.npy')
+
+    def __len__(self):
+        return self.meta['rows']
+
+    # Scores of positions [lo, hi) for every query, dequantized block by block
+    def _scan(self, Q, lo, hi):
+        out = np.empty((len(Q), hi - lo), dtype=np.float32)
+        for i in range(lo, hi, BLOCK_ROWS):
+            j = min(i + BLOCK_ROWS, hi)
+            S = Q @ np.asarray(self.vectors[i:j], dtype=np.float32).T
+            if self.scales is not None:
+                S *= self.scales[i:j]
+            out[:, i - lo:j - lo] = S
+        return out
+
+    @staticmethod
+    def _topk(scores, positions, k):
+        k = min(k, scores.shape[1])
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+        top = np.take_along_axis(part, order, axis=1)
+        return positions[top], np.take_along_axis(scores, top, axis=1)
+
+    def search(self, queries, k=4, nprobe=None):
+        """Row ids (into chunks.jsonl) and scores of the top k per query.
+
+        nprobe=None scans everything; with an IVF index it scans the nprobe
+        lists whose centroids are closest to each query.
+        """
+        Q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.centroids is None or nprobe is None:
+            scores = self._scan(Q, 0, len(self))
+            pos, sc = self._topk(scores, np.arange(len(self)), k)
+            return self.rows[pos], sc
+
+        ids = np.full((len(Q), k), -1, dtype=np.int64)
+        out = np.full((len(Q), k), -np.inf, dtype=np.float32)
+        lists = np.argsort(-(Q @ self.centroids.T), axis=1)[:, :nprobe]
+        for r, q in enumerate(Q):
+            spans = [(self.bounds[j], self.bounds[j + 1]) for j in lists[r]]
+            positions = np.concatenate([np.arange(a, b) for a, b in spans])
+            if positions.size == 0:
+                continue
+            scores = np.concatenate([self._scan(q[None], a, b) for a, b in spans], axis=1)
+            pos, sc = self._topk(scores, positions, k)
+            ids[r, :pos.shape[1]] = self.rows[pos[0]]
+            out[r, :sc.shape[1]] = sc[0]
+        return ids, out
+
+    def records(self, row_ids):
+        out = []
+        with open(os.path.join(self.store_path, 'chunks.jsonl'), 'rb') as f:
+            for i in row_ids:
+                if i < 0:
+                    continue
+                f.seek(int(self.offsets[i]))
+                out.append(json.loads(f.readline()))
+        return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or query the memory-mapped index of a pdf_rag store.')
+    parser.add_argument('store')
+    parser.add_argument('--dtype', choices=DTYPES, default='float16')
+    parser.add_argument('--nlist', type=int, default=0, help='IVF lists (0: exact search only).')
+    parser.add_argument('--query', help='Search instead of building.')
+    parser.add_argument('--embedder', help='Must match the one the store was built with.')
+    parser.add_argument('--nprobe', type=int)
+    parser.add_argument('-k', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.query is None:
+        t0 = time.time()
+        meta = build_index(args.store, args.dtype, args.nlist)
+        ivf = f", {meta['nlist']} IVF lists" if meta['nlist'] else ""
+        print(f"Indexed {meta['rows']} x {meta['dim']} as {meta['dtype']}{ivf} in {time.time() - t0:.2f}s")
+    else:
+        from embeddings import get_embedding_function
+        t0 = time.perf_counter()
+        index = VectorIndex(args.store)
+        t1 = time.perf_counter()
+        ids, scores = index.search(get_embedding_function(args.embedder).embed_query(args.query), args.k, args.nprobe)
+        t2 = time.perf_counter()
+        for record, score in zip(index.records(ids[0]), scores[0]):
+            print(f"{score:.3f}  {record['id']}  {record['text'][:80]!r}")
+        print(f"load {(t1 - t0) * 1000:.1f} ms, search {(t2 - t1) * 1000:.1f} ms")
@@ -1,48 +1,24 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
-import glob
-import re
-import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src" / "python"))
+from sweep_loader import load_sweep
 
 base_dir = "/home/rise/models/scripts/python/exp0703/results/sweep/core"
-all_dirs = sorted(glob.glob(os.path.join(base_dir, "q*_c*_*/")))
 
-# Only keep the latest run for each (query_id, core_count)
-latest_dirs = {}
-for path in all_dirs:
-    match = re.search(r"q(\d+)_c(\d+)_([0-9]{8}_[0-9]{6})", path)
-    if not match:
-        continue
-    qid, core, timestamp = int(match.group(1)), int(match.group(2)), match.group(3)
-    key = (qid, core)
-    if key not in latest_dirs or timestamp > latest_dirs[key][1]:
-        latest_dirs[key] = (path, timestamp)
+# One row per (query_id, core_count), repeats averaged, parsed in parallel and cached
+runs = load_sweep(os.path.dirname(base_dir), "core")
 
 avg_temp_data = {}
 elapsed_time_data = {}
-
-# Read data
-for (qid, core), (path, _) in latest_dirs.items():
-    csv_path = os.path.join(path, "metrics.csv")
-    json_path = os.path.join(path, "output.json")
-
-    if not os.path.isfile(csv_path) or not os.path.isfile(json_path):
-        continue
-
-    try:
-        df = pd.read_csv(csv_path)
-        if "CPU_Temperature" in df.columns:
-            avg_temp = df["CPU_Temperature"].mean()
-            avg_temp_data.setdefault(qid, {})[core] = avg_temp
-
-        with open(json_path) as f:
-            output = json.load(f)
-        elapsed = output.get("elapsed_time")
-        if elapsed is not None:
-            elapsed_time_data.setdefault(qid, {})[core] = elapsed
-    except Exception as e:
-        print(f"Error processing {path}: {e}")
+for row in runs.itertuples():
+    qid, core = int(row.query), int(row.param_value)
+    avg_temp_data.setdefault(qid, {})[core] = row.avg_temp
+    if pd.notna(row.latency):
+        elapsed_time_data.setdefault(qid, {})[core] = row.latency
 
 # Plot for each query
 output_dir = "core_sweep_avgtemp_plots"
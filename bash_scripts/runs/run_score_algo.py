@@ -1,11 +1,22 @@
 #!/usr/bin/env python3
-import json, time, os, subprocess
-from llama_cpp import Llama
+import json, time, os, sys
 import psutil
 from datetime import datetime
-import numpy as np
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src" / "python"))
+from prefix_cache import PrefixStateCache, split_prompt, group_by_context
+from config_space import (ConfigSpace, AnalyticSurrogate, WeightedObjective, EnergyObjective, DecisionTable,
+                          load_surrogate)
+from energy import load_power_model
+from core_control import apply_cores, CgroupCpu
+from model_pool import ModelPool, memory_status, reset_peak_rss
+from cost_estimator import CostEstimator
+from governor import CpuControl, DecodeController
+from model_mt import stream_tokens
+from token_timeline import TokenTimeline
+from speculative import ModeSpace, SpeculativeProfile, make_drafter
+
 # === Configuration ===
 MODEL_PATH       = "/home/rise/Downloads/llama-2-7b-chat.Q4_0.gguf"
 DATASET_PATH     = "/home/rise/models/scripts/python/exp0703/model/squad_val_100.json"
@@ -15,42 +26,44 @@ DEFAULT_FREQ     = 1500
 DEFAULT_CORES    = 4
 DEFAULT_CTX      = 4096
 TEST_SAMPLES     = 100    # ↦ only first 5 for quick test
-
-# Surrogate models
-def surrogate_runtime(K, freq_ghz, cores, ctx):
-    return K * (30.0 / (freq_ghz * cores)) * (ctx / DEFAULT_CTX)
-
-def surrogate_temp(base_temp, K, freq_ghz, cores, ctx):
-    penalty = 1 + 0.02 * (ctx / DEFAULT_CTX)
-    return base_temp + K * freq_ghz * cores * 0.05 * penalty
-
-# Enumerate & score configs
+MAX_TOKENS       = 128    # generation length; ctx only sizes the context window
+PREFIX_CACHE_MB  = 128    # KV states kept for shared contexts, per n_ctx instance
+RAM_BUDGET_MB    = 2048   # KV/compute memory across pooled n_ctx instances
+USE_CGROUP       = False  # also enforce cores with cgroup v2 cpuset.cpus/cpu.max (needs root)
+OBJECTIVE        = "weighted"  # or "energy": least joules per query (battery / PoE boards)
+LATENCY_SLO_S    = None   # energy mode: also keep each query under this many seconds
+DECODE_CONTROL   = False  # prompt at PROMPT_FREQ, decode at the selected freq, stepped down per token when hot
+PROMPT_FREQ      = 1500
+SPECULATIVE      = None   # "lookup" or a draft GGUF sharing the vocabulary; chosen per query from the
+                          # profile measured by speculative.py (never, until one has been)
+
+# Config search: learned surrogates (surrogate_fit.py) or the analytic ones,
+# 0.3*latency + 0.7*temp over the min-max normalized safe set (or least
+# energy under the SLO), memoized per (K, ambient) bucket
+SPACE = ConfigSpace(cores=[4,3,2,1],
+                    freqs=[1500,1400,1300,1200,1100,1000,900,800,700,600],
+                    ctxs=[DEFAULT_CTX,2048,1024],
+                    surrogate=load_surrogate(AnalyticSurrogate(use_ctx=True)),
+                    safe_temp=SAFE_TEMP_C, overshoot=MAX_RUNTIME_OVERSHOOT,
+                    baseline=(DEFAULT_CORES, DEFAULT_FREQ, DEFAULT_CTX))
+if SPECULATIVE:
+    SPACE = ModeSpace(SPACE, SpeculativeProfile.load())
+OBJ = EnergyObjective(SPACE, LATENCY_SLO_S) if OBJECTIVE == "energy" else WeightedObjective(0.3, 0.7)
+TABLE = DecisionTable(SPACE, OBJ, temp_bucket=0.5)
+
+# (cores, freq, n_ctx, est_latency, est_temp); shared with RAG/rag_qa.py. The
+# estimates are the table bucket's (upper K edge, hottest ambient), so they
+# bound the query's latency and temperature rather than predict them exactly
 def select_config(K, ambient):
-    base_L = surrogate_runtime(K, 1.5, DEFAULT_CORES, DEFAULT_CTX)
-    candidates = []
-    for c in [4,3,2,1]:
-      for f in [1500,1400,1300,1200,1100,1000,900,800,700,600]:
-        for ctx in [DEFAULT_CTX,2048,1024]:
-          L = surrogate_runtime(K, f/1000.0, c, ctx)
-          T = surrogate_temp(ambient, K, f/1000.0, c, ctx)
-          if T <= SAFE_TEMP_C and L <= base_L*(1+MAX_RUNTIME_OVERSHOOT):
-            candidates.append((c,f,ctx,L,T))
-    if not candidates:
-      return 2,1000,1024,base_L*10,ambient+5.0
-
-    Ls = np.array([x[3] for x in candidates])
-    Ts = np.array([x[4] for x in candidates])
-    Lmin, Lmax = Ls.min(),Ls.max()
-    Tmin, Tmax = Ts.min(),Ts.max()
-
-    best_score, best = float('inf'), None
-    for c,f,ctx,L,T in candidates:
-      nL = (L-Lmin)/(Lmax-Lmin) if Lmax>Lmin else 0
-      nT = (T-Tmin)/(Tmax-Tmin) if Tmax>Tmin else 0
-      score = 0.3*nL + 0.7*nT
-      if score < best_score:
-        best_score, best = score,(c,f,ctx,L,T)
-    return best
+    best = TABLE.lookup(K, ambient)
+    if best is None:
+      return 2,1000,1024,float(SPACE.baseline_latency(K))*10,ambient+5.0
+    return best[:5]
+
+# "speculative" where the measured profile says drafting pays for that pick
+def select_mode(K, ambient):
+    best = TABLE.lookup(K, ambient)
+    return best[5] if SPECULATIVE and best is not None else "plain"
 
 # Hardware helpers
 def get_cpu_temp():
@@ -66,9 +79,13 @@ def set_cpu_freq(mhz):
           try: open(f"{base}/{fn}","w").write(khz)
           except: pass
 
-def set_core_affinity(pid, cores):
-    mask = (1<<cores)-1
-    subprocess.run(["taskset","-p",hex(mask),str(pid)],stdout=subprocess.DEVNULL)
+CGROUP = CgroupCpu() if USE_CGROUP else None
+CONTROLLER = (DecodeController(CpuControl(), hot=SAFE_TEMP_C - 2, cool=SAFE_TEMP_C - 7)
+              if DECODE_CONTROL else None)
+
+def set_core_affinity(llm, cores):
+    # every thread pinned + llama n_threads matched, optionally via cgroup v2
+    return apply_cores(llm, cores, cgroup=CGROUP)
 
 # Main
 def main():
@@ -76,39 +93,90 @@ def main():
     out_dir = Path(f"exp_balanced_{ts}")
     out_dir.mkdir(exist_ok=True)
 
-    data = json.load(open(DATASET_PATH))
-    llm = Llama(model_path=MODEL_PATH)
-
-    for i,item in enumerate(data):
-        if i>=TEST_SAMPLES: break
+    data = json.load(open(DATASET_PATH))[:TEST_SAMPLES]
+    # one instance per selected n_ctx over the same mmapped weights
+    pool = ModelPool(MODEL_PATH, ctx_buckets=[1024,2048,DEFAULT_CTX], ram_budget_mb=RAM_BUDGET_MB)
+    # speculative instances keep logits for every position: their own pool, same budget;
+    # one drafter serves every bucket, so it gets the largest n_ctx
+    spec_pool = (ModelPool(MODEL_PATH, ctx_buckets=[1024,2048,DEFAULT_CTX], ram_budget_mb=RAM_BUDGET_MB,
+                           draft_model=make_drafter(SPECULATIVE, MODEL_PATH, n_ctx=DEFAULT_CTX))
+                 if SPECULATIVE else None)
+    peak_rss = {}
+
+    # token-accurate load for every query up front, from the GGUF's tokenizer
+    costs = CostEstimator(MODEL_PATH, MAX_TOKENS).estimate_dataset(data)
+    TABLE.precompute({c.K for c in costs}, [get_cpu_temp()])
+
+    # questions on the same context run back to back so the prefix stays hot
+    for i,item in group_by_context(data):
         ambient = get_cpu_temp()
-        K = (len((item["context"]+item["question"]).split())+128)//16
+        K = costs[i].K
         c,f,ctx,_,_ = select_config(K,ambient)
-
-        print(f"Q{i+1}: c={c}, f={f}MHz, ctx={ctx}")
-        set_cpu_freq(f)
-        # llm = Llama(model_path=MODEL_PATH, n_ctx=ctx)
-        pid = getattr(llm,"pid",os.getpid())
-        set_core_affinity(pid, c)
-
+        mode = select_mode(K,ambient)
+
+        print(f"Q{i+1}: c={c}, f={f}MHz, ctx={ctx}, {mode}")
+        if CONTROLLER:
+            # cores hotplugged before pinning; frequency is then the controller's, token by token
+            CONTROLLER.prompt, CONTROLLER.decode = (max(f, PROMPT_FREQ), c), (f, c)
+            CONTROLLER.control.apply(max(f, PROMPT_FREQ), c)
+        else:
+            set_cpu_freq(f)
+        model = (spec_pool if mode == "speculative" else pool).get(ctx)
+        llm = model.llm
+        if model.prefix_cache is None:
+          model.prefix_cache = PrefixStateCache(llm, PREFIX_CACHE_MB)
+        core_report = set_core_affinity(llm, c)
+
+        reset_peak_rss()
+        drafter = getattr(llm, "draft_model", None)
+        draft_mark = drafter.mark() if drafter else None
         t0 = time.time()
-        prompt = f"Context: {item['context']}\nQuestion: {item['question']}\nAnswer:"
+        prefix, prompt = split_prompt(item['context'], item['question'])
+        prefix_stats = model.prefix_cache.prepare(prefix, prompt)
         # out = llm(f"Context: {item['context']}\nQuestion: {item['question']}\nAnswer:")
-        out = llm(prompt=prompt,max_tokens=ctx)
+        if CONTROLLER:
+          timeline = TokenTimeline(str(out_dir/f"q{i+1}.tokens.f32"))
+          text = "".join(stream_tokens(llm, prompt, MAX_TOKENS, timeline, CONTROLLER))
+          timeline.close()
+          # chunks can carry several tokens (accepted drafts): count with the tokenizer
+          n_out = len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+        else:
+          out = llm(prompt=prompt,max_tokens=MAX_TOKENS)
+          text, n_out = out["choices"][0]["text"], out["usage"]["completion_tokens"]
         elapsed = time.time()-t0
         end_temp = get_cpu_temp()
+        rss = memory_status()
+        key = f"c{c}_f{f}_ctx{ctx}" + ("_spec" if mode == "speculative" else "")
+        peak_rss[key] = max(peak_rss.get(key, 0.0), rss.get("VmHWM", 0.0))
 
         res = {
           "question": item["question"],
-          "response": out["choices"][0]["text"].strip(),
+          "response": text.strip(),
           "ground_truth": item.get("answer", "N/A"),
           "elapsed_time": elapsed,
-          "config": {"cores":c,"freq_mhz":f,"n_ctx":ctx},
+          "config": {"cores":c,"freq_mhz":f,"n_ctx":ctx,"n_threads":core_report["n_threads"],"mode":mode},
+          "cores_applied": core_report["ok"],
           "temp_start": ambient,
-          "temp_end": end_temp
+          "temp_end": end_temp,
+          "cost_estimate": costs[i].as_dict(),
+          "prefix_hit_tokens": prefix_stats["prefix_hit_tokens"],
+          "prefix_eval_saved": prefix_stats["prefix_eval_saved"],
+          "peak_rss_mb": rss.get("VmHWM"),
+          "model_load_time": model.load_time,
+          # no sampler here: model power at the set freq/cores times the measured latency
+          "energy_est_j": float(load_power_model().power(f / 1000.0, c)) * elapsed
         }
+        if CONTROLLER:
+          res.update(timeline.summary())
+        if drafter:
+          res["speculative"] = drafter.report(draft_mark, {"completion_tokens": n_out, "elapsed_time": elapsed})
 
         json.dump(res, open(out_dir/f"q{i+1}_result.json","w"), indent=2)
 
+    for bucket, model in pool.models.items():
+      print(f"Prefix cache n_ctx={bucket}: {model.prefix_cache.stats()}")
+    print(f"Model pool: {pool.stats()}")
+    json.dump(peak_rss, open(out_dir/"peak_rss_by_config.json","w"), indent=2)
+
 if __name__=="__main__":
     main()
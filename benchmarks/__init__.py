@@ -0,0 +1,2 @@
+# Off-device benchmarks: fake Llama backend, fake sysfs and fixed datasets.
+# Entry point: python3 -m benchmarks.harness
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Compare the original select_config loops against config_space.py:
+# per-query vectorized search and the memoized decision table.
+import sys
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "python"))
+from config_space import (ConfigSpace, AnalyticSurrogate, WeightedObjective, FirstFeasible,
+                          DecisionTable, DEFAULT_CTX, SAFE_TEMP_C, MAX_RUNTIME_OVERSHOOT)
+
+# === Original implementations (run_score_algo.py / run_predict.py) ===
+def surrogate_runtime(K, freq_ghz, cores, ctx):
+    return K * (30.0 / (freq_ghz * cores)) * (ctx / DEFAULT_CTX)
+
+def surrogate_temp(base_temp, K, freq_ghz, cores, ctx):
+    penalty = 1 + 0.02 * (ctx / DEFAULT_CTX)
+    return base_temp + K * freq_ghz * cores * 0.05 * penalty
+
+def loop_select_scored(K, ambient):
+    base_L = surrogate_runtime(K, 1.5, 4, DEFAULT_CTX)
+    candidates = []
+    for c in [4,3,2,1]:
+      for f in [1500,1400,1300,1200,1100,1000,900,800,700,600]:
+        for ctx in [DEFAULT_CTX,2048,1024]:
+          L = surrogate_runtime(K, f/1000.0, c, ctx)
+          T = surrogate_temp(ambient, K, f/1000.0, c, ctx)
+          if T <= SAFE_TEMP_C and L <= base_L*(1+MAX_RUNTIME_OVERSHOOT):
+            candidates.append((c,f,ctx,L,T))
+    if not candidates:
+      return None
+    Ls = np.array([x[3] for x in candidates])
+    Ts = np.array([x[4] for x in candidates])
+    Lmin, Lmax = Ls.min(),Ls.max()
+    Tmin, Tmax = Ts.min(),Ts.max()
+    best_score, best = float('inf'), None
+    for c,f,ctx,L,T in candidates:
+      nL = (L-Lmin)/(Lmax-Lmin) if Lmax>Lmin else 0
+      nT = (T-Tmin)/(Tmax-Tmin) if Tmax>Tmin else 0
+      score = 0.3*nL + 0.7*nT
+      if score < best_score:
+        best_score, best = score,(c,f,ctx,L,T)
+    return best
+
+def loop_select_first(K, ambient):
+    base_L = K * (30.0 / (1.5 * 4))
+    for cores in [4, 3, 2, 1]:
+        for freq in [1500, 1400, 1300, 1200, 1100, 1000, 900, 800, 700, 600]:
+            f_ghz = freq / 1000
+            L = K * (30.0 / (f_ghz * cores))
+            T = ambient + K * (f_ghz * cores) * 0.05
+            if T <= SAFE_TEMP_C and L <= base_L * (1 + MAX_RUNTIME_OVERSHOOT):
+                return cores, freq, 4096, L, T
+    return None
+
+def timed(fn, queries):
+    t0 = time.perf_counter()
+    out = [fn(K, a) for K, a in queries]
+    return (time.perf_counter() - t0) / len(queries), out
+
+def timed_batch(space, objective, queries):
+    t0 = time.perf_counter()
+    K, ambient = np.array(queries).T
+    L, T, feasible = space.evaluate(K, ambient)
+    chosen = objective.choose(L, T, feasible)
+    out = [None if i < 0 else space.config(i, L[r], T[r]) for r, i in enumerate(chosen)]
+    return (time.perf_counter() - t0) / len(queries), out
+
+def same_config(a, b):
+    return (a is None and b is None) or (a is not None and b is not None and tuple(a[:3]) == tuple(b[:3]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark config selection.")
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # K = (words + 128) // 16 for SQuAD-sized prompts; Pi idle-to-warm ambient
+    queries = list(zip(rng.integers(8, 60, args.queries).tolist(),
+                       np.round(rng.uniform(38.0, 70.0, args.queries), 3).tolist()))
+
+    cases = [
+        ("scored", loop_select_scored, True, WeightedObjective(0.3, 0.7)),
+        ("first", loop_select_first, False, FirstFeasible()),
+    ]
+    print(f"{'selector':<8} {'method':<14} {'us/query':>10} {'speedup':>8} {'agree':>7}")
+    for name, loop_fn, use_ctx, objective in cases:
+        space = ConfigSpace(ctxs=[4096, 2048, 1024] if use_ctx else [4096],
+                            surrogate=AnalyticSurrogate(use_ctx=use_ctx))
+        exact = DecisionTable(space, objective, temp_bucket=None)
+        table = DecisionTable(space, objective, temp_bucket=0.5)
+        table.precompute(range(8, 60), np.arange(38.0, 70.5, 0.5))
+
+        loop_t, ref = timed(loop_fn, queries)
+        methods = [
+            ("loops", loop_t, ref),
+            ("vectorized", *timed(lambda K, a: space.select(K, a, objective), queries)),
+            ("batched", *timed_batch(space, objective, queries)),
+            ("table exact", *timed(exact.lookup, queries)),
+            ("table 0.5C", *timed(table.lookup, queries)),
+        ]
+        for method, t, out in methods:
+            agree = np.mean([same_config(a, b) for a, b in zip(ref, out)])
+            print(f"{name:<8} {method:<14} {t * 1e6:>10.1f} {loop_t / t:>7.1f}x {agree:>7.1%}")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# Recall@k vs. latency vs. RSS for RAG/vector_index.py on synthetic clustered
+# embeddings. Each configuration is loaded and queried in a fresh process so
+# its RSS is not hidden by pages the parent already touched.
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing as mp
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "RAG"))
+from vector_index import build_index, VectorIndex, INDEX_DIR
+
+# Anonymous (scratch, copies) and file-backed (mmapped index pages, which
+# the kernel can drop under pressure) resident memory, in MB
+def rss_mb():
+    out = {"RssAnon": 0.0, "RssFile": 0.0}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in out:
+                out[key] = int(value.split()[0]) / 1024.0
+    return np.array([out["RssAnon"], out["RssFile"]])
+
+def synthetic(n, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    X = centers[rng.integers(0, clusters, n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    Q = X[rng.choice(n, 200, replace=False)] + 0.3 * rng.normal(size=(200, dim)).astype(np.float32)
+    Q /= np.linalg.norm(Q, axis=1, keepdims=True)
+    return X, Q.astype(np.float32)
+
+def make_store(path, X):
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "embeddings.npy"), X)
+    with open(os.path.join(path, "chunks.jsonl"), "w") as f:
+        for i in range(len(X)):
+            f.write(json.dumps({"id": f"doc:{i // 20}:{i % 20}"}) + "\n")
+
+# Runs in a child process: load, search every query one at a time, measure
+def measure(store, queries_path, k, nprobe, result):
+    Q = np.load(queries_path)
+    before = rss_mb()
+    t0 = time.perf_counter()
+    index = VectorIndex(store)
+    load_ms = (time.perf_counter() - t0) * 1000
+    times, ids = [], []
+    for q in Q:
+        t = time.perf_counter()
+        i, _ = index.search(q, k, nprobe)
+        times.append(time.perf_counter() - t)
+        ids.append(i[0])
+    t = time.perf_counter()
+    index.search(Q, k, nprobe)
+    batch = (time.perf_counter() - t) / len(Q)
+    result.put({"load_ms": load_ms, "p50_ms": float(np.median(times)) * 1000,
+                "p95_ms": float(np.percentile(times, 95)) * 1000, "batch_ms": batch * 1000,
+                "rss_mb": (rss_mb() - before).tolist(), "ids": np.array(ids).tolist()})
+
+def run_case(store, queries_path, k, nprobe):
+    ctx = mp.get_context("spawn")
+    result = ctx.Queue()
+    p = ctx.Process(target=measure, args=(store, queries_path, k, nprobe, result))
+    p.start()
+    out = result.get()
+    p.join()
+    return out
+
+def recall(truth, found):
+    return np.mean([len(set(t) & set(f)) / len(t) for t, f in zip(truth, found)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the memory-mapped RAG vector index.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    X, Q = synthetic(args.rows, args.dim, args.clusters, args.seed)
+    S = Q @ X.T
+    truth = np.argsort(-S, axis=1)[:, :args.k]
+    del S
+
+    tmp = tempfile.mkdtemp(prefix="bench_vector_index_")
+    try:
+        queries_path = os.path.join(tmp, "queries.npy")
+        np.save(queries_path, Q)
+        base = os.path.join(tmp, "store")
+        make_store(base, X)
+        full_mb = X.nbytes / 2 ** 20
+        del X
+
+        cases = [("float32", 0, [None]), ("float16", 0, [None]), ("int8", 0, [None]),
+                 ("float16", args.nlist, [4, 8, 16, 32]), ("int8", args.nlist, [4, 8, 16, 32])]
+        print(f"{args.rows} x {args.dim} embeddings ({full_mb:.0f} MB as float32), {len(Q)} queries, k={args.k}")
+        print(f"{'dtype':<8} {'mode':<12} {'build s':>8} {'disk MB':>8} {'load ms':>8} "
+              f"{'p50 ms':>7} {'p95 ms':>7} {'batch ms':>9} {'anon MB':>8} {'file MB':>8} {f'recall@{args.k}':>9}")
+        for dtype, nlist, probes in cases:
+            store = os.path.join(tmp, f"{dtype}_{nlist}")
+            os.makedirs(store)
+            for name in ("embeddings.npy", "chunks.jsonl"):
+                os.symlink(os.path.join(base, name), os.path.join(store, name))
+            t0 = time.time()
+            build_index(store, dtype, nlist, args.seed)
+            build = time.time() - t0
+            disk = sum(f.stat().st_size for f in Path(store, INDEX_DIR).iterdir()) / 2 ** 20
+            for nprobe in probes:
+                r = run_case(store, queries_path, args.k, nprobe)
+                mode = "exact" if nprobe is None else f"ivf p{nprobe}"
+                print(f"{dtype:<8} {mode:<12} {build:>8.2f} {disk:>8.1f} {r['load_ms']:>8.2f} "
+                      f"{r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f} {r['batch_ms']:>9.3f} {r['rss_mb'][0]:>8.1f} {r['rss_mb'][1]:>8.1f} "
+                      f"{recall(truth, r['ids']):>9.3f}")
+    finally:
+        shutil.rmtree(tmp)
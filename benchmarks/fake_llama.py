@@ -0,0 +1,182 @@
+# Deterministic stand-in for llama_cpp.Llama. Token timing follows the
+# configured frequency (read from a FakeSysfs when given) and n_threads, so
+# selectors and controllers see the same trade-offs as on the board.
+# Simulated seconds accumulate in `simulated_time`; real sleeping is
+# `time_scale` times that (0 = don't sleep, for overhead benchmarks).
+#
+# Answers are mostly a span copied out of the prompt, like extractive SQuAD
+# answers, so drafting has something to find. `draft_model` is verified as
+# in llama-cpp-python: one batched eval per drafted run of tokens.
+import sys
+import time
+import types
+import zlib
+import numpy as np
+
+DECODE_S_PER_TOKEN = 0.40   # at 1 GHz on one core; 7B Q4_0 on a Pi 4 ballpark
+PROMPT_SPEEDUP = 8.0        # prompt eval is batched, this much faster per token
+CORE_EXPONENT = 0.8         # sub-linear scaling with threads (memory bound)
+STATE_BYTES_PER_TOKEN = 512 * 1024
+NOVEL_EVERY = 7             # every this many positions the answer leaves the prompt
+VERIFY_COST = 0.15          # extra cost per drafted token in a verification eval
+N_VOCAB = 32000
+EOS = 2
+
+
+class FakeState:
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self.llama_state_size = len(tokens) * STATE_BYTES_PER_TOKEN
+
+
+class FakeLlama:
+    def __init__(self, model_path=None, n_ctx=4096, n_threads=4, sysfs=None, time_scale=0.0,
+                 draft_model=None, n_vocab=N_VOCAB, scale=1.0, **kwargs):
+        self.model_path = model_path
+        self._n_ctx = n_ctx
+        self._n_vocab = n_vocab
+        self.draft_model = draft_model
+        self.scale = scale        # cost of a token relative to the 7B
+        self.n_threads = n_threads
+        self.n_threads_batch = n_threads
+        self.sysfs = sysfs
+        self.time_scale = time_scale
+        self.kwargs = kwargs
+        self.tokens = []          # evaluated tokens (the KV cache)
+        self.simulated_time = 0.0
+        self.calls = 0
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def n_vocab(self):
+        return self._n_vocab
+
+    def token_eos(self):
+        return EOS
+
+    # Same words always give the same ids; BOS is 1
+    def tokenize(self, text, add_bos=True, special=False):
+        ids = [zlib.crc32(w) % 31990 + 10 for w in text.split()]
+        return ([1] if add_bos else []) + ids
+
+    def detokenize(self, tokens):
+        return b" ".join(b"t%d" % t for t in tokens)
+
+    def _speed(self):
+        freq_ghz = self.sysfs.freq_mhz() / 1000.0 if self.sysfs else 1.5
+        return freq_ghz * max(self.n_threads, 1) ** CORE_EXPONENT / self.scale
+
+    def _spend(self, seconds, busy=True):
+        self.simulated_time += seconds
+        if self.sysfs is not None:
+            self.sysfs.advance(seconds, self.n_threads if busy else 0)
+        if self.time_scale:
+            time.sleep(seconds * self.time_scale)
+
+    def reset(self):
+        self.tokens = []
+
+    def eval(self, tokens):
+        self._spend(len(tokens) * DECODE_S_PER_TOKEN / PROMPT_SPEEDUP / self._speed())
+        self.tokens.extend(tokens)
+
+    def save_state(self):
+        return FakeState(self.tokens)
+
+    def load_state(self, state):
+        self.tokens = list(state.tokens)
+
+    def _prefill(self, prompt):
+        ids = self.tokenize(prompt.encode("utf-8") if isinstance(prompt, str) else prompt)
+        self._eval_prefix(ids)
+        return ids
+
+    # like llama-cpp-python: reuse the longest evaluated prefix
+    def _eval_prefix(self, ids):
+        hit = 0
+        for a, b in zip(self.tokens, ids):
+            if a != b:
+                break
+            hit += 1
+        self.tokens = self.tokens[:hit]
+        self.eval(ids[hit:])
+
+    # The answer: a span of the prompt from a point fixed by the prompt,
+    # with a token that is not in it every NOVEL_EVERY positions
+    @staticmethod
+    def _answer(ids, n):
+        k = zlib.crc32(b"%d" % len(ids)) % max(len(ids) - n, 1)
+        out = []
+        for i in range(n):
+            if (len(ids) + i) % NOVEL_EVERY == 0:
+                out.append(N_VOCAB - 10 + i % 10)
+            else:
+                out.append(ids[k])
+                k += 1
+        return out
+
+    # Decode n tokens after the prefilled ids, yielding what each eval
+    # produced: one token, or a verified run of drafted tokens plus the next
+    def _decode(self, ids, n):
+        answer = self._answer(ids, n)
+        done = 0
+        while done < n:
+            # the first token comes off the prompt eval, before any draft
+            draft = []
+            if self.draft_model is not None and done:
+                draft = [int(t) for t in self.draft_model(np.array(ids + answer[:done], dtype=np.intc))]
+            self._spend(DECODE_S_PER_TOKEN / self._speed() * (1 + VERIFY_COST * len(draft)))
+            k = 0
+            while k < len(draft) and done + k < n and draft[k] == answer[done + k]:
+                k += 1
+            run = answer[done:min(done + k + 1, n)]
+            done += len(run)
+            self.tokens.extend(run)
+            yield run
+
+    # llama-cpp-python's token generator, as the draft model side uses it.
+    # A small model's guess on extractive QA: whatever followed the last
+    # token's first occurrence
+    def generate(self, tokens, reset=True, **kwargs):
+        seq = [int(t) for t in tokens]
+        self._eval_prefix(seq)
+        while True:
+            self._spend(DECODE_S_PER_TOKEN / self._speed())
+            t = next((seq[i + 1] for i in range(len(seq) - 1) if seq[i] == seq[-1]), seq[0])
+            seq.append(t)
+            self.tokens.append(t)
+            yield t
+
+    def _completion(self, prompt, max_tokens):
+        self.calls += 1
+        ids = self._prefill(prompt)
+        # answer length depends only on the prompt: deterministic
+        n = min(max_tokens or 16, 8 + zlib.crc32(bytes(str(len(ids)), "ascii")) % 56)
+        return ids, n
+
+    def __call__(self, prompt, max_tokens=16, echo=False, stream=False, **kwargs):
+        ids, n = self._completion(prompt, max_tokens)
+        if stream:
+            return self._stream(ids, n)
+        out = [t for run in self._decode(ids, n) for t in run]
+        return {"choices": [{"text": " " + self.detokenize(out).decode(), "finish_reason": "length"}],
+                "usage": {"prompt_tokens": len(ids), "completion_tokens": n, "total_tokens": len(ids) + n}}
+
+    def _stream(self, ids, n):
+        i = 0
+        for run in self._decode(ids, n):
+            for t in run:
+                i += 1
+                yield {"choices": [{"text": " " + self.detokenize([t]).decode(),
+                                    "finish_reason": None if i < n else "length"}]}
+
+    create_completion = __call__
+
+
+# Make `from llama_cpp import Llama` resolve to FakeLlama for code under test
+def install():
+    module = types.ModuleType("llama_cpp")
+    module.Llama = FakeLlama
+    sys.modules["llama_cpp"] = module
+    return module
@@ -0,0 +1,80 @@
+# A throwaway /sys tree with the files telemetry.py, governor.py and the
+# cool-down code read and write, plus a first-order thermal model so the
+# temperature responds to load and frequency like a passively cooled Pi.
+import os
+import math
+import shutil
+import tempfile
+
+FREQS_KHZ = [600000, 700000, 800000, 900000, 1000000, 1100000, 1200000, 1300000, 1400000, 1500000]
+
+
+class FakeSysfs:
+    def __init__(self, root=None, n_cpus=4, temp=45.0, ambient=40.0, tau=150.0, heat_per_ghz_core=4.0):
+        self.root = root or tempfile.mkdtemp(prefix="fake_sysfs_")
+        self.owned = root is None
+        self.n_cpus = n_cpus
+        self.ambient = ambient
+        self.tau = tau
+        self.heat_per_ghz_core = heat_per_ghz_core   # steady-state °C rise at full load
+        self.cpu_dir = os.path.join(self.root, "sys/devices/system/cpu")
+        self.zone = os.path.join(self.root, "sys/class/thermal/thermal_zone0")
+        os.makedirs(self.zone, exist_ok=True)
+        for c in range(n_cpus):
+            freq_dir = os.path.join(self.cpu_dir, f"cpu{c}", "cpufreq")
+            os.makedirs(freq_dir, exist_ok=True)
+            for name in ("scaling_cur_freq", "scaling_max_freq", "cpuinfo_max_freq"):
+                self._write(os.path.join(freq_dir, name), FREQS_KHZ[-1])
+            self._write(os.path.join(freq_dir, "scaling_min_freq"), FREQS_KHZ[0])
+            self._write(os.path.join(freq_dir, "scaling_available_frequencies"), " ".join(map(str, FREQS_KHZ)))
+            if c > 0:
+                self._write(os.path.join(self.cpu_dir, f"cpu{c}", "online"), 1)
+        self.set_temp(temp)
+
+    @staticmethod
+    def _write(path, value):
+        with open(path, "w") as f:
+            f.write(f"{value}\n")
+
+    @staticmethod
+    def _read(path, default=None):
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            return default
+
+    @property
+    def temp(self):
+        return int(self._read(os.path.join(self.zone, "temp"))) / 1000.0
+
+    def set_temp(self, temp_c):
+        self._write(os.path.join(self.zone, "temp"), int(round(temp_c * 1000)))
+
+    # What the governor / selectors last asked for
+    def freq_mhz(self, cpu=0):
+        return int(self._read(os.path.join(self.cpu_dir, f"cpu{cpu}", "cpufreq/scaling_max_freq"))) // 1000
+
+    def online_cores(self):
+        return 1 + sum(self._read(os.path.join(self.cpu_dir, f"cpu{c}", "online"), "1") == "1"
+                       for c in range(1, self.n_cpus))
+
+    # Advance the thermal model by dt seconds with `busy_cores` running flat out
+    def advance(self, dt, busy_cores=0):
+        freq_ghz = self.freq_mhz() / 1000.0
+        target = self.ambient + self.heat_per_ghz_core * freq_ghz * busy_cores
+        temp = target + (self.temp - target) * math.exp(-dt / self.tau)
+        self.set_temp(temp)
+        for c in range(self.n_cpus):
+            self._write(os.path.join(self.cpu_dir, f"cpu{c}", "cpufreq/scaling_cur_freq"), self.freq_mhz() * 1000)
+        return temp
+
+    def cleanup(self):
+        if self.owned:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
@@ -0,0 +1,57 @@
+# Fixed datasets for the benchmarks: same seed, same data, on every machine.
+import os
+import json
+import numpy as np
+
+WORDS = ("thermal throttling frequency governor cores latency token context cache edge board power "
+         "energy model query answer sweep region safe baseline prefix decode prompt sensor").split()
+
+def _text(rng, n, words=WORDS):
+    return " ".join(rng.choice(words, n))
+
+# SQuAD-shaped items; several questions share each context, as in SQuAD
+# vocab=N draws from N distinct words instead, so n-grams repeat about as
+# rarely as in real text (what prompt-lookup drafting depends on)
+def squad_like(n=100, contexts=25, seed=0, vocab=None):
+    rng = np.random.default_rng(seed)
+    words = WORDS if vocab is None else [f"word{i}" for i in range(vocab)]
+    ctxs = [_text(rng, int(rng.integers(80, 300)), words) for _ in range(contexts)]
+    return [{"context": ctxs[i % contexts], "question": _text(rng, 8) + "?", "answer": _text(rng, 3)}
+            for i in range(n)]
+
+# results/sweep/{freq,core,ctx}/q<N>_<param><value>_<timestamp>/ with the
+# output.json + metrics.csv each run writes
+SWEEP_VALUES = {"freq": [1500, 1400, 1300, 1200, 1100, 1000, 900, 800, 700, 600],
+                "core": [4, 3, 2, 1], "ctx": [4096, 2048, 1024]}
+SWEEP_FIELDS = {"freq": "cpu_freq_set", "core": "cpu_cores_start", "ctx": "n_ctx"}
+
+def write_sweep(base_dir, queries=30, seed=0):
+    rng = np.random.default_rng(seed)
+    for param, values in SWEEP_VALUES.items():
+        for q in range(queries):
+            tokens = int(rng.integers(150, 900))
+            for v in values:
+                f, c, x = 1500, 4, 4096
+                f, c, x = (v, c, x) if param == "freq" else (f, v, x) if param == "core" else (f, c, v)
+                ambient = float(rng.uniform(40, 55))
+                latency = tokens * 0.05 / ((f / 1000) * c ** 0.8) * (1 + 0.05 * x / 4096)
+                peak = ambient + (f / 1000) ** 2 * c * 2.5 * (1 - np.exp(-latency / 60))
+                d = os.path.join(base_dir, param, f"q{q}_{param}{v}_20250101_000000")
+                os.makedirs(d, exist_ok=True)
+                with open(os.path.join(d, "output.json"), "w") as fh:
+                    json.dump({"elapsed_time": latency, "total_tokens": tokens, SWEEP_FIELDS[param]: v}, fh)
+                temps = np.linspace(ambient, peak, max(3, int(latency)))
+                with open(os.path.join(d, "metrics.csv"), "w") as fh:
+                    fh.write("cpu_temp_C\n" + "\n".join(f"{t:.2f}" for t in temps))
+    return base_dir
+
+# llama.cpp verbose lines the governor parses
+def governor_log(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = []
+    for i in range(n):
+        if i % 4 == 0:
+            lines.append(f"Llama.generate: {int(rng.integers(0, 400))} prefix-match hit, remaining 12 prompt tokens to eval")
+        else:
+            lines.append(f"llama_perf_context_print: eval ctx {int(rng.integers(100, 4000))} tokens")
+    return lines
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# Off-device benchmark harness: fake Llama, fake sysfs, fixed datasets.
+#
+#   python3 -m benchmarks.harness                    run, compare to baseline.json
+#   python3 -m benchmarks.harness --update_baseline  accept the current numbers
+#
+# A case skipped for a missing dependency fails the run unless --allow_skip.
+#
+# Every metric is "lower is better" and is stored divided by a calibration
+# workload timed next to it on the same machine, so one baseline works
+# across hosts. Anything slower than baseline * (1 + tolerance) fails the
+# run; --update_baseline widens a metric's tolerance to the spread of its
+# repeats, up to MAX_TOLERANCE.
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src" / "python"))
+sys.path.insert(0, str(ROOT))
+from benchmarks import fake_llama, fixtures
+from benchmarks.fake_sysfs import FakeSysfs
+
+BASELINE = Path(__file__).with_name("baseline.json")
+TOLERANCE = 0.5   # generous: shared CI hosts are noisy, real regressions are not 1.5x subtle
+REPEATS = 5
+CALIBRATION_REPEATS = 3   # per case repeat
+MAX_TOLERANCE = 1.0       # a metric whose repeats scatter more than this still fails at 2x
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None   # tmpfs; None: the default temp dir
+
+CASES = {}
+
+def case(name, tolerance=TOLERANCE):
+    def register(fn):
+        CASES[name] = (fn, tolerance)
+        return fn
+    return register
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def per_call(fn, n):
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - t0) / n
+
+# Fixed mix of Python dict/loop work and a NumPy matmul, the two things the
+# code under test spends its time on. Median, and re-timed next to every
+# repeat of every case: a host's speed drifts over a run by more than any
+# single calibration can account for.
+def calibrate(repeats=CALIBRATION_REPEATS):
+    def work():
+        d = {}
+        for i in range(200000):
+            d[i % 1000] = d.get(i % 1000, 0) + i
+        a = np.arange(250000, dtype=np.float64).reshape(500, 500)
+        (a @ a).sum()
+    return float(np.median([per_call(lambda _: work(), 1) for _ in range(repeats)]))
+
+# === Cases: each returns {metric: seconds} ===
+
+@case("inference")
+def bench_inference():
+    fake_llama.install()
+    from model_mt import run_inference
+    llm = fake_llama.FakeLlama()
+    items = fixtures.squad_like(50)
+    # the timeline flushes every token: on tmpfs this times the code, not the disk
+    tmp = tempfile.mkdtemp(dir=SCRATCH_DIR)
+    try:
+        with quiet():
+            plain = per_call(lambda i: run_inference(llm, items[i]["question"], items[i]["context"], 32), len(items))
+            stream = per_call(lambda i: run_inference(llm, items[i]["question"], items[i]["context"], 32,
+                                                      stream=True, timeline_path=os.path.join(tmp, f"{i}.f32")),
+                              len(items))
+    finally:
+        shutil.rmtree(tmp)
+    return {"run_inference_overhead": plain, "run_inference_stream_overhead": stream}
+
+@case("selectors")
+def bench_selectors():
+    from config_space import ConfigSpace, AnalyticSurrogate, WeightedObjective, FirstFeasible, DecisionTable
+    rng = np.random.default_rng(0)
+    K = rng.integers(8, 60, 2000)
+    ambient = np.round(rng.uniform(38, 70, 2000), 2)
+    space = ConfigSpace(surrogate=AnalyticSurrogate(use_ctx=True))
+    objective = WeightedObjective(0.3, 0.7)
+    table = DecisionTable(space, objective).precompute(range(8, 60), np.arange(38.0, 70.5, 0.5))
+    t0 = time.perf_counter()
+    L, T, feasible = space.evaluate(K, ambient)
+    objective.choose(L, T, feasible)
+    batched = (time.perf_counter() - t0) / len(K)
+    # a cached pick must be feasible at the raw (K, ambient) it is served for, not just its bucket's
+    raw_K = rng.integers(16, 960, 2000) / 16
+    raw_ambient = rng.uniform(60, 77, 2000)
+    first = DecisionTable(ConfigSpace(ctxs=[4096], surrogate=space.surrogate), FirstFeasible(), temp_bucket=0.5)
+    picks = [first.lookup(k, a) for k, a in zip(raw_K, raw_ambient)]
+    index = {(c, f, x): i for i, (c, f, x) in enumerate(zip(first.space.cores, first.space.freqs, first.space.ctxs))}
+    _, _, ok = first.space.evaluate(raw_K, raw_ambient)
+    unsafe = [(k, a, p) for r, (k, a, p) in enumerate(zip(raw_K, raw_ambient, picks))
+              if p is not None and not ok[r, index[p[:3]]]]
+    assert not unsafe, f"{len(unsafe)} cached picks infeasible at their raw point, e.g. {unsafe[0]}"
+    return {"select_vectorized": per_call(lambda i: space.select(K[i], ambient[i], objective), 300),
+            "select_batched": batched,
+            "select_table_lookup": per_call(lambda i: table.lookup(K[i], ambient[i]), len(K))}
+
+@case("governor")
+def bench_governor():
+    from governor import Governor, CpuControl, ThresholdPolicy, Hysteresis
+    lines = fixtures.governor_log(2000)
+    with FakeSysfs() as sysfs:
+        control = CpuControl(root=sysfs.root)
+        gov = Governor(ThresholdPolicy(), control, root=sysfs.root, hysteresis=Hysteresis(confirm=2, min_dwell=0))
+        temps = 60 + 20 * np.sin(np.arange(len(lines)) / 50.0)
+        def step(i):
+            sysfs.set_temp(temps[i])
+            gov.step(lines[i], now=float(i))
+        with quiet():
+            t = per_call(step, len(lines))
+        gov.reader.close()
+    return {"governor_step": t}
+
+@case("decode_control")
+def bench_decode_control():
+    fake_llama.install()
+    from model_mt import run_inference
+    from governor import DecodeController, CpuControl
+    from token_timeline import TokenTimeline
+    items = fixtures.squad_like(10)
+    # hot enough that decode at 1.2 GHz on 4 cores crosses the 75 °C step-down
+    with FakeSysfs(temp=70.0, tau=20.0, heat_per_ghz_core=8.0) as sysfs:
+        llm = fake_llama.FakeLlama(sysfs=sysfs)
+        controller = DecodeController(CpuControl(root=sysfs.root), prompt=(1500, 4), decode=(1200, 4),
+                                      root=sysfs.root, every=4, dwell=8)
+        with quiet():
+            results = [run_inference(llm, item["question"], item["context"], 256, controller=controller)
+                       for item in items]
+        # the fake backend ran each phase at its frequency, logged where it changed
+        for r in results:
+            first, second = r["control_events"][:2]
+            assert (first["token"], first["phase"], first["freq_mhz"]) == (0, "prompt", 1500), first
+            assert (second["token"], second["phase"], second["freq_mhz"]) == (1, "decode", 1200), second
+        assert any(phase == "thermal" for phase, *_ in controller.changes), "decode never stepped down"
+        # cost added to every token, without the fake thermal model's file writes
+        timeline = TokenTimeline()
+        controller.begin(llm, timeline)
+        def step(_):
+            timeline.mark()
+            controller.step(llm, timeline)
+        t = per_call(step, 5000)
+        controller.close()
+    return {"decode_control_step": t}
+
+@case("edge_serving")
+def bench_edge_serving():
+    fake_llama.install()
+    import asyncio
+    from edge_server import EdgeServer, Request
+    items = fixtures.squad_like(8)
+    server = EdgeServer(fake_llama.FakeLlama(), batch_window=0, max_queue=256)
+    # one burst of concurrent users over 8 contexts, without the HTTP layer
+    async def burst(n):
+        server.loop = asyncio.get_running_loop()
+        worker = asyncio.create_task(server.run())
+        requests = [Request(items[i % 8]["question"], items[i % 8]["context"], 16) for i in range(n)]
+        replies = await asyncio.gather(*(server.submit(r) for r in requests))
+        worker.cancel()
+        return replies
+    with quiet():
+        t0 = time.perf_counter()
+        replies = asyncio.run(burst(200))
+        t = (time.perf_counter() - t0) / len(replies)
+    server.executor.shutdown()
+    assert all(code == 200 for code, _ in replies), [p for code, p in replies if code != 200][:3]
+    assert max(server.stats.batch_sizes) > 1, "requests sharing a context were not batched"
+    assert server.stats.counts["completed"] == len(replies), server.stats.counts
+    return {"edge_serving_request": t,
+            "edge_serving_stats": per_call(lambda _: server.stats.snapshot(), 200)}
+
+@case("speculative")
+def bench_speculative():
+    fake_llama.install()
+    from model_mt import run_inference
+    from speculative import CountingDraft, PromptLookupDraft
+    # answers copy spans of the context; a wide vocabulary so n-grams are as rare as in real text
+    items = fixtures.squad_like(10, vocab=5000)
+    plain, spec = fake_llama.FakeLlama(), fake_llama.FakeLlama(draft_model=CountingDraft(PromptLookupDraft(), "lookup"))
+    with quiet():
+        runs = [[run_inference(llm, item["question"], item["context"], 64, stream=True) for item in items]
+                for llm in (plain, spec)]
+    assert [r["response"] for r in runs[0]] == [r["response"] for r in runs[1]], "speculative output differs"
+    assert all(r["speculative"]["accepted"] > 0 for r in runs[1]), [r["speculative"] for r in runs[1]]
+    assert spec.simulated_time < plain.simulated_time, (spec.simulated_time, plain.simulated_time)
+    drafter = PromptLookupDraft()
+    ids = np.asarray(spec.tokenize((items[0]["context"] + " " + items[0]["question"]).encode()) + [0] * 64)
+    return {"speculative_draft": per_call(lambda i: drafter(ids[:len(ids) - 64 + i]), 64)}
+
+@case("response_cache")
+def bench_response_cache():
+    fake_llama.install()
+    from model_mt import run_inference
+    from response_cache import ResponseCache
+    items = fixtures.squad_like(60)
+    llm = fake_llama.FakeLlama()
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "responses.db")
+        cache = ResponseCache(path, "fake.gguf", max_entries=50)
+        with quiet():
+            for item in items:
+                cache.put(item["question"], item["context"], 32,
+                          run_inference(llm, item["question"], item["context"], 32))
+        cache.close()
+        # reopened, as after a restart; the oldest 10 went past max_entries
+        cache = ResponseCache(path, "fake.gguf", max_entries=50)
+        kept = items[10:]
+        near = ["so " + item["question"].upper().rstrip("?") for item in kept]
+        exact = per_call(lambda i: cache.get("  " + kept[i]["question"], kept[i]["context"], 32), len(kept))
+        semantic = per_call(lambda i: cache.get(near[i], kept[i]["context"], 32), len(kept))
+        miss = per_call(lambda i: cache.get(items[i]["question"], items[i]["context"], 32), 10)
+        stats = cache.stats()
+        cache.close()
+    finally:
+        shutil.rmtree(tmp)
+    assert stats["entries"] == 50 and stats["misses"] == 10, stats
+    assert stats["exact_hits"] == len(kept) and stats["semantic_hits"] > len(kept) // 2, stats
+    assert stats["saved_s"] > 0, stats
+    return {"response_cache_exact": exact, "response_cache_semantic": semantic, "response_cache_miss": miss}
+
+@case("telemetry")
+def bench_telemetry():
+    from telemetry import SysfsReader, discover_sensors
+    with FakeSysfs() as sysfs:
+        reader = SysfsReader(discover_sensors(sysfs.root))
+        out = np.zeros(len(reader.names))
+        t = per_call(lambda _: reader.read_into(out), 5000)
+        reader.close()
+    return {"telemetry_read": t}
+
+@case("loaders")
+def bench_loaders():
+    from sweep_loader import load_sweep, CACHE_NAME
+    tmp = tempfile.mkdtemp()
+    try:
+        fixtures.write_sweep(tmp, queries=30)
+        with quiet():
+            t0 = time.perf_counter()
+            for param in fixtures.SWEEP_VALUES:
+                load_sweep(tmp, param, workers=1, use_cache=False)
+            cold = time.perf_counter() - t0
+            for param in fixtures.SWEEP_VALUES:
+                load_sweep(tmp, param, workers=1)     # writes the caches
+            t0 = time.perf_counter()
+            for param in fixtures.SWEEP_VALUES:
+                load_sweep(tmp, param, workers=1)
+            warm = time.perf_counter() - t0
+        cached = all(os.path.exists(os.path.join(tmp, p, CACHE_NAME)) for p in fixtures.SWEEP_VALUES)
+    finally:
+        shutil.rmtree(tmp)
+    out = {"sweep_load_cold": cold}
+    if cached:   # needs pyarrow; without it the warm path is just the cold one
+        out["sweep_load_warm"] = warm
+    return out
+
+@case("cost_estimator")
+def bench_cost_estimator():
+    fake_llama.install()
+    import cost_estimator
+    cost_estimator.load_tokenizer.cache_clear()
+    items = fixtures.squad_like(100)
+    def run(_):
+        cost_estimator.CostEstimator("fake.gguf").estimate_dataset(items)
+    with quiet():
+        return {"cost_dataset_100": per_call(run, 5)}
+
+# === Runner ===
+
+def run_cases(names, repeats):
+    results, skipped, calibrations = {}, {}, []
+    for name in names:
+        fn, _ = CASES[name]
+        runs = []
+        try:
+            for _ in range(repeats):
+                calibrations.append(calibrate())
+                runs.append((fn(), calibrations[-1]))
+        except ImportError as e:
+            skipped[name] = f"missing dependency: {e.name or e}"
+            continue
+        for metric in runs[0][0]:
+            norm = [r[metric] / cal for r, cal in runs]
+            results[metric] = {"case": name, "seconds": float(np.median([r[metric] for r, _ in runs])),
+                               "normalized": float(np.median(norm)),
+                               "spread": float((max(norm) - min(norm)) / np.median(norm))}
+    return results, skipped, float(np.median(calibrations)) if calibrations else None
+
+# Per-metric tolerance: the case's, widened for metrics whose repeats scatter
+# (microsecond syscalls scale with the host differently from the calibration)
+def tolerance(metric, r, baseline):
+    return baseline.get("tolerances", {}).get(metric, CASES[r["case"]][1])
+
+def compare(results, baseline):
+    failures = []
+    print(f"{'metric':<32} {'time':>12} {'normalized':>11} {'baseline':>10} {'change':>8}")
+    for metric, r in sorted(results.items()):
+        norm = r["normalized"]
+        base = baseline.get("metrics", {}).get(metric)
+        tol = tolerance(metric, r, baseline)
+        if base is None:
+            print(f"{metric:<32} {r['seconds'] * 1e6:>10.1f}us {norm:>11.5f} {'-':>10} {'new':>8}")
+            continue
+        change = norm / base - 1
+        flag = "  << REGRESSION" if change > tol else ""
+        if flag:
+            failures.append((metric, change, tol))
+        print(f"{metric:<32} {r['seconds'] * 1e6:>10.1f}us {norm:>11.5f} {base:>10.5f} {change:>+7.0%}{flag}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark controllers, selectors and loaders off-device.")
+    parser.add_argument("--cases", nargs="*", choices=sorted(CASES), help="Default: all.")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--out", help="Write the full results JSON here.")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--update_baseline", action="store_true")
+    parser.add_argument("--allow_skip", "--allow-skip", action="store_true",
+                        help="Pass even when a case is skipped for a missing dependency.")
+    args = parser.parse_args()
+
+    results, skipped, calibration = run_cases(args.cases or list(CASES), args.repeats)
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+    print(f"Calibration workload: {calibration * 1000:.1f} ms (median)")
+    failures = compare(results, baseline)
+    for name, why in skipped.items():
+        print(f"SKIPPED {name}: {why}")
+
+    report = {"calibration_s": calibration, "metrics": results, "skipped": skipped}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        metrics = dict(baseline.get("metrics", {}))
+        metrics.update({m: r["normalized"] for m, r in results.items()})
+        tolerances = dict(baseline.get("tolerances", {}))
+        tolerances.update({m: round(min(max(CASES[r["case"]][1], r["spread"]), MAX_TOLERANCE), 2)
+                           for m, r in results.items()})
+        with open(args.baseline, "w") as f:
+            json.dump({"metrics": metrics, "tolerances": tolerances, "tolerance": TOLERANCE}, f,
+                      indent=2, sort_keys=True)
+        print(f"Baseline updated: {args.baseline}")
+    elif failures:
+        print("\n" + "!" * 72)
+        for metric, change, tol in failures:
+            print(f"!! {metric} is {change:+.0%} slower than baseline (tolerance {tol:.0%})")
+        print("!" * 72)
+        sys.exit(1)
+    if skipped and not args.allow_skip:
+        print(f"\n{len(skipped)} case(s) skipped; install their dependencies or pass --allow_skip")
+        sys.exit(1)
@@ -4,30 +4,32 @@ SAFE_TEMP=55
 MAX_TOKENS_LIST=(70 85 104 115 128 142 157 174 214 237 263 292 324 360 400 441 490 544 604 671 746 828 921 1024 1758 1758 2172 2417 2686 2985 3317 3686 4096)
 # 70 85 104 115 128 142 157 174 214 921 4096 3686 3317 2985 2686 2417
 OUTPUT_DIR="/home/rise/models/scripts/python/gguf/results/32_3b/max_token_variation_30"
-PYTHON_SCRIPT="/home/rise/models/scripts/python/gguf/scripts/model/model_mt.py"
-METRICS_SCRIPT="/home/rise/models/scripts/python/gguf/scripts/metrics/metrics_latency.sh"
+MODEL_PATH="/home/rise/Downloads/llama-2-7b-chat.Q4_0.gguf"
+SERVER_SCRIPT="/home/rise/models/scripts/python/gguf/scripts/model/model_server.py"
+CLIENT_SCRIPT="/home/rise/models/scripts/python/gguf/scripts/model/model_client.py"
+PORT=8765
+COOLDOWN_SCRIPT="/home/rise/models/scripts/python/gguf/scripts/model/cooldown_scheduler.py"
+TELEMETRY_HZ=20
 
 mkdir -p $OUTPUT_DIR
 
 cleanup() {
     echo " Killing running scripts..."
-    kill $METRICS_PID 2>/dev/null
-    kill $PYTHON_PID 2>/dev/null
+    kill $SERVER_PID 2>/dev/null
     echo " Cleanup complete."
 }
 trap cleanup EXIT
 
+# Waits as long as the fitted thermal decay model predicts, not 30 s steps
 cool_down() {
-    current_temp=$(vcgencmd measure_temp | egrep -o '[0-9]*\.[0-9]*')
-    echo " CPU Temp: ${current_temp}°C"
-    while (( $(echo "$current_temp > $SAFE_TEMP" | bc -l) )); do
-        echo "Cooling CPU. Waiting for temp to drop below $SAFE_TEMP°C..."
-        sleep 30
-        current_temp=$(vcgencmd measure_temp | egrep -o '[0-9]*\.[0-9]*')
-    done
-    echo "CPU cooled to $current_temp°C."
+    python3 $COOLDOWN_SCRIPT wait --safe_temp $SAFE_TEMP
 }
 
+# Load the model once; every run below is a request against this server
+python3 $SERVER_SCRIPT --model "$MODEL_PATH" --port $PORT --telemetry_hz $TELEMETRY_HZ > "$OUTPUT_DIR/server.log" 2>&1 &
+SERVER_PID=$!
+python3 $CLIENT_SCRIPT --port $PORT --wait 600
+
 for mt in "${MAX_TOKENS_LIST[@]}"; do
     echo "Starting experiment for max_tokens=${mt}"
     cool_down
@@ -36,14 +38,15 @@ for mt in "${MAX_TOKENS_LIST[@]}"; do
     METRICS_FILE="$OUTPUT_DIR/metrics_${mt}_max_tokens_$timestamp.csv"
     OUTPUT_FILE="$OUTPUT_DIR/llama2_output_${mt}_max_tokens_$timestamp.json"
 
-    bash $METRICS_SCRIPT > "$METRICS_FILE" 2>&1 &
-    METRICS_PID=$!
-    python3 $PYTHON_SCRIPT --max_tokens $mt > "$OUTPUT_FILE" 2>&1 &
-    PYTHON_PID=$!
-    wait $PYTHON_PID
-    kill $METRICS_PID
+    # telemetry is sampled inside the server and written next to the result
+    python3 $CLIENT_SCRIPT --port $PORT --max_tokens $mt --dataset squad --index 0 --stream \
+        --metrics_out "$METRICS_FILE" --outfile "$OUTPUT_FILE"
 
     echo " Run complete for max_tokens=${mt}. Results saved."
 done
 
+# Cold-load vs per-request timing for the whole sweep
+python3 $CLIENT_SCRIPT --port $PORT --shutdown > "$OUTPUT_DIR/server_stats.json"
+cat "$OUTPUT_DIR/server_stats.json"
+
 echo "All max_tokens variation experiments completed successfully!"
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# Adaptive planner for the freq/core/ctx sweeps: the same min_val / max_val
+# as plot_column_safe_regions.analyze() on an exhaustive sweep, from a few
+# runs per (query, param) instead of the whole grid times repeats.
+#
+# Along one knob latency falls and temperature rises monotonically (either
+# direction, found from the two ends of the grid), so each "ok" set is a run
+# of grid values anchored at one end:
+#   min_val = smallest value with avg_temp <= SAFE_TEMP_C
+#   max_val = largest value with latency <= (1 + overshoot) * baseline latency
+# Each is either a grid end or the crossing, found by bisection. A point is
+# classified only once its confidence interval clears the threshold; until
+# then the planner asks for another repeat there (up to MAX_REPEATS).
+#
+#   python3 adaptive_sweep.py next   --base results/sweep --queries 30 > round.json
+#   python3 adaptive_sweep.py run    --base results/sweep --queries 30 --hosts pi1 pi2
+#   python3 adaptive_sweep.py replay --base results/sweep_exhaustive
+import os
+import sys
+import json
+import math
+import argparse
+import numpy as np
+import pandas as pd
+from config_space import SAFE_TEMP_C, MAX_RUNTIME_OVERSHOOT, FREQ_LIST, CORES_LIST, CTX_LIST
+from sweep_loader import load_sweep
+
+# === Configuration ===
+GRIDS = {"freq": sorted(FREQ_LIST), "core": sorted(CORES_LIST), "ctx": sorted(CTX_LIST)}
+BASELINES = {"freq": 1500, "ctx": 4096, "core": 4}
+Z = 1.96                # two-sided 95 %
+PRIOR_SD = {"latency": 0.03, "avg_temp": 0.5}   # run-to-run noise: relative for latency, °C for temperature
+MIN_SAMPLE_SD = 3       # below this many repeats the prior noise is used
+MAX_REPEATS = 5         # past this a point is classified by its mean
+T95 = {2: 4.30, 3: 3.18, 4: 2.78, 5: 2.57, 6: 2.45, 7: 2.36, 8: 2.31, 9: 2.26}   # by degrees of freedom
+
+# Mean and CI half-width of one point's repeats
+def interval(samples, metric):
+    x = np.asarray(samples, dtype=float)
+    mean = x.mean()
+    prior = PRIOR_SD[metric] * (abs(mean) if metric == "latency" else 1.0)
+    if len(x) < MIN_SAMPLE_SD:
+        return mean, Z * prior / math.sqrt(len(x))
+    sd = max(x.std(ddof=1), prior / 2)   # a few identical repeats don't make a zero-width interval
+    return mean, T95.get(len(x) - 1, Z) * sd / math.sqrt(len(x))
+
+
+class PairPlan:
+    """Planner state for one (param, query), rebuilt from the observations
+    every round so it survives restarts and runs coming back out of order."""
+
+    def __init__(self, param, obs, safe_temp=SAFE_TEMP_C, overshoot=MAX_RUNTIME_OVERSHOOT,
+                 grid=None, max_repeats=MAX_REPEATS, available=None):
+        self.param = param
+        self.grid = grid or GRIDS[param]
+        self.baseline = BASELINES[param]
+        self.obs = obs                      # value -> {"latency": [...], "avg_temp": [...]}
+        self.safe_temp = safe_temp
+        self.overshoot = overshoot
+        self.max_repeats = max_repeats
+        self.available = available or {}    # value -> runs that can ever exist (replay)
+        self.wanted = set()                 # values that need another run
+
+    def n(self, value):
+        return len(self.obs.get(value, {}).get("latency", []))
+
+    def can_repeat(self, value):
+        return self.n(value) < min(self.max_repeats, self.available.get(value, self.max_repeats))
+
+    # True / False, or None after asking for another run at value (or at the baseline)
+    def decide(self, value, metric):
+        if self.n(value) == 0:
+            self.wanted.add(value)
+            return None
+        mean, hw = interval(self.obs[value][metric], metric)
+        if metric == "avg_temp":
+            threshold, thr_hw = self.safe_temp, 0.0
+        else:
+            if self.n(self.baseline) == 0:
+                self.wanted.add(self.baseline)
+                return None
+            b_mean, b_hw = interval(self.obs[self.baseline]["latency"], "latency")
+            threshold, thr_hw = (1 + self.overshoot) * b_mean, (1 + self.overshoot) * b_hw
+            if value == self.baseline:
+                return True   # within overshoot of itself by definition
+        if abs(mean - threshold) > math.hypot(hw, thr_hw):
+            return mean <= threshold
+        # undecided: spend the next run where the uncertainty is
+        if thr_hw > hw and self.can_repeat(self.baseline):
+            self.wanted.add(self.baseline)
+            return None
+        if self.can_repeat(value):
+            self.wanted.add(value)
+            return None
+        return mean <= threshold
+
+    # Smallest ("min") or largest ("max") grid value whose metric is ok
+    def extreme(self, metric, end):
+        lo, hi = self.decide(self.grid[0], metric), self.decide(self.grid[-1], metric)
+        if lo is None or hi is None:
+            return None
+        if not lo and not hi:
+            return math.nan
+        if lo and hi:
+            return self.grid[0] if end == "min" else self.grid[-1]
+        if (end == "min") == lo:
+            return self.grid[0] if lo else self.grid[-1]
+        # bisect for the crossing: i on the failing side, j on the ok side
+        i, j = (0, len(self.grid) - 1) if hi else (len(self.grid) - 1, 0)
+        while abs(j - i) > 1:
+            m = (i + j) // 2
+            ok = self.decide(self.grid[m], metric)
+            if ok is None:
+                return None
+            i, j = (i, m) if ok else (m, j)
+        return self.grid[j]
+
+    def plan(self):
+        self.wanted = set()
+        min_val = self.extreme("avg_temp", "min")
+        max_val = self.extreme("latency", "max")
+        return {"param": self.param, "min_val": min_val, "max_val": max_val,
+                "done": min_val is not None and max_val is not None,
+                "runs": sum(self.n(v) for v in self.obs), "next": sorted(self.wanted)}
+
+def observations(points):
+    obs = {}
+    for (param, query, value), g in points.groupby(["param", "query", "param_value"]):
+        obs.setdefault((param, query), {})[value] = {"latency": g["latency"].tolist(),
+                                                     "avg_temp": g["avg_temp"].tolist()}
+    return obs
+
+def load_points(base_dir, params):
+    frames = []
+    for param in params:
+        if os.path.isdir(os.path.join(base_dir, param)):
+            df = load_sweep(base_dir, param, dedup=False)   # every repeat counts
+            frames.append(df[["query", "param_value", "latency", "avg_temp"]].assign(param=param))
+    points = pd.concat(frames, ignore_index=True) if frames else \
+        pd.DataFrame(columns=["query", "param_value", "latency", "avg_temp", "param"])
+    return points.dropna(subset=["latency", "avg_temp"])
+
+# One planning round over every (param, query): summary rows and the next
+# points. With `available` (replay) the grid is the values actually recorded.
+def plan_round(points, params, queries, available=None, **kw):
+    obs = observations(points)
+    rows, nxt = [], []
+    for param in params:
+        for q in queries:
+            avail = (available or {}).get((param, q))
+            p = PairPlan(param, obs.get((param, q), {}), grid=sorted(avail) if avail else None,
+                         available=avail, **kw)
+            r = p.plan()
+            rows.append({"query": q, **r})
+            nxt += [{"param": param, "value": v, "query": q, "repeat": p.n(v)} for v in r["next"]]
+    return pd.DataFrame(rows), nxt
+
+# === Replay against an exhaustive sweep ===
+# The recorded repeats stand in for new runs: the k-th request for a point
+# gets its k-th recorded repeat, and no point is repeated more often than it
+# was recorded. Only the recorded values are planned over, and the reference
+# is analyze() on the per-point mean over repeats (sweep_loader.latest_runs),
+# not on whichever repeat happened to be written last.
+
+def replay(base_dir, params, **kw):
+    from plot_column_safe_regions import analyze, collect_query_data
+    recorded = load_points(base_dir, params)
+    taken = {}
+    points = recorded.iloc[0:0]
+    rounds = 0
+    queries = sorted(recorded["query"].unique())
+    available = {}
+    for (param, query, value), n in recorded.groupby(["param", "query", "param_value"]).size().items():
+        available.setdefault((param, query), {})[value] = n
+    while True:
+        summary, nxt = plan_round(points, params, queries, available, **kw)
+        if not nxt:
+            break
+        rounds += 1
+        new = []
+        for p in nxt:
+            key = (p["param"], p["query"], p["value"])
+            rec = recorded[(recorded["param"] == p["param"]) & (recorded["query"] == p["query"])
+                           & (recorded["param_value"] == p["value"])]
+            if rec.empty:
+                raise SystemExit(f"exhaustive sweep has no run for {key}")
+            k = taken.get(key, 0)
+            taken[key] = k + 1
+            new.append(rec.iloc[[k]])
+        points = pd.concat([points] + new, ignore_index=True)
+
+    _, exhaustive = analyze({param: collect_query_data(base_dir, param) for param in params},
+                            kw.get("safe_temp", SAFE_TEMP_C), kw.get("overshoot", MAX_RUNTIME_OVERSHOOT))
+    merged = summary.merge(exhaustive[["param", "query", "min_val", "max_val", "points"]],
+                           on=["param", "query"], suffixes=("", "_exhaustive"))
+    same = lambda a, b: (merged[a] == merged[b]) | (merged[a].isna() & merged[b].isna())
+    merged["agree"] = same("min_val", "min_val_exhaustive") & same("max_val", "max_val_exhaustive")
+    full_runs = recorded.groupby(["param", "query"]).size().rename("runs_exhaustive").reset_index()
+    merged = merged.merge(full_runs, on=["param", "query"])
+    return merged, rounds
+
+def write_summary(summary, path):
+    summary.drop(columns=["next"]).to_csv(path, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Adaptive safe-region boundary search over sweep results.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--base", required=True, help="Sweep root, <base>/<param>/q*_*/")
+    common.add_argument("--params", nargs="*", default=list(GRIDS), choices=list(GRIDS))
+    common.add_argument("--safe_temp", type=float, default=SAFE_TEMP_C)
+    common.add_argument("--overshoot", type=float, default=MAX_RUNTIME_OVERSHOOT)
+    common.add_argument("--max_repeats", type=int, default=MAX_REPEATS)
+
+    nxt = sub.add_parser("next", parents=[common], help="Print the next round as a sweep_orchestrator spec.")
+    nxt.add_argument("--queries", type=int, required=True)
+    nxt.add_argument("--spec", help="Base spec (dataset, max_tokens, ...) to add the points to.")
+
+    run = sub.add_parser("run", parents=[common], help="Plan and run rounds until every boundary is settled.")
+    run.add_argument("--queries", type=int, required=True)
+    run.add_argument("--spec", help="Base spec (dataset, max_tokens, ...) for the runs.")
+    run.add_argument("--hosts", nargs="*", default=[])
+    run.add_argument("--local", type=int, default=0, help="Simulated boards as local processes.")
+    run.add_argument("--time_scale", type=float, default=0.001)
+    run.add_argument("--remote_script")
+    run.add_argument("--model")
+    run.add_argument("--sysfs_root", default="/")
+    run.add_argument("--max_rounds", type=int, default=50)
+
+    rep = sub.add_parser("replay", parents=[common], help="Check against an exhaustive sweep and count runs saved.")
+    args = parser.parse_args()
+    kw = dict(safe_temp=args.safe_temp, overshoot=args.overshoot, max_repeats=args.max_repeats)
+
+    if args.cmd == "replay":
+        merged, rounds = replay(args.base, args.params, **kw)
+        print(merged[["param", "query", "min_val", "min_val_exhaustive", "max_val", "max_val_exhaustive",
+                      "runs", "runs_exhaustive", "agree"]].to_string(index=False))
+        print(f"{rounds} rounds, {merged['runs'].sum()} runs instead of {merged['runs_exhaustive'].sum()} "
+              f"({merged['runs_exhaustive'].sum() / max(merged['runs'].sum(), 1):.1f}x fewer), "
+              f"{merged['agree'].mean():.0%} of (param, query) pairs agree")
+        sys.exit(0 if merged["agree"].all() else 1)
+
+    spec = {}
+    if args.spec:
+        with open(args.spec) as f:
+            spec = {k: v for k, v in json.load(f).items() if k not in ("params", "queries", "repeats", "points")}
+    queries = range(args.queries)
+
+    if args.cmd == "next":
+        summary, points = plan_round(load_points(args.base, args.params), args.params, queries, **kw)
+        print(f"{summary['done'].sum()}/{len(summary)} settled, {len(points)} runs next", file=sys.stderr)
+        print(json.dumps({**spec, "points": points}, indent=2))
+        sys.exit(0)
+
+    from sweep_orchestrator import orchestrate, local_command, ssh_command, QUEUE_NAME, REMOTE_SCRIPT, MODEL_PATH
+    args.remote_script = args.remote_script or REMOTE_SCRIPT
+    args.model = args.model or MODEL_PATH
+    workers = [(host, ssh_command(host, args)) for host in args.hosts]
+    workers += [(f"sim{i}", local_command(i, args)) for i in range(args.local)]
+    if not workers:
+        parser.error("give --hosts and/or --local")
+    seen = -1
+    for round_no in range(1, args.max_rounds + 1):
+        points = load_points(args.base, args.params)
+        summary, nxt_points = plan_round(points, args.params, queries, **kw)
+        print(f"Round {round_no}: {summary['done'].sum()}/{len(summary)} settled, "
+              f"{len(points)} runs so far, {len(nxt_points)} next")
+        if not nxt_points:
+            break
+        if len(points) == seen:
+            print("No new results came back last round; see sweep_orchestrator.py status")
+            break
+        seen = len(points)
+        orchestrate({**spec, "points": nxt_points}, args.base, os.path.join(args.base, QUEUE_NAME), workers,
+                    seed=round_no)
+    path = write_summary(summary, os.path.join(args.base, "adaptive_summary.csv"))
+    print(f"min_val/max_val per (param, query) → {path}")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+import os
+import json
+import argparse
+from model_mt import load_model, run_inference
+from prefix_cache import PrefixStateCache
+from telemetry import TelemetrySampler
+from cooldown_scheduler import ThermalModel, wait_until_cool, STATE_FILE
+from governor import DecodeController, CpuControl, FREQ_HIGH, CORE_FULL
+from response_cache import ResponseCache, SIMILARITY
+
+# === Configuration ===
+MODEL_PATH   = "/home/rise/Downloads/llama-2-7b-chat.Q4_0.gguf"
+SAFE_TEMP    = 55.0
+FSYNC_EVERY  = 10     # results between fsyncs
+TELEMETRY_HZ = 20
+
+# Yield (index, item) without holding the whole dataset in memory:
+# JSONL line by line, JSON arrays through ijson when it is installed
+def iter_dataset(path):
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            index = 0
+            for line in f:
+                if line.strip():
+                    yield index, json.loads(line)
+                    index += 1
+        return
+    try:
+        import ijson
+    except ImportError:
+        with open(path) as f:
+            yield from enumerate(json.load(f))
+        return
+    with open(path, "rb") as f:
+        yield from enumerate(ijson.items(f, "item", use_float=True))
+
+def parse_shard(text):
+    i, n = (int(x) for x in text.split("/"))
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"shard {text} must be i/N with 0 <= i < N")
+    return i, n
+
+# Indices already in the output; a torn last line from a crash is cut off
+def completed_indices(out_path):
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    valid_end = 0
+    with open(out_path, "rb") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["index"])
+            except (ValueError, KeyError):
+                break
+            valid_end += len(line)
+    if valid_end < os.path.getsize(out_path):
+        print(f"Truncating partial record at byte {valid_end} of {out_path}")
+        with open(out_path, "r+b") as f:
+            f.truncate(valid_end)
+    return done
+
+
+class ResultWriter:
+    def __init__(self, path, fsync_every=FSYNC_EVERY):
+        self.f = open(path, "a")
+        self.fsync_every = fsync_every
+        self.pending = 0
+
+    def write(self, record):
+        self.f.write(json.dumps(record) + "\n")
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.f.close()
+
+
+def run_batch(llm, dataset, out_path, max_tokens, shard=(0, 1), safe_temp=SAFE_TEMP,
+              sysfs_root="/", prefix_cache=None, sampler=None, timeline_dir=None,
+              fsync_every=FSYNC_EVERY, limit=None, controller=None, response_cache=None, metrics_dir=None):
+    shard_i, shard_n = shard
+    done = completed_indices(out_path)
+    if done:
+        print(f"Resuming: {len(done)} queries already in {out_path}")
+    # cool-down waits follow the fitted decay model instead of fixed 30 s steps
+    thermal = ThermalModel.load(STATE_FILE)
+    writer = ResultWriter(out_path, fsync_every)
+    ran = 0
+    try:
+        for index, item in iter_dataset(dataset):
+            if index % shard_n != shard_i or index in done:
+                continue
+            if limit is not None and ran >= limit:
+                break
+            # a cached answer puts no heat in the board: no cool-down for it
+            result = response_cache.get(item["question"], item["context"], max_tokens) if response_cache else None
+            cool_wait, start_temp = (0.0, None) if result else wait_until_cool(safe_temp, thermal, sysfs_root)
+            if result is None:
+                timeline = os.path.join(timeline_dir, f"q{index}.tokens.f32") if timeline_dir else None
+                # the sampler's rows for this query, as the per-query server runs wrote them
+                metrics = os.path.join(metrics_dir, f"q{index}.csv") if metrics_dir else None
+                result = run_inference(llm, item["question"], item["context"], max_tokens,
+                                       prefix_cache=prefix_cache, stream=timeline is not None,
+                                       timeline_path=timeline, sampler=sampler, controller=controller,
+                                       metrics_path=metrics)
+                if result is None:
+                    print(f"✘ query {index} failed; it will be retried on resume")
+                    continue
+                if response_cache:
+                    response_cache.put(item["question"], item["context"], max_tokens, result)
+            result.update(index=index, shard=f"{shard_i}/{shard_n}", cool_wait=cool_wait,
+                          ground_truth=item.get("answer", item.get("answers", "N/A")))
+            writer.write(result)
+            ran += 1
+            if "cache" in result:
+                print(f"✔︎ query {index} ({result['cache']['tier']} cache hit, saved {result['cache']['saved_s']:.1f}s)")
+            else:
+                print(f"✔︎ query {index} ({result['elapsed_time']:.1f}s, start {start_temp}°C)")
+    finally:
+        writer.close()
+        thermal.save(STATE_FILE)
+        if response_cache:
+            print(f"Response cache: {json.dumps(response_cache.stats())}")
+    return ran
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a whole dataset in one process, resumable and shardable.")
+    parser.add_argument("--dataset", required=True, help="JSON array or JSONL of {question, context}.")
+    parser.add_argument("--out", required=True, help="Results JSONL (appended to, resumed from).")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--max_tokens", type=int, default=128)
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1), help="i/N: run every N-th query from i.")
+    parser.add_argument("--safe_temp", type=float, default=SAFE_TEMP)
+    parser.add_argument("--sysfs_root", default="/")
+    parser.add_argument("--prefix_cache_mb", type=float, default=0)
+    parser.add_argument("--telemetry_hz", type=float, default=TELEMETRY_HZ)
+    parser.add_argument("--timeline_dir", help="Stream and write per-token timelines here.")
+    parser.add_argument("--metrics_dir", help="Write each query's telemetry CSV here (needs --telemetry_hz).")
+    parser.add_argument("--fsync_every", type=int, default=FSYNC_EVERY)
+    parser.add_argument("--limit", type=int, help="Stop after this many queries.")
+    parser.add_argument("--decode_freq", type=int, help="MHz for decode; switched to per token, prompt at --prompt_freq.")
+    parser.add_argument("--prompt_freq", type=int, default=FREQ_HIGH)
+    parser.add_argument("--cores", type=int, default=CORE_FULL)
+    parser.add_argument("--response_cache", help="SQLite answer cache; repeated questions skip inference.")
+    parser.add_argument("--similarity", type=float, default=SIMILARITY,
+                        help="Cosine for a near-duplicate question to hit (1 = exact matches only).")
+    args = parser.parse_args()
+    if args.metrics_dir and not args.telemetry_hz:
+        parser.error("--metrics_dir needs the sampler: set --telemetry_hz")
+
+    llm = load_model(args.model)
+    if llm is None:
+        raise SystemExit(1)
+    for d in (args.timeline_dir, args.metrics_dir):
+        if d:
+            os.makedirs(d, exist_ok=True)
+    cache = PrefixStateCache(llm, args.prefix_cache_mb) if args.prefix_cache_mb else None
+    sampler = TelemetrySampler(hz=args.telemetry_hz, root=args.sysfs_root) if args.telemetry_hz else None
+    controller = None
+    if args.decode_freq:
+        controller = DecodeController(CpuControl(args.sysfs_root), prompt=(args.prompt_freq, args.cores),
+                                      decode=(args.decode_freq, args.cores), root=args.sysfs_root)
+    responses = ResponseCache(args.response_cache, args.model, args.similarity) if args.response_cache else None
+    if sampler:
+        sampler.start()
+    try:
+        ran = run_batch(llm, args.dataset, args.out, args.max_tokens, args.shard, args.safe_temp,
+                        args.sysfs_root, cache, sampler, args.timeline_dir, args.fsync_every, args.limit,
+                        controller, responses, args.metrics_dir)
+    finally:
+        if sampler:
+            sampler.stop()
+        if controller:
+            controller.close()
+        if responses:
+            responses.close()
+    print(f"Ran {ran} queries → {args.out}")
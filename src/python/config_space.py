@@ -0,0 +1,241 @@
+import os
+import math
+import numpy as np
+from energy import load_power_model
+
+# === Configuration ===
+MAX_RUNTIME_OVERSHOOT = 0.10
+SAFE_TEMP_C   = 77.0
+DEFAULT_FREQ  = 1500
+DEFAULT_CORES = 4
+DEFAULT_CTX   = 4096
+CORES_LIST = [4, 3, 2, 1]
+FREQ_LIST  = [1500, 1400, 1300, 1200, 1100, 1000, 900, 800, 700, 600]
+CTX_LIST   = [4096, 2048, 1024]
+SURROGATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "surrogate.npz")
+TOKENS_PER_K   = 16   # K = (words + max_tokens) // 16 in the selectors
+
+# === Surrogates ===
+# A surrogate is anything with predict(K, ambient, cores, freq_ghz, ctx) -> (L, T)
+# that broadcasts over NumPy arrays.
+
+class AnalyticSurrogate:
+    # Hand-written models from the selectors; use_ctx=False is run_predict.py's variant
+    def __init__(self, use_ctx=True):
+        self.use_ctx = use_ctx
+
+    def predict(self, K, ambient, cores, freq_ghz, ctx):
+        work = freq_ghz * cores
+        if self.use_ctx:
+            L = K * (30.0 / work) * (ctx / DEFAULT_CTX)
+            T = ambient + K * work * 0.05 * (1 + 0.02 * (ctx / DEFAULT_CTX))
+        else:
+            L = K * (30.0 / work)
+            T = ambient + K * work * 0.05
+        return L, T
+
+
+class LearnedSurrogate:
+    """Oblivious-tree GBMs fitted by surrogate_fit.py, loaded from one .npz (NumPy only)."""
+
+    FEATURES = ("tokens", "freq_ghz", "cores", "ctx", "ambient")
+
+    def __init__(self, path=SURROGATE_PATH):
+        with np.load(path) as z:
+            self.models = {name: {k[len(name) + 1:]: z[k] for k in z.files if k.startswith(name + "_")}
+                           for name in ("latency", "temp")}
+
+    @staticmethod
+    def _predict_gbm(m, X):
+        # every tree splits on the same (feature, threshold) per level, so the
+        # leaf index is just the comparison bits of X against each level
+        bits = X[:, m["features"]] > m["thresholds"]          # (n, trees, depth)
+        leaf = (bits << np.arange(bits.shape[2])).sum(axis=2)  # (n, trees)
+        out = m["base"] + np.take_along_axis(m["leaves"][None], leaf[..., None], axis=2)[..., 0].sum(axis=1)
+        if m["offset"] >= 0:
+            out = out + X[:, m["offset"]]
+        return np.exp(out) if m["log_target"] else out
+
+    def predict(self, K, ambient, cores, freq_ghz, ctx):
+        cols = np.broadcast_arrays(np.asarray(K, dtype=float) * TOKENS_PER_K, freq_ghz, cores, ctx, ambient)
+        shape = cols[0].shape
+        X = np.stack([np.ravel(c).astype(float) for c in cols], axis=1)
+        L = self._predict_gbm(self.models["latency"], X).reshape(shape)
+        T = self._predict_gbm(self.models["temp"], X).reshape(shape)
+        return L, T
+
+
+# Learned models when surrogate_fit.py has produced them, else the fallback
+def load_surrogate(fallback, path=SURROGATE_PATH):
+    if os.path.exists(path):
+        try:
+            return LearnedSurrogate(path)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring surrogate artifact {path}: {e}")
+    return fallback
+
+# === Objectives ===
+# choose(L, T, feasible) takes (scenarios, configs) arrays and returns the
+# chosen config index per scenario, -1 where nothing is feasible.
+
+class FirstFeasible:
+    # First hit in grid order (cores desc, freq desc), as in run_predict.py
+    def choose(self, L, T, feasible):
+        idx = feasible.argmax(axis=1)
+        return np.where(feasible.any(axis=1), idx, -1)
+
+
+class WeightedObjective:
+    # Min-max normalized weighted sum over the feasible set, as in run_score_algo.py
+    def __init__(self, w_latency=0.3, w_temp=0.7):
+        self.w_latency = w_latency
+        self.w_temp = w_temp
+
+    @staticmethod
+    def _normalize(X, feasible):
+        lo = np.where(feasible, X, np.inf).min(axis=1, keepdims=True)
+        hi = np.where(feasible, X, -np.inf).max(axis=1, keepdims=True)
+        span = hi - lo
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(span > 0, (X - lo) / span, 0.0)
+
+    def choose(self, L, T, feasible):
+        score = self.w_latency * self._normalize(L, feasible) + self.w_temp * self._normalize(T, feasible)
+        score = np.where(feasible, score, np.inf)
+        return np.where(feasible.any(axis=1), score.argmin(axis=1), -1)
+
+
+class EnergyObjective:
+    # Least energy (model power x latency) over the feasible set, and within
+    # latency_slo seconds when one is given. Needs the space for each
+    # config's freq and cores (and power_scale, if it has one); the power
+    # model is energy.py's fitted one.
+    def __init__(self, space, latency_slo=None, power_model=None):
+        power_model = power_model or load_power_model()
+        self.power_w = power_model.power(space.freqs / 1000.0, space.cores) * getattr(space, "power_scale", 1.0)
+        self.latency_slo = latency_slo
+
+    def choose(self, L, T, feasible):
+        ok = feasible if self.latency_slo is None else feasible & (L <= self.latency_slo)
+        energy = np.where(ok, L * self.power_w, np.inf)
+        return np.where(ok.any(axis=1), energy.argmin(axis=1), -1)
+
+
+def pareto_mask(L, T):
+    # Non-dominated points of one scenario (both objectives minimized)
+    order = np.lexsort((T, L))
+    mask = np.zeros(len(L), dtype=bool)
+    best_T = np.inf
+    for i in order:
+        if T[i] < best_T:
+            mask[i] = True
+            best_T = T[i]
+    return mask
+
+
+class ParetoObjective:
+    # Knee of the latency/temperature front: closest point to the utopia corner
+    def choose(self, L, T, feasible):
+        out = np.full(len(L), -1)
+        for r in range(len(L)):
+            idx = np.flatnonzero(feasible[r])
+            if idx.size == 0:
+                continue
+            front = idx[pareto_mask(L[r, idx], T[r, idx])]
+            nL = WeightedObjective._normalize(L[r, front][None], np.ones((1, front.size), bool))[0]
+            nT = WeightedObjective._normalize(T[r, front][None], np.ones((1, front.size), bool))[0]
+            out[r] = front[np.argmin(nL ** 2 + nT ** 2)]
+        return out
+
+# === Search ===
+
+class ConfigSpace:
+    def __init__(self, cores=CORES_LIST, freqs=FREQ_LIST, ctxs=CTX_LIST, surrogate=None,
+                 safe_temp=SAFE_TEMP_C, overshoot=MAX_RUNTIME_OVERSHOOT,
+                 baseline=(DEFAULT_CORES, DEFAULT_FREQ, DEFAULT_CTX)):
+        # Grid order matches the original loops: cores outer, then freq, then ctx
+        c, f, x = np.meshgrid(cores, freqs, ctxs, indexing="ij")
+        self.cores = c.ravel()
+        self.freqs = f.ravel()
+        self.ctxs = x.ravel()
+        self.surrogate = surrogate or AnalyticSurrogate()
+        self.safe_temp = safe_temp
+        self.overshoot = overshoot
+        self.baseline = baseline
+
+    def __len__(self):
+        return len(self.cores)
+
+    def baseline_latency(self, K, ambient=0.0):
+        c, f, x = self.baseline
+        L, _ = self.surrogate.predict(np.asarray(K, dtype=float), ambient, c, f / 1000.0, x)
+        return L
+
+    # L, T and the feasibility mask for every (scenario, config) pair
+    def evaluate(self, K, ambient):
+        K = np.atleast_1d(np.asarray(K, dtype=float))[:, None]
+        ambient = np.atleast_1d(np.asarray(ambient, dtype=float))[:, None]
+        L, T = self.surrogate.predict(K, ambient, self.cores, self.freqs / 1000.0, self.ctxs)
+        L, T = np.broadcast_arrays(L, T)
+        base_L = self.baseline_latency(K, ambient)
+        feasible = (T <= self.safe_temp) & (L <= base_L * (1 + self.overshoot))
+        return L, T, feasible
+
+    def config(self, i, L, T):
+        return int(self.cores[i]), int(self.freqs[i]), int(self.ctxs[i]), float(L[i]), float(T[i])
+
+    # Best (cores, freq, ctx, L, T) for one query, or None if nothing is safe
+    def select(self, K, ambient, objective):
+        L, T, feasible = self.evaluate(K, ambient)
+        i = objective.choose(L, T, feasible)[0]
+        return None if i < 0 else self.config(i, L[0], T[0])
+
+
+class DecisionTable:
+    """Memoized selections per (K bucket, ambient temperature bucket)."""
+
+    def __init__(self, space, objective, k_bucket=1, temp_bucket=0.5):
+        self.space = space
+        self.objective = objective
+        self.k_bucket = k_bucket
+        self.temp_bucket = temp_bucket
+        self.table = {}
+
+    # K is fractional (tokens / TOKENS_PER_K), so both axes round up
+    def _key(self, K, ambient):
+        kb = math.ceil(K / self.k_bucket) if self.k_bucket else K
+        tb = math.ceil(ambient / self.temp_bucket) if self.temp_bucket else ambient
+        return kb, tb
+
+    # Representative point of a bucket: its upper edge in K and ambient, so
+    # the cached choice stays safe for everything that maps to it.
+    def _representative(self, key):
+        kb, tb = key
+        K = kb * self.k_bucket if self.k_bucket else kb
+        ambient = tb * self.temp_bucket if self.temp_bucket else tb
+        return K, ambient
+
+    def _fill(self, keys):
+        reps = np.array([self._representative(k) for k in keys], dtype=float)
+        L, T, feasible = self.space.evaluate(reps[:, 0], reps[:, 1])
+        chosen = self.objective.choose(L, T, feasible)
+        for r, key in enumerate(keys):
+            i = chosen[r]
+            self.table[key] = None if i < 0 else self.space.config(i, L[r], T[r])
+
+    # Fill the table for a whole range of loads and temperatures in one pass
+    def precompute(self, K_values, ambient_values):
+        keys = {self._key(K, a) for K in K_values for a in ambient_values}
+        missing = [k for k in keys if k not in self.table]
+        if missing:
+            self._fill(missing)
+        return self
+
+    # The returned L and T are predicted at the bucket's representative point
+    # (upper K edge, hottest ambient), not at (K, ambient): upper bounds for
+    # the query rather than its own estimate
+    def lookup(self, K, ambient):
+        key = self._key(K, ambient)
+        if key not in self.table:
+            self._fill([key])
+        return self.table[key]
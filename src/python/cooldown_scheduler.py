@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+import os
+import json
+import math
+import time
+import argparse
+import numpy as np
+from telemetry import SysfsReader, discover_sensors
+
+# === Configuration ===
+SAFE_TEMP      = 55.0
+GAP_FILL_TEMP  = None   # start gate for low-heat runs; None = SAFE_TEMP, as for every other run
+RELAXED_GAP_FILL = 65.0 # opt-in value compared by `simulate`: faster, but those runs start hotter
+LOW_HEAT       = 3.0    # °C rise that counts as a low-heat run
+POLL_STEP      = 30.0   # the fixed wait of the old cool_down()
+PRIOR_TAU      = 120.0  # s, first-order cooling time constant before any fit
+PRIOR_AMBIENT  = 40.0   # °C, idle temperature the board decays towards
+MIN_GAP        = 5.0    # s between samples used for a slope estimate
+MAX_WAIT       = 600.0  # s; a target at or below the fitted ambient never arrives
+STATE_FILE     = os.path.expanduser("~/.cache/edge_thermal_model.json")
+
+# === First-order thermal decay model ===
+# dT/dt = -(T - T_amb) / tau, fitted online from idle samples as
+# dT/dt = a*T + b with a = -1/tau, b = T_amb/tau.
+
+class ThermalModel:
+    def __init__(self, tau=PRIOR_TAU, ambient=PRIOR_AMBIENT, prior_weight=5.0, max_points=2000):
+        self.tau, self.ambient = tau, ambient
+        self.prior = (tau, ambient)
+        self.prior_weight = prior_weight
+        self.max_points = max_points
+        self.points = []     # (mean temp, slope) pairs from cooling segments
+        self.last = None
+
+    # Feed idle (cooling) samples only; heating samples would bias the fit
+    def observe(self, t, temp):
+        if self.last is not None:
+            t0, temp0 = self.last
+            if t - t0 < MIN_GAP:
+                return
+            slope = (temp - temp0) / (t - t0)
+            if slope < 0:
+                self.points.append(((temp + temp0) / 2, slope))
+                self.points = self.points[-self.max_points:]
+        self.last = (t, temp)
+
+    def reset_segment(self):
+        self.last = None
+
+    def fit(self):
+        if len(self.points) < 3:
+            return self
+        x, y = np.array(self.points).T
+        # least squares on slope = a*T + b, pulled towards the prior line
+        tau0, amb0 = self.prior
+        a0, b0 = -1.0 / tau0, amb0 / tau0
+        X = np.column_stack([x, np.ones_like(x)])
+        w = self.prior_weight
+        A = X.T @ X + w * np.eye(2)
+        rhs = X.T @ y + w * np.array([a0, b0])
+        a, b = np.linalg.solve(A, rhs)
+        if a < 0:
+            self.tau, self.ambient = -1.0 / a, -b / a
+        return self
+
+    def predict(self, temp, dt):
+        return self.ambient + (temp - self.ambient) * math.exp(-dt / self.tau)
+
+    def time_to_cool(self, temp, target):
+        if temp <= target:
+            return 0.0
+        if target <= self.ambient:
+            return math.inf
+        return self.tau * math.log((temp - self.ambient) / (target - self.ambient))
+
+    def save(self, path=STATE_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"tau": self.tau, "ambient": self.ambient, "points": self.points[-500:]}, f)
+
+    @classmethod
+    def load(cls, path=STATE_FILE):
+        model = cls()
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            model.tau, model.ambient = state["tau"], state["ambient"]
+            model.points = [tuple(p) for p in state.get("points", [])]
+        except (OSError, ValueError, KeyError):
+            pass
+        return model
+
+# === Scheduling ===
+
+class Experiment:
+    def __init__(self, id, duration, heat, max_start_temp=None):
+        self.id = id
+        self.duration = duration   # expected seconds
+        self.heat = heat           # expected °C rise over the run, net of cooling
+        self.max_start_temp = max_start_temp
+
+    def start_limit(self, safe_temp, gap_fill_temp, low_heat):
+        if self.max_start_temp is not None:
+            return self.max_start_temp
+        return gap_fill_temp if self.heat <= low_heat else safe_temp
+
+
+class CooldownScheduler:
+    # A gap_fill_temp above safe_temp lets low-heat runs start hotter than
+    # the rest: shorter sweeps, but not all runs measured from the same gate
+    def __init__(self, model=None, safe_temp=SAFE_TEMP, gap_fill_temp=GAP_FILL_TEMP, low_heat=LOW_HEAT):
+        self.model = model or ThermalModel()
+        self.safe_temp = safe_temp
+        self.gap_fill_temp = safe_temp if gap_fill_temp is None else gap_fill_temp
+        self.low_heat = low_heat
+
+    def limit(self, exp):
+        return exp.start_limit(self.safe_temp, self.gap_fill_temp, self.low_heat)
+
+    # Next experiment to run at `temp` and how long to wait before it.
+    # Anything startable now wins, hottest first while there is headroom;
+    # otherwise wait for whichever experiment becomes startable soonest.
+    def next(self, pending, temp):
+        ready = [e for e in pending if temp <= self.limit(e)]
+        if ready:
+            return max(ready, key=lambda e: (e.heat, -e.duration)), 0.0
+        waits = [(self.model.time_to_cool(temp, self.limit(e)), e) for e in pending]
+        wait, exp = min(waits, key=lambda w: (w[0], -w[1].heat))
+        return exp, min(wait, MAX_WAIT)
+
+    def plan(self, experiments, temp):
+        pending, order, t = list(experiments), [], 0.0
+        while pending:
+            exp, wait = self.next(pending, temp)
+            temp = self.model.predict(temp, wait) if wait else temp
+            order.append((exp, t + wait))
+            t += wait + exp.duration
+            temp = self.model.predict(temp, exp.duration) + exp.heat
+            pending.remove(exp)
+        return order, t
+
+# === Live gate (replacement for the bash cool_down) ===
+
+def read_temp(reader):
+    values = [v for k, v in reader.read().items() if k.endswith("_temp_C")]
+    return values[0] if values else None
+
+def wait_until_cool(target, model=None, sysfs_root="/", sample_every=5.0, max_sleep=120.0):
+    model = model or ThermalModel()
+    reader = SysfsReader([s for s in discover_sensors(sysfs_root) if s[0].endswith("_temp_C")][:1])
+    t0 = time.monotonic()
+    model.reset_segment()
+    try:
+        temp = read_temp(reader)
+        while temp is not None and temp > target:
+            model.observe(time.monotonic(), temp)
+            predicted = model.fit().time_to_cool(temp, target)
+            print(f"Cooling… {temp:.1f}°C, ~{predicted:.0f}s to {target}°C (tau {model.tau:.0f}s)")
+            # sleep most of the predicted time, but keep sampling to refine the fit
+            time.sleep(max(1.0, min(predicted * 0.8, sample_every if len(model.points) < 3 else max_sleep)))
+            temp = read_temp(reader)
+    finally:
+        reader.close()
+    return time.monotonic() - t0, temp
+
+# === Simulation ===
+
+class SimulatedBoard:
+    # First-order plant: the board keeps shedding heat during a run and the
+    # run adds its own rise on top; idle just decays to ambient
+    def __init__(self, tau=150.0, ambient=42.0, temp=50.0, noise=0.2, seed=0):
+        self.tau, self.ambient, self.temp = tau, ambient, temp
+        self.rng = np.random.default_rng(seed)
+        self.noise = noise
+        self.t = 0.0
+
+    def read(self):
+        return self.temp + self.rng.normal(0, self.noise)
+
+    def idle(self, dt):
+        self.temp = self.ambient + (self.temp - self.ambient) * math.exp(-dt / self.tau)
+        self.t += dt
+
+    def run(self, exp):
+        self.idle(exp.duration)
+        self.temp += exp.heat
+
+
+def simulate_polling(experiments, board, safe_temp=SAFE_TEMP, step=POLL_STEP):
+    for exp in experiments:
+        t0 = board.t
+        while board.read() > safe_temp and board.t - t0 < MAX_WAIT:
+            board.idle(step)
+        board.run(exp)
+    return board.t
+
+def simulate_predictive(experiments, board, scheduler, sample_every=5.0):
+    pending = list(experiments)
+    model = scheduler.model
+    waited = 0.0
+    while pending:
+        temp = board.read()
+        exp, wait = scheduler.next(pending, temp)
+        # a board that will not cool to the gate runs anyway after MAX_WAIT
+        if wait > 0 and waited < MAX_WAIT:
+            t0 = board.t
+            model.reset_segment()
+            model.observe(board.t, temp)
+            # sample while cooling so the model keeps learning
+            while wait > 0:
+                dt = min(wait, sample_every) if len(model.points) < 3 else wait
+                board.idle(max(dt, 1.0))
+                temp = board.read()
+                model.observe(board.t, temp)
+                model.fit()
+                exp, wait = scheduler.next(pending, temp)
+                if board.t - t0 >= MAX_WAIT:
+                    break
+            waited += board.t - t0
+            continue
+        board.run(exp)
+        pending.remove(exp)
+        waited = 0.0
+    return board.t
+
+def synthetic_sweep(n, seed=0):
+    rng = np.random.default_rng(seed)
+    heavy = rng.random(n) < 0.5
+    return [Experiment(f"exp{i}",
+                       duration=float(rng.uniform(60, 240) if h else rng.uniform(10, 40)),
+                       heat=float(rng.uniform(8, 18) if h else rng.uniform(0.5, 3.0)))
+            for i, h in enumerate(heavy)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predictive thermal cool-down scheduling.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    w = sub.add_parser("wait", help="Block until the CPU is below --safe_temp.")
+    w.add_argument("--safe_temp", type=float, default=SAFE_TEMP)
+    w.add_argument("--sysfs_root", default="/")
+    w.add_argument("--state", default=STATE_FILE, help="Where the fitted model persists between calls.")
+
+    p = sub.add_parser("plan", help="Order experiments from a JSON list of {id, duration, heat}.")
+    p.add_argument("experiments")
+    p.add_argument("--temp", type=float, required=True, help="Current temperature.")
+    p.add_argument("--state", default=STATE_FILE)
+
+    s = sub.add_parser("simulate", help="Compare sweep makespan against fixed 30 s polling.")
+    s.add_argument("--experiments", type=int, default=60)
+    s.add_argument("--seed", type=int, default=0)
+    for sp in (p, s):
+        sp.add_argument("--safe_temp", type=float, default=SAFE_TEMP)
+    p.add_argument("--gap_fill_temp", type=float, default=GAP_FILL_TEMP,
+                   help="Opt-in: low-heat runs may start up to here (default --safe_temp).")
+    s.add_argument("--gap_fill_temp", type=float, default=RELAXED_GAP_FILL,
+                   help="Relaxed low-heat gate to compare against the --safe_temp one.")
+    args = parser.parse_args()
+
+    if args.cmd == "wait":
+        model = ThermalModel.load(args.state)
+        waited, temp = wait_until_cool(args.safe_temp, model, args.sysfs_root)
+        model.save(args.state)
+        print(f"CPU cooled to {temp}°C after {waited:.0f}s")
+    elif args.cmd == "plan":
+        with open(args.experiments) as f:
+            exps = [Experiment(**e) for e in json.load(f)]
+        scheduler = CooldownScheduler(ThermalModel.load(args.state), args.safe_temp, args.gap_fill_temp)
+        order, makespan = scheduler.plan(exps, args.temp)
+        for exp, start in order:
+            print(f"{start:8.0f}s  {exp.id}  ({exp.duration:.0f}s, +{exp.heat:.1f}°C)")
+        print(f"Predicted makespan {makespan:.0f}s")
+    else:
+        exps = synthetic_sweep(args.experiments, args.seed)
+        base = simulate_polling(exps, SimulatedBoard(seed=args.seed), args.safe_temp)
+        busy = sum(e.duration for e in exps)
+        print(f"Experiments: {len(exps)}, busy time {busy / 3600:.2f} h")
+        print(f"Fixed {POLL_STEP:.0f}s polling: makespan {base / 3600:.2f} h (cooling {(base - busy) / 3600:.2f} h)")
+        # same start gate as polling first; the relaxed low-heat gate changes what is measured
+        for label, gap_fill in ((f"every run from {args.safe_temp:.0f}°C", None),
+                                (f"low-heat runs from {args.gap_fill_temp:.0f}°C", args.gap_fill_temp)):
+            scheduler = CooldownScheduler(ThermalModel(), args.safe_temp, gap_fill)
+            pred = simulate_predictive(exps, SimulatedBoard(seed=args.seed), scheduler)
+            print(f"Predictive + reorder, {label}: makespan {pred / 3600:.2f} h "
+                  f"(cooling {(pred - busy) / 3600:.2f} h), saved {(base - pred) / base:.0%}; "
+                  f"fitted tau {scheduler.model.tau:.0f}s, ambient {scheduler.model.ambient:.1f}°C")
@@ -0,0 +1,140 @@
+import os
+import threading
+
+# === Configuration ===
+PROC_ROOT   = "/proc"
+CGROUP_ROOT = "/sys/fs/cgroup"
+CPU_PERIOD_US = 100000
+PINNED_THREADS = set()   # native ids of threads that chose their own CPUs (telemetry sampler)
+
+def allowed_cpus(cores):
+    # same CPUs the old taskset mask (1 << cores) - 1 selected
+    return set(range(cores))
+
+def process_threads(pid=None, proc_root=PROC_ROOT):
+    pid = pid or os.getpid()
+    try:
+        return [int(tid) for tid in os.listdir(os.path.join(proc_root, str(pid), "task"))]
+    except FileNotFoundError:
+        return [pid]
+
+# For a thread that keeps its own CPU, e.g. the sampler on HOUSEKEEPING_CPU;
+# set_core_affinity leaves it there
+def pin_current_thread(cpus):
+    tid = threading.get_native_id()
+    os.sched_setaffinity(tid, cpus)
+    PINNED_THREADS.add(tid)
+    return tid
+
+def unpin_thread(tid):
+    PINNED_THREADS.discard(tid)   # native ids are reused once the thread exits
+
+def inference_threads(pid=None):
+    return [tid for tid in process_threads(pid) if tid not in PINNED_THREADS]
+
+# Pin every thread of the process, not just the main one: llama.cpp worker
+# threads created before the call keep their old mask otherwise. Threads
+# created later inherit the mask from the thread that spawns them.
+def set_core_affinity(cores, pid=None):
+    cpus = allowed_cpus(cores)
+    threads = inference_threads(pid)
+    for tid in threads:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:
+            pass   # thread exited in between
+    return verify_affinity(cpus, pid)
+
+def verify_affinity(cpus, pid=None):
+    wrong = []
+    threads = inference_threads(pid)
+    for tid in threads:
+        try:
+            if os.sched_getaffinity(tid) != cpus:
+                wrong.append(tid)
+        except ProcessLookupError:
+            pass
+    return {"cpus": sorted(cpus), "threads": len(threads), "mismatched_threads": wrong,
+            "pinned_elsewhere": len(PINNED_THREADS)}
+
+# Make llama.cpp use as many threads as it has cores; more threads than
+# cores just time-slice and the measured per-core throughput is meaningless.
+# Returns the count llama.cpp reports, or None when it cannot be read back.
+def set_llm_threads(llm, n_threads):
+    llm.n_threads = n_threads
+    llm.n_threads_batch = n_threads
+    params = getattr(llm, "context_params", None)
+    if params is not None:
+        params.n_threads = n_threads
+        params.n_threads_batch = n_threads
+    try:
+        import llama_cpp
+        ctx = llm._ctx.ctx
+        llama_cpp.llama_set_n_threads(ctx, n_threads, n_threads)
+        return llama_cpp.llama_n_threads(ctx)
+    except (ImportError, AttributeError):
+        return None
+
+
+class CgroupCpu:
+    """cgroup v2 group limiting a process to `cores` CPUs (cpuset.cpus + cpu.max)."""
+
+    def __init__(self, name="llm_inference", root=CGROUP_ROOT, period_us=CPU_PERIOD_US):
+        self.root = root
+        self.path = os.path.join(root, name)
+        self.period_us = period_us
+        os.makedirs(self.path, exist_ok=True)
+        self._write(os.path.join(root, "cgroup.subtree_control"), "+cpu +cpuset")
+
+    def _write(self, path, value):
+        with open(path, "w") as f:
+            f.write(value)
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    # Moves every thread of the process into the group
+    def attach(self, pid=None):
+        self._write(os.path.join(self.path, "cgroup.procs"), str(pid or os.getpid()))
+
+    def set_cores(self, cores, quota=True):
+        self._write(os.path.join(self.path, "cpuset.cpus"), f"0-{cores - 1}" if cores > 1 else "0")
+        self._write(os.path.join(self.path, "cpu.max"),
+                    f"{cores * self.period_us} {self.period_us}" if quota else f"max {self.period_us}")
+        return self.verify(cores, quota)
+
+    def verify(self, cores, quota=True):
+        effective = self._read("cpuset.cpus.effective") or self._read("cpuset.cpus")
+        cpu_max = self._read("cpu.max")
+        expected_max = f"{cores * self.period_us} {self.period_us}" if quota else f"max {self.period_us}"
+        return {"cpuset": effective, "cpu_max": cpu_max,
+                "ok": parse_cpu_list(effective) == allowed_cpus(cores) and cpu_max == expected_max}
+
+
+def parse_cpu_list(text):
+    cpus = set()
+    for part in (text or "").split(","):
+        if "-" in part:
+            a, b = part.split("-")
+            cpus.update(range(int(a), int(b) + 1))
+        elif part.strip():
+            cpus.add(int(part))
+    return cpus
+
+# Affinity for every thread, matching llama thread count, optional cgroup;
+# returns what was actually observed after applying
+def apply_cores(llm, cores, cgroup=None, pid=None):
+    report = set_core_affinity(cores, pid)
+    report["n_threads"] = set_llm_threads(llm, cores) if llm is not None else None   # None: unverified
+    if cgroup is not None:
+        cgroup.attach(pid)
+        report["cgroup"] = cgroup.set_cores(cores)
+    report["ok"] = (not report["mismatched_threads"] and report["n_threads"] in (None, cores)
+                    and report.get("cgroup", {}).get("ok", True))
+    if not report["ok"]:
+        print(f"[WARN] core setting not fully applied: {report}")
+    return report
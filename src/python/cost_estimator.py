@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import json
+import hashlib
+import argparse
+from functools import lru_cache
+from prefix_cache import split_prompt
+from config_space import TOKENS_PER_K
+
+# === Configuration ===
+MAX_TOKENS   = 128    # decode budget the selectors plan for
+PROMPT_RATE  = 12.0   # tokens/s of prompt eval at the baseline config
+DECODE_RATE  = 2.5    # tokens/s of generation at the baseline config
+WORD_TOKENS  = 1.3    # tokens per word, only when no tokenizer is available
+
+# Tokenizer only: vocab_only skips the weights, so this is a fraction of a
+# second and a few MB, and is shared by every estimator on the same GGUF
+@lru_cache(maxsize=4)
+def load_tokenizer(model_path):
+    from llama_cpp import Llama
+    return Llama(model_path=model_path, vocab_only=True, verbose=False)
+
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class CostEstimate:
+    def __init__(self, prompt_tokens, decode_tokens, prompt_rate=PROMPT_RATE, decode_rate=DECODE_RATE):
+        self.prompt_tokens = prompt_tokens
+        self.decode_tokens = decode_tokens
+        self.prompt_time = prompt_tokens / prompt_rate
+        self.decode_time = decode_tokens / decode_rate
+
+    # Load in the selectors' units: total tokens per TOKENS_PER_K, the same
+    # scale the old (words + 128) // 16 approximated and the surrogates use
+    @property
+    def K(self):
+        return (self.prompt_tokens + self.decode_tokens) / TOKENS_PER_K
+
+    def as_dict(self):
+        return {"prompt_tokens": self.prompt_tokens, "decode_tokens": self.decode_tokens,
+                "est_prompt_time": self.prompt_time, "est_decode_time": self.decode_time, "K": self.K}
+
+
+class CostEstimator:
+    """Token counts from the model's own tokenizer, memoized per text hash."""
+
+    def __init__(self, model_path=None, max_tokens=MAX_TOKENS, prompt_rate=PROMPT_RATE, decode_rate=DECODE_RATE):
+        self.max_tokens = max_tokens
+        self.prompt_rate = prompt_rate
+        self.decode_rate = decode_rate
+        self.counts = {}   # text hash -> token count
+        self.tokenizer = None
+        if model_path:
+            try:
+                self.tokenizer = load_tokenizer(model_path)
+            except Exception as e:
+                print(f"[WARN] tokenizer unavailable, estimating from word counts: {e}")
+
+    def count(self, text, add_bos=False):
+        key = (text_key(text), add_bos)
+        if key not in self.counts:
+            if self.tokenizer is not None:
+                self.counts[key] = len(self.tokenizer.tokenize(text.encode("utf-8"), add_bos=add_bos))
+            else:
+                self.counts[key] = round(len(text.split()) * WORD_TOKENS) + add_bos
+        return self.counts[key]
+
+    # The context prefix is counted once per distinct context however many
+    # questions share it; the question part is counted without a BOS
+    def estimate(self, context, question, max_tokens=None):
+        prefix, prompt = split_prompt(context, question)
+        prompt_tokens = self.count(prefix, add_bos=True) + self.count(prompt[len(prefix):])
+        return CostEstimate(prompt_tokens, self.max_tokens if max_tokens is None else max_tokens,
+                            self.prompt_rate, self.decode_rate)
+
+    # Whole dataset in one pass before the run starts
+    def estimate_dataset(self, items, max_tokens=None):
+        return [self.estimate(item["context"], item["question"], max_tokens) for item in items]
+
+    # Refit the two rates from streamed results (prompt_eval_time, decode_time)
+    def calibrate(self, results):
+        p = [(r["total_tokens"] - r["completion_tokens"], r["prompt_eval_time"]) for r in results
+             if r.get("prompt_eval_time") and r.get("total_tokens")]
+        d = [(r["completion_tokens"], r["decode_time"]) for r in results
+             if r.get("decode_time") and r.get("completion_tokens")]
+        if p:
+            self.prompt_rate = sum(n for n, _ in p) / sum(t for _, t in p)
+        if d:
+            self.decode_rate = sum(n for n, _ in d) / sum(t for _, t in d)
+        return self.prompt_rate, self.decode_rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Token-accurate cost of a {question, context} dataset.")
+    parser.add_argument("--model", required=True, help="GGUF whose tokenizer to use (weights are not loaded).")
+    parser.add_argument("--dataset", required=True)
+    parser.add_argument("--max_tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--out", help="Write per-query estimates here as JSON.")
+    args = parser.parse_args()
+
+    with open(args.dataset) as f:
+        items = json.load(f)
+    estimator = CostEstimator(args.model, args.max_tokens)
+    costs = estimator.estimate_dataset(items)
+    words = [(len((it["context"] + " " + it["question"]).split()) + 128) // 16 for it in items]
+    drift = sum(abs(c.K - w) for c, w in zip(costs, words)) / max(len(items), 1)
+    print(f"{len(items)} queries, {len(estimator.counts)} distinct texts tokenized")
+    print(f"Prompt tokens {sum(c.prompt_tokens for c in costs)}, "
+          f"est. prompt eval {sum(c.prompt_time for c in costs):.0f}s, decode {sum(c.decode_time for c in costs):.0f}s")
+    print(f"Mean |K - word-count K| = {drift:.2f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump([c.as_dict() for c in costs], f, indent=2)
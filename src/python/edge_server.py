@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# Multi-user front end for one model on a shared edge box: an asyncio HTTP
+# server, an earliest-deadline-first queue, micro-batches of requests that
+# share a context, and admission control from the thermal headroom left
+# under SAFE_TEMP_C. Same /infer, /health and /shutdown as model_server.py,
+# so model_client.py works against either.
+#
+#   python3 edge_server.py --prefix_cache_mb 128
+#   python3 model_client.py --question "..." --context "..." --max_tokens 64 --deadline 30
+#
+# llama-cpp-python decodes one sequence per context, so a batch runs back to
+# back on the one instance: the shared context is evaluated once (prefix
+# cache, or llama.cpp's own prefix reuse) and the rest pay for their question.
+# With --response_cache, repeated and near-duplicate questions are answered
+# from response_cache.py before admission control: they add no heat.
+import time
+import json
+import heapq
+import asyncio
+import argparse
+import itertools
+from http import HTTPStatus
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from model_mt import load_model, run_inference
+from model_server import load_items
+from prefix_cache import PrefixStateCache
+from token_timeline import sidecar_path
+from telemetry import SysfsReader, TelemetrySampler
+from governor import control_sensors
+from cooldown_scheduler import ThermalModel, STATE_FILE
+from response_cache import ResponseCache, SIMILARITY
+
+# === Configuration ===
+MODEL_PATH = "/home/rise/Downloads/llama-2-7b-chat.Q4_0.gguf"
+HOST = "127.0.0.1"
+PORT = 8765
+SAFE_TEMP_C = 77.0
+REJECT_HEADROOM  = 2.0    # °C under SAFE_TEMP_C: refuse new requests
+DEGRADE_HEADROOM = 6.0    # °C under SAFE_TEMP_C: admit with less work
+DEGRADED_MAX_TOKENS = 64
+DEGRADED_CTX_TOKENS = 512  # context tokens kept when degraded
+DEFAULT_DEADLINE_S = 120.0
+BATCH_WINDOW_S = 0.05     # wait this long for compatible requests before running
+MAX_BATCH = 8
+MAX_QUEUE = 64
+STATS_WINDOW = 1000       # most recent requests behind the percentiles
+RATE_WINDOW_S = 60.0      # throughput is measured over this trailing window
+
+
+class Request:
+    def __init__(self, question, context, max_tokens, deadline_s=DEFAULT_DEADLINE_S, stream=False,
+                 timeline_path=None, metrics_path=None):
+        self.question, self.context = question, context
+        self.max_tokens = max_tokens
+        self.ctx_tokens = None      # context cut to this many tokens when degraded
+        self.stream = stream
+        self.timeline_path, self.metrics_path = timeline_path, metrics_path
+        self.arrived = time.monotonic()
+        self.deadline = self.arrived + deadline_s
+        self.degraded = False
+        self.future = None
+
+    # Requests with the same key share their prompt prefix
+    @property
+    def key(self):
+        return self.context, self.ctx_tokens
+
+
+class AdmissionControl:
+    """Admit, degrade (fewer tokens, shorter context) or reject by thermal headroom."""
+
+    def __init__(self, root="/", safe_temp=SAFE_TEMP_C, reject=REJECT_HEADROOM, degrade=DEGRADE_HEADROOM,
+                 thermal=None):
+        self.reader = SysfsReader(control_sensors(root, temperature_only=True))
+        self.safe_temp = safe_temp
+        self.reject, self.degrade = reject, degrade
+        self.thermal = thermal or ThermalModel()   # for the client's Retry-After
+        self.temp = [float("nan")]
+
+    def temperature(self):
+        self.reader.read_into(self.temp)
+        return self.temp[0]
+
+    # Returns (verdict, seconds to wait before retrying); no sensor means admit
+    def check(self, req):
+        temp = self.temperature()
+        headroom = self.safe_temp - temp
+        if headroom < self.reject:
+            # never inf: the fitted ambient can sit above the target
+            return "reject", min(self.thermal.time_to_cool(temp, self.safe_temp - self.degrade), 600.0)
+        if headroom < self.degrade:
+            req.max_tokens = min(req.max_tokens, DEGRADED_MAX_TOKENS)
+            req.ctx_tokens = DEGRADED_CTX_TOKENS
+            req.degraded = True
+            return "degrade", 0.0
+        return "admit", 0.0
+
+    def close(self):
+        self.reader.close()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class BatchQueue:
+    """Earliest-deadline-first queue handing out micro-batches that share a key."""
+
+    def __init__(self, max_queue=MAX_QUEUE):
+        self.heap = []
+        self.seq = itertools.count()
+        self.max_queue = max_queue
+        self.nonempty = asyncio.Event()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def put(self, req):
+        if len(self.heap) >= self.max_queue:
+            raise QueueFull(f"{len(self.heap)} requests queued")
+        heapq.heappush(self.heap, (req.deadline, next(self.seq), req))
+        self.nonempty.set()
+
+    def expired(self, now):
+        out = []
+        while self.heap and self.heap[0][0] <= now:
+            out.append(heapq.heappop(self.heap)[2])
+        if not self.heap:
+            self.nonempty.clear()
+        return out
+
+    # The most urgent request plus every queued one it can share a prefix with
+    def take(self, max_batch=MAX_BATCH):
+        if not self.heap:
+            return []
+        head = heapq.heappop(self.heap)[2]
+        batch, rest = [head], []
+        for entry in sorted(self.heap):
+            if entry[2].key == head.key and len(batch) < max_batch:
+                batch.append(entry[2])
+            else:
+                rest.append(entry)
+        self.heap = rest   # sorted, so still a heap
+        if not self.heap:
+            self.nonempty.clear()
+        return batch
+
+
+# Only touched on the event loop: the executor thread records through
+# call_soon_threadsafe, so snapshot() never iterates a deque mid-append
+class ServingStats:
+    def __init__(self, window=STATS_WINDOW):
+        self.latencies = deque(maxlen=window)   # arrival to response, seconds
+        self.finished = deque(maxlen=window)    # (monotonic finish time, tokens)
+        self.batch_sizes = deque(maxlen=window)
+        self.counts = Counter()
+        self.started = time.monotonic()
+
+    def record(self, req, result, now=None):
+        now = time.monotonic() if now is None else now
+        self.latencies.append(now - req.arrived)
+        self.finished.append((now, result.get("total_tokens", 0)))
+        self.counts["completed"] += 1
+        self.counts["deadline_missed"] += now > req.deadline
+
+    def snapshot(self):
+        now = time.monotonic()
+        out = {"counts": dict(self.counts),
+               "uptime": now - self.started,
+               "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else None}
+        if self.latencies:
+            p50, p95, p99 = np.percentile(self.latencies, [50, 95, 99])
+            out.update(latency_p50=float(p50), latency_p95=float(p95), latency_p99=float(p99))
+        span = min(RATE_WINDOW_S, now - self.started)
+        recent = [tokens for t, tokens in self.finished if t >= now - span]
+        if span > 0:
+            out.update(requests_per_s=len(recent) / span, tokens_per_s=sum(recent) / span)
+        return out
+
+
+class EdgeServer:
+    def __init__(self, llm, prefix_cache_mb=0, sampler=None, admission=None, batch_window=BATCH_WINDOW_S,
+                 max_batch=MAX_BATCH, max_queue=MAX_QUEUE, response_cache=None):
+        self.llm = llm
+        self.response_cache = response_cache
+        self.prefix_cache = PrefixStateCache(llm, prefix_cache_mb) if prefix_cache_mb else None
+        self.sampler = sampler
+        self.admission = admission
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.queue = BatchQueue(max_queue)
+        self.stats = ServingStats()
+        self.executor = ThreadPoolExecutor(max_workers=1)   # one llama context, one request at a time
+        self.datasets = {}
+        self.loop = None
+        self.worker = None
+        self.server = None
+        self.stopped = None
+
+    def get_item(self, dataset, index):
+        if dataset not in self.datasets:
+            self.datasets[dataset] = load_items(dataset)
+        return self.datasets[dataset][index]
+
+    def health(self):
+        return {"queued": len(self.queue), **self.stats.snapshot(),
+                "prefix_cache": self.prefix_cache.stats() if self.prefix_cache else None,
+                "response_cache": self.response_cache.stats() if self.response_cache else None}
+
+    # === Queue side (event loop) ===
+
+    def make_request(self, req):
+        if "dataset" in req:
+            item = self.get_item(req["dataset"], int(req.get("index", 0)))
+            question, context = item["question"], item["context"]
+        else:
+            question, context = req["question"], req["context"]
+        stream = bool(req.get("stream"))
+        return Request(question, context, int(req["max_tokens"]), float(req.get("deadline_s", DEFAULT_DEADLINE_S)),
+                       stream=stream, metrics_path=req.get("metrics_out"),
+                       timeline_path=sidecar_path(req["outfile"]) if stream and req.get("outfile") else None)
+
+    # Returns (http status, payload)
+    async def submit(self, req):
+        self.stats.counts["received"] += 1
+        if self.response_cache:
+            result = await self.loop.run_in_executor(None, self.response_cache.get,
+                                                     req.question, req.context, req.max_tokens)
+            if result is not None:
+                self.stats.counts["cache_hit"] += 1
+                result["server"] = {"queue_time": 0.0, "request_time": time.monotonic() - req.arrived,
+                                    "batch_size": 0, "degraded": False, "max_tokens": req.max_tokens,
+                                    "deadline_met": time.monotonic() <= req.deadline}
+                self.stats.record(req, result)
+                return 200, result
+        verdict, retry_after = self.admission.check(req) if self.admission else ("admit", 0.0)
+        self.stats.counts[verdict] += 1
+        if verdict == "reject":
+            return 503, {"error": "thermal headroom exhausted", "retry_after": retry_after}
+        req.future = self.loop.create_future()
+        try:
+            self.queue.put(req)
+        except QueueFull as e:
+            self.stats.counts["queue_full"] += 1
+            return 503, {"error": f"queue full: {e}", "retry_after": self.batch_window}
+        return await req.future
+
+    def finish(self, req, code, payload):
+        if not req.future.done():
+            req.future.set_result((code, payload))
+
+    async def run(self):
+        while True:
+            await self.queue.nonempty.wait()
+            # let compatible requests arrive, unless that would cost the head its deadline
+            slack = self.queue.heap[0][0] - time.monotonic()
+            if 0 < self.batch_window < slack:
+                await asyncio.sleep(self.batch_window)
+            for req in self.queue.expired(time.monotonic()):
+                self.stats.counts["expired"] += 1
+                self.finish(req, 504, {"error": "deadline passed while queued"})
+            batch = self.queue.take(self.max_batch)
+            if batch:
+                self.stats.batch_sizes.append(len(batch))
+                try:
+                    await self.loop.run_in_executor(self.executor, self.run_batch, batch)
+                except Exception as e:
+                    # answer whatever the batch left open and keep serving
+                    print(f"Batch of {len(batch)} failed: {e!r}")
+                    for req in batch:
+                        if not req.future.done():
+                            self.stats.counts["failed"] += 1
+                            self.finish(req, 500, {"error": "inference failed"})
+
+    # === Inference side (executor thread) ===
+
+    def trim_context(self, req):
+        if req.ctx_tokens is None:
+            return req.context
+        tokens = self.llm.tokenize(req.context.encode("utf-8"), add_bos=False)
+        if len(tokens) <= req.ctx_tokens:
+            return req.context
+        return self.llm.detokenize(tokens[:req.ctx_tokens]).decode("utf-8", errors="ignore")
+
+    def run_batch(self, batch):
+        context = self.trim_context(batch[0])   # same key, same trimmed context
+        for i, req in enumerate(batch):
+            started = time.monotonic()
+            if started >= req.deadline:
+                self.loop.call_soon_threadsafe(self.stats.counts.update, ["expired"])
+                self.loop.call_soon_threadsafe(self.finish, req, 504, {"error": "deadline passed in batch"})
+                continue
+            result = run_inference(self.llm, req.question, context, req.max_tokens,
+                                   prefix_cache=self.prefix_cache, stream=req.stream,
+                                   timeline_path=req.timeline_path, sampler=self.sampler,
+                                   metrics_path=req.metrics_path)
+            if result is None:
+                self.loop.call_soon_threadsafe(self.stats.counts.update, ["failed"])
+                self.loop.call_soon_threadsafe(self.finish, req, 500, {"error": "inference failed"})
+                continue
+            if self.response_cache:
+                # under the context and length actually used, so a degraded answer only serves its like
+                self.response_cache.put(req.question, context, req.max_tokens, result)
+            result["server"] = {
+                "queue_time": started - req.arrived,
+                "request_time": time.monotonic() - started,
+                "batch_size": len(batch),
+                "batch_index": i,
+                "degraded": req.degraded,
+                "max_tokens": req.max_tokens,
+                "deadline_met": time.monotonic() <= req.deadline,
+            }
+            self.loop.call_soon_threadsafe(self.stats.record, req, result, time.monotonic())
+            self.loop.call_soon_threadsafe(self.finish, req, 200, result)
+
+    # === HTTP ===
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", **self.health()}
+        if method == "POST" and path == "/infer":
+            try:
+                req = self.make_request(json.loads(body or b"{}"))
+            except (KeyError, IndexError, ValueError) as e:
+                return 400, {"error": f"bad request: {e}"}
+            return await self.submit(req)
+        if method == "POST" and path == "/shutdown":
+            self.loop.call_soon(self.stopped.set)
+            return 200, self.health()
+        return 404, {"error": f"unknown path {path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            code, payload = await self.route(method, path, body)
+            print(f"[server] {method} {path} {code}")
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            code, payload = 400, {"error": f"bad request: {e}"}
+        data = json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {code} {HTTPStatus(code).phrase}", "Content-Type: application/json",
+                f"Content-Length: {len(data)}", "Connection: close"]
+        if code == 503:
+            head.append(f"Retry-After: {int(np.ceil(payload.get('retry_after') or 1))}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.worker = asyncio.create_task(self.run())
+        self.server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+        try:
+            await self.stopped.wait()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            self.worker.cancel()
+            self.executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve one LLaMA model to concurrent users with deadlines, "
+                                                 "micro-batching and thermal admission control.")
+    parser.add_argument("--model", default=MODEL_PATH, help="Path to the GGUF model.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--prefix_cache_mb", type=float, default=128,
+                        help="KV states kept for shared contexts (0 = llama.cpp's own prefix reuse only).")
+    parser.add_argument("--safe_temp", type=float, default=SAFE_TEMP_C)
+    parser.add_argument("--batch_window", type=float, default=BATCH_WINDOW_S)
+    parser.add_argument("--max_batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max_queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--telemetry_hz", type=float, default=20,
+                        help="In-process temperature/frequency sampling rate (0 = off).")
+    parser.add_argument("--telemetry_cpu", type=int, default=None)
+    parser.add_argument("--sysfs_root", default="/", help="Root of a real or fake sysfs tree.")
+    parser.add_argument("--response_cache", help="SQLite answer cache shared across restarts (off if unset).")
+    parser.add_argument("--similarity", type=float, default=SIMILARITY,
+                        help="Cosine for a near-duplicate question to hit (1 = exact matches only).")
+    args = parser.parse_args()
+
+    llm = load_model(args.model)
+    if llm is None:
+        raise SystemExit(1)
+    sampler = None
+    if args.telemetry_hz:
+        sampler = TelemetrySampler(hz=args.telemetry_hz, root=args.sysfs_root, cpu=args.telemetry_cpu)
+        sampler.start()
+    admission = AdmissionControl(args.sysfs_root, args.safe_temp, thermal=ThermalModel.load(STATE_FILE))
+    responses = ResponseCache(args.response_cache, args.model, args.similarity) if args.response_cache else None
+    server = EdgeServer(llm, args.prefix_cache_mb, sampler, admission, args.batch_window,
+                        args.max_batch, args.max_queue, responses)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        admission.close()
+        if sampler:
+            sampler.stop()
+        print(json.dumps(server.health(), indent=4))
+        if responses:
+            responses.close()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# Per-query energy from telemetry, and a per-board power model.
+#
+#   P = idle_w + busy_cores * (a * f + b * f^3)     f in GHz
+#
+# Dynamic power goes as f·V² and V rises roughly with f near the top of the
+# DVFS range, hence the f^3 term. The coefficients are least-squares fitted
+# from sweep runs that also logged a power meter (power.csv in the run dir,
+# or a power_W column in metrics.csv); until then the Pi 4 priors are used.
+# A meter log always wins over the model when one covers the run.
+#
+#   python3 energy.py calibrate --base results/sweep
+#   python3 energy.py report --run results/sweep/freq/q3_freq1200_20250101_101500
+import os
+import re
+import glob
+import json
+import argparse
+import itertools
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# === Configuration ===
+POWER_MODEL_FILE = os.path.expanduser("~/.cache/edge_power_model.json")
+PRIOR = {"idle_w": 2.7, "a": 0.35, "b": 0.08}   # Pi 4B, ~6 W with 4 cores busy at 1.5 GHz
+METER_NAME = "power.csv"
+FREQ_COLUMN = re.compile(r"cpu\d+_freq_MHz")
+trapezoid = getattr(np, "trapezoid", None) or np.trapz   # renamed in NumPy 2
+
+
+class PowerModel:
+    def __init__(self, idle_w=PRIOR["idle_w"], a=PRIOR["a"], b=PRIOR["b"], fitted_on=0):
+        self.idle_w, self.a, self.b = idle_w, a, b
+        self.fitted_on = fitted_on   # runs behind the coefficients, 0 = prior
+
+    # Broadcasts over NumPy arrays
+    def power(self, freq_ghz, busy_cores):
+        f = np.asarray(freq_ghz, dtype=float)
+        return self.idle_w + np.asarray(busy_cores, dtype=float) * (self.a * f + self.b * f ** 3)
+
+    # Least squares with every coefficient >= 0: three unknowns, so trying
+    # each subset of active terms is exact and cheaper than a real NNLS
+    @classmethod
+    def fit(cls, freq_ghz, busy_cores, power_w):
+        f, n, p = (np.asarray(v, dtype=float) for v in (freq_ghz, busy_cores, power_w))
+        X = np.column_stack([np.ones_like(f), n * f, n * f ** 3])
+        best, best_err = np.zeros(3), np.inf
+        for k in range(1, 4):
+            for cols in itertools.combinations(range(3), k):
+                coef = np.zeros(3)
+                coef[list(cols)] = np.linalg.lstsq(X[:, cols], p, rcond=None)[0]
+                err = np.sum((X @ coef - p) ** 2)
+                if (coef >= 0).all() and err < best_err:
+                    best, best_err = coef, err
+        return cls(*map(float, best), fitted_on=len(p))
+
+    def as_dict(self):
+        return {"idle_w": self.idle_w, "a": self.a, "b": self.b, "fitted_on": self.fitted_on}
+
+    def save(self, path=POWER_MODEL_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f)
+
+    @classmethod
+    def load(cls, path=POWER_MODEL_FILE):
+        try:
+            with open(path) as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+@lru_cache(maxsize=None)
+def load_power_model(path=POWER_MODEL_FILE):
+    return PowerModel.load(path)
+
+# Anything caching modelled energy keys on this; 0.0 while the prior is in use
+def power_model_mtime(path=POWER_MODEL_FILE):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+# === Meter logs ===
+# CSV with power_W (or voltage_V and current_A) and either "timestamp" in
+# epoch seconds or "time" in seconds since the run started
+
+def read_meter(path):
+    df = pd.read_csv(path)
+    if "power_W" not in df.columns:
+        df["power_W"] = df["voltage_V"] * df["current_A"]
+    return df
+
+def meter_energy(meter, start, end):
+    t = meter["timestamp"] if "timestamp" in meter.columns else meter["time"] + start
+    window = meter[(t >= start) & (t <= end)]
+    if len(window) < 2:
+        return None
+    tw = t[window.index].to_numpy()
+    return float(trapezoid(window["power_W"].to_numpy(), tw) / (tw[-1] - tw[0]) * (end - start))
+
+# === Per-run estimate ===
+
+def config_freq_cores(result):
+    config = result.get("config", {})
+    freq = result.get("cpu_freq_set", config.get("freq_mhz"))
+    cores = result.get("cpu_cores_start", config.get("cores", config.get("n_threads")))
+    return freq, cores
+
+# Model power per telemetry sample: measured frequency and busy cores where
+# the sampler recorded them, the configured ones otherwise
+def sample_power(samples, result, model):
+    freq, cores = config_freq_cores(result)
+    freq_cols = [c for c in samples.columns if FREQ_COLUMN.fullmatch(c)]
+    if freq_cols:
+        f = samples[freq_cols].mean(axis=1).to_numpy() / 1000.0
+    else:
+        f = np.full(len(samples), (freq or 1500) / 1000.0)
+    if "busy_cores" in samples.columns and samples["busy_cores"].notna().any():
+        n = samples["busy_cores"].fillna(samples["busy_cores"].mean()).to_numpy()
+    else:
+        n = np.full(len(samples), cores or 4)
+    return model.power(f, n)
+
+def run_energy(result, samples=None, meter=None, model=None):
+    """Joules for one query; samples is its telemetry frame, meter a read_meter() frame."""
+    model = model or load_power_model()
+    elapsed = result.get("elapsed_time")
+    if not elapsed:
+        return {}
+    joules, source = None, "model"
+    if meter is not None and result.get("started_at") is not None:
+        joules = meter_energy(meter, result["started_at"], result["started_at"] + elapsed)
+        source = "meter"
+    if joules is None and meter is not None and "timestamp" not in meter.columns:
+        joules = meter_energy(meter, 0.0, elapsed)   # logger started with the run
+        source = "meter"
+    if joules is None:
+        source = "model"
+        if samples is not None and len(samples):
+            p = sample_power(samples, result, model)
+            t = samples["time"].to_numpy() if "time" in samples.columns else None
+            mean_p = (trapezoid(p, t) / (t[-1] - t[0])
+                      if t is not None and len(t) > 1 and t[-1] > t[0] else float(np.mean(p)))
+        else:
+            freq, cores = config_freq_cores(result)
+            mean_p = float(model.power((freq or 1500) / 1000.0, cores or 4))
+        joules = float(mean_p) * elapsed
+    tokens = result.get("total_tokens") or 0
+    completion = result.get("completion_tokens") or 0
+    return {"energy_j": joules, "avg_power_w": joules / elapsed,
+            "j_per_token": joules / tokens if tokens else None,
+            "j_per_output_token": joules / completion if completion else None,
+            "energy_source": source}
+
+# A sweep run directory: output.json + metrics.csv (+ power.csv)
+def run_dir_energy(run_dir, result=None, samples=None, model=None):
+    if result is None:
+        with open(os.path.join(run_dir, "output.json")) as f:
+            result = json.load(f)
+    if samples is None:
+        samples = pd.read_csv(os.path.join(run_dir, "metrics.csv"))
+    meter_path = os.path.join(run_dir, METER_NAME)
+    meter = read_meter(meter_path) if os.path.exists(meter_path) else None
+    if meter is None and {"time", "power_W"} <= set(samples.columns):
+        # meter merged into the telemetry: sampler time, re-based to the run start
+        meter = pd.DataFrame({"time": samples["time"] - samples["time"].iloc[0], "power_W": samples["power_W"]})
+    return run_energy(result, samples, meter, model)
+
+# === Calibration from sweep runs that logged a meter ===
+
+def calibration_rows(base_dir):
+    rows = []
+    for run_dir in glob.glob(os.path.join(base_dir, "*", "q*_*")):
+        try:
+            with open(os.path.join(run_dir, "output.json")) as f:
+                result = json.load(f)
+            samples = pd.read_csv(os.path.join(run_dir, "metrics.csv"))
+            measured = run_dir_energy(run_dir, result, samples, PowerModel())
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping {run_dir}: {e}")
+            continue
+        if measured.get("energy_source") != "meter":
+            continue
+        freq, cores = config_freq_cores(result)
+        freq_cols = [c for c in samples.columns if FREQ_COLUMN.fullmatch(c)]
+        f = samples[freq_cols].mean(axis=1).mean() / 1000.0 if freq_cols else (freq or 1500) / 1000.0
+        n = samples["busy_cores"].mean() if "busy_cores" in samples.columns else cores or 4
+        rows.append({"run": run_dir, "freq_ghz": f, "busy_cores": n, "power_w": measured["avg_power_w"]})
+    return pd.DataFrame(rows, columns=["run", "freq_ghz", "busy_cores", "power_w"])
+
+def calibrate(base_dir, path=POWER_MODEL_FILE):
+    rows = calibration_rows(base_dir).dropna()
+    if len(rows) < 3:
+        print(f"Only {len(rows)} metered runs under {base_dir}; keeping {PowerModel.load(path).as_dict()}")
+        return None
+    model = PowerModel.fit(rows["freq_ghz"], rows["busy_cores"], rows["power_w"])
+    pred = model.power(rows["freq_ghz"], rows["busy_cores"])
+    mape = float(np.mean(np.abs(pred - rows["power_w"]) / rows["power_w"]))
+    model.save(path)
+    load_power_model.cache_clear()
+    print(f"Fitted on {len(rows)} runs: {model.as_dict()}, MAPE {mape:.1%} → {path}")
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Energy per query and the board power model.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    cal = sub.add_parser("calibrate", help="Fit the power model from metered sweep runs.")
+    cal.add_argument("--base", required=True, help="Sweep root, <base>/<param>/q*_*/")
+    cal.add_argument("--out", default=POWER_MODEL_FILE)
+    rep = sub.add_parser("report", help="Energy of one run directory.")
+    rep.add_argument("--run", required=True)
+    rep.add_argument("--model", default=POWER_MODEL_FILE)
+    args = parser.parse_args()
+
+    if args.cmd == "calibrate":
+        calibrate(args.base, args.out)
+    else:
+        print(json.dumps(run_dir_energy(args.run, model=PowerModel.load(args.model)), indent=4))
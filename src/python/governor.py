@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+import os
+import glob
+import time
+import errno
+import select
+import ctypes
+import ctypes.util
+import argparse
+from telemetry import SysfsReader, discover_sensors
+from token_timeline import last_token_interval
+from core_control import set_llm_threads
+
+# === Configuration ===
+SYSFS_ROOT  = "/"
+FREQ_HIGH   = 1500  # in MHz
+FREQ_LOW    = 1000
+CORE_FULL   = 4
+CORE_REDUCED = 2
+TICK        = 1.0   # seconds between decisions when the log is quiet
+MIN_DWELL   = 5.0   # seconds a level is held before it may change again
+CONFIRM     = 3     # consecutive identical decisions needed to switch
+DEFAULT_TOKEN_TIME = 0.025
+FREQ_STEPS  = [600, 700, 800, 900, 1000, 1100, 1200, 1300, 1400, 1500]
+DECODE_HOT  = 75.0  # °C: step decode frequency down above this
+DECODE_COOL = 70.0  # °C: and back up towards the decode level below this
+DECODE_EVERY = 8    # tokens between temperature checks while decoding
+DECODE_DWELL = 32   # tokens a decode level is held before it may change again
+TEMP_SUFFIX = "_temp_C"
+FREQ_SENSOR = "cpu0_freq_MHz"
+
+# === Event-driven log tail ===
+IN_MODIFY   = 0x00000002
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC  = 0o2000000
+
+def inotify_watch(path):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(path), IN_MODIFY) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class LogTail:
+    """Yields new complete lines of a growing file, woken by inotify."""
+
+    def __init__(self, path, from_end=True, poll_interval=0.1):
+        self.f = open(path, "r")
+        if from_end:
+            self.f.seek(0, os.SEEK_END)
+        self.partial = ""
+        self.poll_interval = poll_interval
+        self.inotify_fd = inotify_watch(path)
+        self.poller = None
+        if self.inotify_fd is not None:
+            self.poller = select.poll()
+            self.poller.register(self.inotify_fd, select.POLLIN)
+
+    def read_lines(self):
+        data = self.partial + self.f.read()
+        lines = data.split("\n")
+        self.partial = lines.pop()
+        return lines
+
+    # Block until the file changes or `timeout` passes; returns new lines
+    def wait(self, timeout):
+        lines = self.read_lines()
+        if lines:
+            return lines
+        if self.poller is None:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                lines = self.read_lines()
+                if lines:
+                    return lines
+            return []
+        if self.poller.poll(timeout * 1000):
+            try:
+                while os.read(self.inotify_fd, 4096):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+        return self.read_lines()
+
+    def close(self):
+        self.f.close()
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+
+# === Direct, batched sysfs control ===
+
+class CpuControl:
+    def __init__(self, root=SYSFS_ROOT, dry_run=False):
+        self.root = root
+        self.dry_run = dry_run
+        base = os.path.join(root, "sys/devices/system/cpu")
+        self.cpus = sorted(int(os.path.basename(p)[3:]) for p in glob.glob(os.path.join(base, "cpu[0-9]*")))
+        self.base = base
+        self.current = {}   # path -> last value written
+        self.writes = []    # (path, value) log, handy in dry-run
+
+    def _path(self, cpu, name):
+        return os.path.join(self.base, f"cpu{cpu}", name)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _write_all(self, items):
+        for path, value in items:
+            if self.current.get(path) == value:
+                continue
+            self.writes.append((path, value))
+            if self.dry_run:
+                print(f"[DRY-RUN] {value} > {path}")
+            else:
+                try:
+                    with open(path, "w") as f:
+                        f.write(value)
+                except OSError as e:
+                    print(f"[ERROR] write {value} > {path}: {e}")
+                    continue
+            self.current[path] = value
+
+    # One pass over every CPU; only values that changed are written
+    def apply(self, freq_mhz, n_cores):
+        khz = str(freq_mhz * 1000)
+        online = [(self._path(c, "online"), "1" if c < n_cores else "0")
+                  for c in self.cpus if c > 0 and os.path.exists(self._path(c, "online"))]
+        # bring cores up before setting their frequency, take them down last
+        self._write_all([item for item in online if item[1] == "1"])
+        freq = []
+        for c in self.cpus[:max(n_cores, 1)]:
+            lo, hi = self._path(c, "cpufreq/scaling_min_freq"), self._path(c, "cpufreq/scaling_max_freq")
+            if not os.path.exists(hi):
+                continue
+            # keep min <= max at every step
+            old = int(self.current.get(hi) or self._read(hi) or 0)
+            freq += [(hi, khz), (lo, khz)] if int(khz) >= old else [(lo, khz), (hi, khz)]
+        self._write_all(freq)
+        self._write_all([item for item in online if item[1] == "0"])
+
+    def online_cores(self):
+        n = 0
+        for c in self.cpus:
+            path = self._path(c, "online")
+            if c == 0 or not os.path.exists(path):
+                n += 1
+                continue
+            n += self._read(path) == "1"
+        return n
+
+# === Policies ===
+# decide(features) -> (freq_mhz, cores) target, or None to keep the current one.
+# features: token_time, position, prompt_length, prefix_hit, temperature, freq, cores
+# (position, prompt_length and prefix_hit are None until a llama.cpp line arrives)
+
+class ThresholdPolicy:
+    def __init__(self, high=(FREQ_HIGH, CORE_FULL), low=(FREQ_LOW, CORE_REDUCED)):
+        self.high, self.low = high, low
+
+    def latency(self, features):
+        return features["token_time"]
+
+    def decide(self, features):
+        latency, temp = self.latency(features), features["temperature"]
+        if latency > 0.045 or temp > 75:
+            return self.low
+        if latency < 0.035 and temp < 70:
+            return self.high
+        return None
+
+
+class PredictorPolicy(ThresholdPolicy):
+    # Thresholds applied to the sklearn model's predicted token latency
+    FEATURES = ["token_time", "position", "prompt_length", "prefix_hit", "temperature", "freq", "cores"]
+
+    def __init__(self, model_path, **kwargs):
+        super().__init__(**kwargs)
+        import joblib
+        self.predictor = joblib.load(model_path)
+
+    def decide(self, features):
+        # no llama.cpp line yet: nothing like what the model was trained on
+        if features["position"] is None:
+            return None
+        return super().decide(features)
+
+    def latency(self, features):
+        return self.predictor.predict([[features[k] for k in self.FEATURES]])[0]
+
+
+class PIDPolicy:
+    # PID on temperature; the output picks one of the frequency levels
+    def __init__(self, setpoint=70.0, kp=0.15, ki=0.01, kd=0.05,
+                 levels=(600, 800, 1000, 1200, 1500), cores=CORE_FULL):
+        self.setpoint, self.kp, self.ki, self.kd = setpoint, kp, ki, kd
+        self.levels = sorted(levels)
+        self.cores = cores
+        self.integral = 0.0
+        self.prev_error = None
+        self.prev_t = None
+
+    def decide(self, features):
+        now = features.get("now", time.monotonic())
+        error = self.setpoint - features["temperature"]   # positive = headroom
+        dt = now - self.prev_t if self.prev_t is not None else 0.0
+        if dt > 0:
+            self.integral = max(-50.0, min(50.0, self.integral + error * dt))
+        deriv = (error - self.prev_error) / dt if dt > 0 and self.prev_error is not None else 0.0
+        self.prev_error, self.prev_t = error, now
+        u = self.kp * error + self.ki * self.integral + self.kd * deriv
+        # u in [-1, 1] spans the level list around the middle
+        u = max(-1.0, min(1.0, u))
+        idx = round((u + 1) / 2 * (len(self.levels) - 1))
+        return self.levels[idx], self.cores
+
+# === Hysteresis / rate limit ===
+
+class Hysteresis:
+    def __init__(self, confirm=CONFIRM, min_dwell=MIN_DWELL):
+        self.confirm = confirm
+        self.min_dwell = min_dwell
+        self.current = None
+        self.candidate = None
+        self.streak = 0
+        self.last_change = -float("inf")
+
+    # Returns the target to apply now, or None
+    def filter(self, target, now):
+        if target is None or target == self.current:
+            self.candidate, self.streak = None, 0
+            return None
+        if target == self.candidate:
+            self.streak += 1
+        else:
+            self.candidate, self.streak = target, 1
+        if self.current is not None and (self.streak < self.confirm or now - self.last_change < self.min_dwell):
+            return None
+        self.current, self.last_change = target, now
+        self.candidate, self.streak = None, 0
+        return target
+
+# === Governor ===
+
+def parse_line(line):
+    # llama.cpp verbose log: "Llama.generate: N prefix-match hit, ..." / "... ctx N ..."
+    prefix_hit, position = 0, 0
+    try:
+        if "prefix-match" in line:
+            prefix_hit = int(line.split("Llama.generate: ")[1].split()[0])
+        if "ctx " in line:
+            position = int(line.split("ctx ")[1].split()[0])
+    except (IndexError, ValueError):
+        pass
+    return prefix_hit, position
+
+
+# First thermal zone, then cpu0 frequency. Either may be missing (no
+# thermal zone on some boards and containers), so read them by name.
+def control_sensors(root=SYSFS_ROOT, temperature_only=False):
+    sensors = discover_sensors(root)
+    temp = [s for s in sensors if s[0].endswith(TEMP_SUFFIX)][:1]
+    if temperature_only:
+        return temp
+    return temp + [s for s in sensors if s[0] == FREQ_SENSOR]
+
+# The predictor was trained on psutil's physical core count; keep that
+# meaning, falling back to the online count without psutil
+def physical_cores(control):
+    try:
+        import psutil
+        return psutil.cpu_count(logical=False) or control.online_cores()
+    except ImportError:
+        return control.online_cores()
+
+def sensor_temperature(readings, missing=float("nan")):
+    return next((v for name, v in readings.items() if name.endswith(TEMP_SUFFIX)), missing)
+
+
+class Governor:
+    def __init__(self, policy, control, root=SYSFS_ROOT, hysteresis=None, timeline_glob=None):
+        self.policy = policy
+        self.control = control
+        self.hysteresis = hysteresis or Hysteresis()
+        self.timeline_glob = timeline_glob
+        self.reader = SysfsReader(control_sensors(root))
+        self.last_line = None   # latest prefix-match line; timer ticks reuse it
+        self.decisions = 0
+        self.changes = []
+
+    def token_time(self):
+        if not self.timeline_glob:
+            return DEFAULT_TOKEN_TIME
+        timelines = glob.glob(self.timeline_glob)
+        if not timelines:
+            return DEFAULT_TOKEN_TIME
+        gap = last_token_interval(max(timelines, key=os.path.getmtime))
+        return gap if gap is not None else DEFAULT_TOKEN_TIME
+
+    def features(self, line=None, now=None):
+        line = self.last_line if line is None else line
+        prefix_hit, position = parse_line(line) if line is not None else (None, None)
+        readings = self.reader.read()
+        return {
+            "token_time": self.token_time(),
+            "position": position,
+            "prompt_length": position,  # crude fallback, as before
+            "prefix_hit": prefix_hit,
+            "temperature": sensor_temperature(readings, 0.0),   # no sensor: never the reason to slow down
+            "freq": readings.get(FREQ_SENSOR, 0.0),
+            "cores": physical_cores(self.control),
+            "now": time.monotonic() if now is None else now,
+        }
+
+    def step(self, line=None, now=None):
+        if line is not None:
+            self.last_line = line
+        features = self.features(now=now)
+        self.decisions += 1
+        target = self.hysteresis.filter(self.policy.decide(features), features["now"])
+        if target is not None:
+            freq, cores = target
+            print(f"[CONTROL] temp {features['temperature']:.1f}C, token {features['token_time']*1000:.1f}ms "
+                  f"-> {freq} MHz, {cores} cores")
+            self.control.apply(freq, cores)
+            self.changes.append((features["now"], freq, cores))
+        return target
+
+    def run(self, log_path=None, tick=TICK, max_steps=None):
+        tail = LogTail(log_path) if log_path else None
+        try:
+            while max_steps is None or self.decisions < max_steps:
+                lines = tail.wait(tick) if tail else (time.sleep(tick) or [])
+                # the baseline decided on prefix-match lines; ticks re-read sensors only
+                relevant = [l for l in lines if "prefix-match" in l]
+                self.step(relevant[-1] if relevant else None)
+        finally:
+            if tail:
+                tail.close()
+            self.reader.close()
+
+
+# === Per-token control ===
+
+class DecodeController:
+    """Steps frequency and threads between the tokens of one generation.
+
+    The prompt is evaluated at `prompt` (freq_mhz, cores) and decode runs at
+    `decode`; while decoding the frequency drops one step whenever the
+    temperature passes `hot` and climbs back, never above the decode level,
+    once it is under `cool`. Every change is logged on the token timeline.
+    """
+
+    def __init__(self, control, prompt=(FREQ_HIGH, CORE_FULL), decode=(FREQ_LOW, CORE_FULL),
+                 root=SYSFS_ROOT, hot=DECODE_HOT, cool=DECODE_COOL, every=DECODE_EVERY,
+                 dwell=DECODE_DWELL, steps=FREQ_STEPS):
+        self.control = control
+        self.prompt, self.decode = prompt, decode
+        self.hot, self.cool = hot, cool
+        self.every, self.dwell = every, dwell
+        self.steps = sorted(steps)
+        # no thermal zone: the temperature stays NaN and never steps decode down
+        self.reader = SysfsReader(control_sensors(root, temperature_only=True))
+        self.temp = [float("nan")]
+        self.changes = []   # (phase, token, freq, cores) across every generation
+
+    def temperature(self):
+        self.reader.read_into(self.temp)
+        return self.temp[0]
+
+    def apply(self, llm, timeline, phase, freq, cores):
+        temp = self.temperature()
+        self.control.apply(freq, cores)
+        if cores != self.level[1] and llm is not None:
+            set_llm_threads(llm, cores)
+        self.level, self.since = (freq, cores), len(timeline.times)
+        timeline.event(phase=phase, freq_mhz=freq, cores=cores, temp=None if temp != temp else temp)
+        self.changes.append((phase, self.since, freq, cores))
+
+    # Before the prompt is evaluated
+    def begin(self, llm, timeline):
+        self.level = (None, getattr(llm, "n_threads", None))
+        self.phase = "prompt"
+        self.apply(llm, timeline, "prompt", *self.prompt)
+
+    # After each token has been marked on the timeline
+    def step(self, llm, timeline):
+        n = len(timeline.times)
+        if self.phase == "prompt":
+            self.phase = "decode"
+            if self.decode != self.level:
+                self.apply(llm, timeline, "decode", *self.decode)
+            return
+        if n % self.every or n - self.since < self.dwell:
+            return
+        freq, cores = self.level
+        temp = self.temperature()
+        lower = [f for f in self.steps if f < freq]
+        higher = [f for f in self.steps if freq < f <= self.decode[0]]
+        if temp > self.hot and lower:
+            self.apply(llm, timeline, "thermal", lower[-1], cores)
+        elif temp < self.cool and higher:
+            self.apply(llm, timeline, "recover", higher[0], cores)
+
+    def close(self):
+        self.reader.close()
+
+
+def make_policy(name, model_path=None):
+    if name == "threshold":
+        return ThresholdPolicy()
+    if name == "predictor":
+        return PredictorPolicy(model_path)
+    if name == "pid":
+        return PIDPolicy()
+    raise ValueError(f"unknown policy {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Closed-loop CPU frequency/core governor.")
+    parser.add_argument("--log", help="llama.cpp log to tail (decisions run on a timer without it).")
+    parser.add_argument("--policy", choices=["threshold", "predictor", "pid"], default="threshold")
+    parser.add_argument("--model", default="cpu_predictor.pkl", help="sklearn model for --policy predictor.")
+    parser.add_argument("--timeline_glob", help="Token timeline sidecars to read token latency from.")
+    parser.add_argument("--sysfs_root", default=SYSFS_ROOT, help="Root of a real or fake sysfs tree.")
+    parser.add_argument("--dry_run", action="store_true", help="Log sysfs writes instead of making them.")
+    parser.add_argument("--tick", type=float, default=TICK)
+    parser.add_argument("--min_dwell", type=float, default=MIN_DWELL)
+    parser.add_argument("--confirm", type=int, default=CONFIRM)
+    parser.add_argument("--max_steps", type=int)
+    args = parser.parse_args()
+
+    governor = Governor(make_policy(args.policy, args.model),
+                        CpuControl(args.sysfs_root, dry_run=args.dry_run),
+                        root=args.sysfs_root,
+                        hysteresis=Hysteresis(args.confirm, args.min_dwell),
+                        timeline_glob=args.timeline_glob)
+    try:
+        governor.run(args.log, args.tick, args.max_steps)
+    except KeyboardInterrupt:
+        pass
+    print(f"{governor.decisions} decisions, {len(governor.changes)} changes")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.request
+import urllib.error
+
+# === Configuration ===
+HOST = "127.0.0.1"
+PORT = 8765
+
+def request(url, payload=None, timeout=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.load(resp)
+
+def wait_for_server(base_url, timeout):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return request(f"{base_url}/health", timeout=5)
+        except (urllib.error.URLError, ConnectionError):
+            if time.time() > deadline:
+                raise
+            time.sleep(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thin client for model_server.py and edge_server.py.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--wait", type=float, default=0, help="Seconds to wait for the server to come up.")
+    parser.add_argument("--stats", action="store_true", help="Print server timing stats and exit.")
+    parser.add_argument("--shutdown", action="store_true", help="Stop the server and print its final stats.")
+    parser.add_argument("--max_tokens", type=int, help="Maximum number of tokens to generate.")
+    parser.add_argument("--question")
+    parser.add_argument("--context")
+    parser.add_argument("--dataset", help="JSON dataset path on the server, or 'squad' for the HF validation split.")
+    parser.add_argument("--index", type=int, default=0)
+    parser.add_argument("--outfile", help="Where to write the result JSON.")
+    parser.add_argument("--metrics_out", help="Where the server writes this request's telemetry CSV.")
+    parser.add_argument("--deadline", type=float,
+                        help="Seconds the answer is still useful for (edge_server.py queues by deadline).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream tokens; the per-token timeline is written next to --outfile.")
+    args = parser.parse_args()
+
+    base_url = f"http://{args.host}:{args.port}"
+    if args.wait:
+        wait_for_server(base_url, args.wait)
+
+    if args.stats or args.shutdown:
+        stats = request(f"{base_url}/shutdown" if args.shutdown else f"{base_url}/health",
+                        payload={} if args.shutdown else None)
+        print(json.dumps(stats, indent=4))
+        sys.exit(0)
+
+    if args.max_tokens is None:
+        if args.wait:
+            sys.exit(0)
+        parser.error("--max_tokens is required for inference")
+
+    payload = {"max_tokens": args.max_tokens}
+    if args.dataset:
+        payload.update(dataset=args.dataset, index=args.index)
+    elif args.question is not None and args.context is not None:
+        payload.update(question=args.question, context=args.context)
+    else:
+        parser.error("give either --dataset/--index or --question/--context")
+    if args.deadline is not None:
+        payload["deadline_s"] = args.deadline
+    if args.metrics_out:
+        payload["metrics_out"] = os.path.abspath(args.metrics_out)
+    if args.stream:
+        payload["stream"] = True
+        if args.outfile:
+            payload["outfile"] = os.path.abspath(args.outfile)
+
+    try:
+        result = request(f"{base_url}/infer", payload)
+    except urllib.error.HTTPError as e:
+        print(f"Server error: {e.code} {e.read().decode()}")
+        sys.exit(1)
+
+    timing = result.get("server", {})
+    print(f"Cold load {timing.get('cold_load_time', 0):.2f}s (paid once) | "
+          f"request {timing.get('request_time', 0):.2f}s")
+    if result.get("ttft") is not None:
+        print(f"TTFT {result['ttft']:.2f}s | decode {result['decode_time']:.2f}s "
+              f"over {result['completion_tokens']} tokens")
+    if args.outfile:
+        with open(args.outfile, "w") as f:
+            json.dump(result, f, indent=4)
+        print(f"Results saved to {args.outfile}")
+    else:
+        print(json.dumps(result, indent=4))
@@ -2,8 +2,11 @@ import time
 import json
 import psutil
 import argparse
-from datasets import load_dataset
+import pandas as pd
 from llama_cpp import Llama
+from prefix_cache import split_prompt
+from token_timeline import TokenTimeline, sidecar_path
+from energy import run_energy
 
 def get_cpu_metrics():
     try:
@@ -14,29 +17,62 @@ def get_cpu_metrics():
         print(f"Error reading CPU metrics: {e}")
         return None, None
 
-def load_model(model_path):
+def load_model(model_path, **kwargs):
     print("Loading the model...")
     try:
-        llm = Llama(model_path=model_path)
+        # mmap the GGUF so the weights stay in the page cache between loads
+        llm = Llama(model_path=model_path, use_mmap=True, **kwargs)
         print("Model Loaded Successfully")
         return llm
     except Exception as e:
         print(f"Error loading the model: {e}")
         return None
 
-def run_inference(llm, question, context, max_tokens):
+# Yield generated text as llama.cpp produces it, marking each token's arrival
+def stream_tokens(llm, prompt, max_tokens, timeline, controller=None):
+    # the controller (governor.DecodeController) may retune between tokens
+    if controller:
+        controller.begin(llm, timeline)
+    for chunk in llm(prompt, echo=False, max_tokens=max_tokens, stream=True):
+        timeline.mark()
+        if controller:
+            controller.step(llm, timeline)
+        yield chunk['choices'][0]['text']
+
+def run_inference(llm, question, context, max_tokens, prefix_cache=None, stream=False, timeline_path=None,
+                  sampler=None, metrics_path=None, controller=None):
     temp_before, freq_before = get_cpu_metrics()
+    mark = sampler.count if sampler else 0
     start_time = time.time()
+    stream = stream or controller is not None   # per-token control needs the token loop
+    timeline = None
+    # speculative instances (speculative.py) count what their drafter got accepted
+    drafter = getattr(llm, "draft_model", None)
+    draft_mark = drafter.mark() if hasattr(drafter, "mark") else None
 
     try:
-        prompt = f"Context: {context}\nQuestion: {question}\nAnswer:"
-        output = llm(prompt, echo=False, max_tokens=max_tokens)
+        prefix, prompt = split_prompt(context, question)
+        prefix_stats = {}
+        if prefix_cache:
+            t0 = time.time()
+            prefix_stats = prefix_cache.prepare(prefix, prompt)
+            prefix_stats["prefix_prepare_time"] = time.time() - t0
+        if stream:
+            # started after the prefix restore, so TTFT is this prompt's eval alone
+            timeline = TokenTimeline(timeline_path)
+            generated_text = "".join(stream_tokens(llm, prompt, max_tokens, timeline, controller))
+            # a stream chunk can carry several tokens (speculative runs, merged UTF-8 pieces)
+            completion_tokens = len(llm.tokenize(generated_text.encode("utf-8"), add_bos=False))
+            total_tokens = len(llm.tokenize(prompt.encode("utf-8"))) + completion_tokens
+            generated_text = generated_text.strip()
+        else:
+            output = llm(prompt, echo=False, max_tokens=max_tokens)
+            total_tokens = output.get('usage', {}).get('total_tokens', 0)
+            completion_tokens = output.get('usage', {}).get('completion_tokens', 0)
+            generated_text = output['choices'][0]['text'].strip()
         elapsed_time = time.time() - start_time
-        total_tokens = output.get('usage', {}).get('total_tokens', 0)
-        completion_tokens = output.get('usage', {}).get('completion_tokens', 0)
         token_rate = total_tokens / elapsed_time if elapsed_time > 0 else 0
         temp_after, freq_after = get_cpu_metrics()
-        generated_text = output['choices'][0]['text'].strip()
 
         # Output results
         result_data = {
@@ -51,24 +87,43 @@ def run_inference(llm, question, context, max_tokens):
             "cpu_freq_before": freq_before,
             "cpu_freq_after": freq_after,
             "response": generated_text,
-            "max_tokens": max_tokens
+            "max_tokens": max_tokens,
+            "started_at": start_time,
+            **prefix_stats
         }
+        if stream:
+            # TTFT / prompt-eval / decode split; per-token times go to the sidecar
+            result_data.update(timeline.summary(), token_timeline=timeline_path)
+        if draft_mark is not None:
+            result_data["speculative"] = drafter.report(draft_mark, result_data)
+        if sampler:
+            # high-rate samples taken during this request, from the in-process sampler
+            result_data["telemetry"] = sampler.summary(mark)
+            samples = dict(zip(sampler.columns, sampler.samples(mark).T))
+            result_data["energy"] = run_energy(result_data, pd.DataFrame(samples))
+            if metrics_path:
+                result_data["metrics_file"] = sampler.dump(metrics_path, mark)
 
         return result_data
 
     except Exception as e:
         print(f"Error during inference: {e}")
         return None
+    finally:
+        if timeline:
+            timeline.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run inference with LLaMA model.")
     parser.add_argument("--max_tokens", type=int, required=True, help="Maximum number of tokens to generate.")
+    parser.add_argument("--stream", action="store_true", help="Stream tokens and record a per-token timeline.")
     args = parser.parse_args()
 
     MODEL_PATH = "/home/rise/Downloads/llama-2-7b-chat.Q4_0.gguf"
     llm = load_model(MODEL_PATH)
 
-    # Load SQuAD dataset
+    # Load SQuAD dataset; imported here so servers and runners don't need `datasets`
+    from datasets import load_dataset
     print("Loading SQuAD dataset...")
     squad_dataset = load_dataset("squad")["validation"]
     first_sample = squad_dataset[0]  # Get the first sample
@@ -76,12 +131,13 @@ if __name__ == "__main__":
     question = first_sample["question"]
     context = first_sample["context"]
     print(f"\n{'='*60}\nRunning inference on the first SQuAD sample\n{'='*60}")
-    result = run_inference(llm, question, context, args.max_tokens)
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    output_file = f"/home/rise/models/scripts/python/exp0703/results/MT/llama7b_output_{args.max_tokens}_max_tokens_{timestamp}.json"
+    result = run_inference(llm, question, context, args.max_tokens, stream=args.stream,
+                           timeline_path=sidecar_path(output_file) if args.stream else None)
 
     if result:
         # Save the result to a JSON file
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        output_file = f"/home/rise/models/scripts/python/exp0703/results/MT/llama7b_output_{args.max_tokens}_max_tokens_{timestamp}.json"
         with open(output_file, "w") as f:
             json.dump(result, f, indent=4)
         print(f"Results saved to {output_file}")
\ No newline at end of file
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from llama_cpp import Llama
+
+# === Configuration ===
+CTX_BUCKETS   = [1024, 2048, 4096]
+RAM_BUDGET_MB = 2048   # anonymous memory (KV cache + compute buffers) across instances
+
+# /proc/self/status fields in MB; RssFile is the mmapped weights, shared by
+# every instance through the page cache, RssAnon is what each instance adds
+def memory_status():
+    out = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM", "RssAnon", "RssFile"):
+                out[key] = int(value.split()[0]) / 1024.0
+    return out
+
+# Restart VmHWM so the next read is the peak of what ran in between
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class PooledModel:
+    def __init__(self, llm, n_ctx, anon_mb, load_time):
+        self.llm = llm
+        self.n_ctx = n_ctx
+        self.anon_mb = anon_mb
+        self.load_time = load_time
+        self.prefix_cache = None   # per-instance KV states, dropped with the instance
+
+
+class ModelPool:
+    """One Llama per n_ctx bucket over the same mmapped GGUF, LRU-evicted to a RAM budget."""
+
+    def __init__(self, model_path, ctx_buckets=CTX_BUCKETS, ram_budget_mb=RAM_BUDGET_MB, **llama_kwargs):
+        self.model_path = model_path
+        self.buckets = sorted(ctx_buckets)
+        self.ram_budget_mb = ram_budget_mb
+        self.llama_kwargs = llama_kwargs
+        self.models = OrderedDict()   # bucket -> PooledModel
+        self.loads = 0
+        self.evictions = 0
+
+    def bucket(self, n_ctx):
+        for b in self.buckets:
+            if n_ctx <= b:
+                return b
+        return self.buckets[-1]
+
+    def used_mb(self):
+        return sum(m.anon_mb for m in self.models.values())
+
+    def _evict_for(self, needed_mb):
+        # always keep room for at least the instance being loaded
+        while self.models and self.used_mb() + needed_mb > self.ram_budget_mb:
+            bucket, model = self.models.popitem(last=False)
+            print(f"Evicting n_ctx={bucket} instance ({model.anon_mb:.0f} MB)")
+            self.evictions += 1
+
+    def get(self, n_ctx):
+        bucket = self.bucket(n_ctx)
+        if bucket in self.models:
+            self.models.move_to_end(bucket)
+            return self.models[bucket]
+
+        # size the new instance from one already loaded, scaled by context
+        if self.models:
+            ref = next(iter(self.models.values()))
+            self._evict_for(ref.anon_mb * bucket / ref.n_ctx)
+
+        before = memory_status().get("RssAnon", 0.0)
+        t0 = time.time()
+        llm = Llama(model_path=self.model_path, n_ctx=bucket, use_mmap=True, **self.llama_kwargs)
+        load_time = time.time() - t0
+        anon_mb = memory_status().get("RssAnon", 0.0) - before
+        self.loads += 1
+        print(f"Loaded n_ctx={bucket} instance in {load_time:.2f}s (+{anon_mb:.0f} MB anon)")
+
+        model = PooledModel(llm, bucket, max(anon_mb, 0.0), load_time)
+        self.models[bucket] = model
+        return model
+
+    def stats(self):
+        return {"instances": list(self.models), "anon_mb": self.used_mb(),
+                "loads": self.loads, "evictions": self.evictions, **memory_status()}
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from model_mt import load_model, run_inference
+from prefix_cache import PrefixStateCache
+from token_timeline import sidecar_path
+from telemetry import TelemetrySampler
+
+# === Configuration ===
+MODEL_PATH = "/home/rise/Downloads/llama-2-7b-chat.Q4_0.gguf"
+HOST = "127.0.0.1"
+PORT = 8765
+
+# Datasets are loaded once per server, like the model
+def load_items(dataset):
+    if dataset == "squad":
+        from datasets import load_dataset
+        return load_dataset("squad")["validation"]
+    with open(dataset) as f:
+        return json.load(f)
+
+
+class ModelServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, model_path, prefix_cache_mb=0, telemetry_hz=0, telemetry_cpu=None,
+                 sysfs_root="/"):
+        t0 = time.time()
+        self.llm = load_model(model_path)
+        self.cold_load_time = time.time() - t0
+        if self.llm is None:
+            raise RuntimeError(f"could not load {model_path}")
+        print(f"Cold load took {self.cold_load_time:.2f}s")
+
+        self.model_path = model_path
+        self.prefix_cache = PrefixStateCache(self.llm, prefix_cache_mb) if prefix_cache_mb else None
+        self.lock = threading.Lock()   # one llama context, one request at a time
+        self.sampler = None
+        if telemetry_hz:
+            self.sampler = TelemetrySampler(hz=telemetry_hz, root=sysfs_root, cpu=telemetry_cpu)
+            self.sampler.start()
+        self.datasets = {}
+        self.datasets_lock = threading.Lock()   # first requests for a dataset parse it once
+        self.requests_served = 0
+        self.total_request_time = 0.0
+        super().__init__(address, InferenceHandler)
+
+    def get_item(self, dataset, index):
+        with self.datasets_lock:
+            if dataset not in self.datasets:
+                self.datasets[dataset] = load_items(dataset)
+            items = self.datasets[dataset]
+        return items[index]
+
+    def stats(self):
+        n = self.requests_served
+        mean = self.total_request_time / n if n else 0.0
+        return {
+            "model_path": self.model_path,
+            "cold_load_time": self.cold_load_time,
+            "requests_served": n,
+            "total_request_time": self.total_request_time,
+            "mean_request_time": mean,
+            # what one-process-per-query would have paid on top
+            "load_time_saved": self.cold_load_time * max(n - 1, 0),
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache else None,
+        }
+
+    def infer(self, req):
+        if "dataset" in req:
+            item = self.get_item(req["dataset"], int(req.get("index", 0)))
+            question, context = item["question"], item["context"]
+        else:
+            question, context = req["question"], req["context"]
+
+        # streamed requests write their token timeline next to the client's outfile
+        stream = bool(req.get("stream"))
+        timeline_path = sidecar_path(req["outfile"]) if stream and req.get("outfile") else None
+
+        with self.lock:
+            t0 = time.time()
+            result = run_inference(self.llm, question, context, int(req["max_tokens"]),
+                                   prefix_cache=self.prefix_cache, stream=stream,
+                                   timeline_path=timeline_path, sampler=self.sampler,
+                                   metrics_path=req.get("metrics_out"))
+            request_time = time.time() - t0
+            self.requests_served += 1
+            self.total_request_time += request_time
+            index = self.requests_served
+
+        if result is not None:
+            if "dataset" in req:
+                result["index"] = req.get("index", 0)
+                result["ground_truth"] = item.get("answer", item.get("answers", "N/A"))
+            result["server"] = {
+                "cold_load_time": self.cold_load_time,
+                "request_time": request_time,
+                "request_index": index,
+            }
+        return result
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    def send_json(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", **self.server.stats()})
+        else:
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self.send_json(400, {"error": f"bad request body: {e}"})
+            return
+
+        if self.path == "/infer":
+            try:
+                result = self.server.infer(req)
+            except (KeyError, IndexError, ValueError) as e:
+                self.send_json(400, {"error": f"bad request: {e}"})
+                return
+            if result is None:
+                self.send_json(500, {"error": "inference failed"})
+            else:
+                self.send_json(200, result)
+        elif self.path == "/shutdown":
+            self.send_json(200, self.server.stats())
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+
+    def log_message(self, fmt, *args):
+        print(f"[server] {self.address_string()} {fmt % args}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a LLaMA model loaded once over localhost HTTP.")
+    parser.add_argument("--model", default=MODEL_PATH, help="Path to the GGUF model.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--prefix_cache_mb", type=float, default=0,
+                        help="Reuse context KV state across requests within this budget (0 = off).")
+    parser.add_argument("--telemetry_hz", type=float, default=20,
+                        help="In-process temperature/frequency sampling rate (0 = off).")
+    parser.add_argument("--telemetry_cpu", type=int, default=None,
+                        help="CPU to pin the sampler to, away from the inference cores.")
+    parser.add_argument("--sysfs_root", default="/", help="Root of a real or fake sysfs tree.")
+    args = parser.parse_args()
+
+    server = ModelServer((args.host, args.port), args.model, args.prefix_cache_mb,
+                         args.telemetry_hz, args.telemetry_cpu, args.sysfs_root)
+    print(f"Serving {args.model} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if server.sampler:
+            server.sampler.stop()
+        print(json.dumps(server.stats(), indent=4))
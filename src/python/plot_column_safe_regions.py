@@ -1,90 +1,112 @@
 import os
-import glob
-import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")   # no display needed, and safe in worker processes
 import seaborn as sns
 import matplotlib.pyplot as plt
+from sweep_loader import load_sweep
+from config_space import SAFE_TEMP_C, MAX_RUNTIME_OVERSHOOT
 
 sns.set(style="whitegrid")
 
-def collect_query_data(base_dir, param):
-    data = []
-    search_path = f"{base_dir}/{param}/q*_*/output.json"
-    for json_path in glob.glob(search_path):
-        try:
-            with open(json_path) as f:
-                j = json.load(f)
-
-            parent_dir = os.path.basename(os.path.dirname(json_path))
-            query_str = parent_dir.split('_')[0]
-            query_id = int(query_str.replace("q", ""))
-
-            metrics_path = json_path.replace("output.json", "metrics.csv")
-            if not os.path.exists(metrics_path):
-                continue
-            df = pd.read_csv(metrics_path)
-
-            temp_candidates = ["cpu_temp_C", "CPU_Temperature", "cpu_temp"]
-            temp_col = next((col for col in temp_candidates if col in df.columns), None)
-            if temp_col is None:
-                continue
-
-            avg_temp = df[temp_col].mean()
-
-            param_value = None
-            if param == "freq":
-                param_value = j.get("cpu_freq_set")
-            elif param == "core":
-                param_value = j.get("cpu_cores_start")
-            elif param == "ctx":
-                param_value = j.get("n_ctx")
-            if param_value is None:
-                continue
-
-            data.append({
-                "query": query_id,
-                "param_value": param_value,
-                "latency": j.get("elapsed_time"),
-                "avg_temp": avg_temp
-            })
-
-        except Exception as e:
-            print(f"Skipping {json_path}: {e}")
-    return pd.DataFrame(data)
-
-
-def plot_safe_region(ax1, ax2, df_q, baseline_latency):
-    min_val = df_q[df_q["avg_temp"] <= 77]["param_value"].min()
-    max_val = df_q[df_q["latency"] <= 1.10 * baseline_latency]["param_value"].max()
-
-    if pd.notna(min_val) and pd.notna(max_val) and min_val < max_val:
-        ax1.axvspan(min_val, max_val, color='gray', alpha=0.2, label="Safe Region")
-        ax1.axvline(min_val, linestyle='--', color='gray')
-        ax1.axvline(max_val, linestyle='--', color='gray')
-        ax2.axvline(min_val, linestyle='--', color='gray')
-        ax2.axvline(max_val, linestyle='--', color='gray')
-        return min_val, max_val
-    return None, None
-
-
-def composite_plot_per_query(query_id, df_freq, df_ctx, df_core, out_dir):
-    fig, axs = plt.subplots(3, 1, figsize=(8, 12), sharex=False)
-    param_info = [("freq", df_freq, 1500), ("ctx", df_ctx, 4096), ("core", df_core, 4)]
+PLOT_COLUMNS = ["query", "param_value", "latency", "avg_temp", "energy_j", "j_per_token"]
+PARAMS = ["freq", "ctx", "core"]
+BASELINES = {"freq": 1500, "ctx": 4096, "core": 4}
+
+# Parallel, cached, one row per query/value (repeats averaged) via sweep_loader
+def collect_query_data(base_dir, param, columns=PLOT_COLUMNS):
+    return load_sweep(base_dir, param)[columns]
+
+# === Analysis: every query and parameter in one grouped pass ===
+
+def analyze(dfs, safe_temp=SAFE_TEMP_C, overshoot=MAX_RUNTIME_OVERSHOOT):
+    """Per-point flags and a one-row-per-(param, query) summary.
+
+    dfs maps param -> collect_query_data() frame; params without runs are
+    skipped. A point is a candidate when
+    it is both cool enough and within the latency overshoot of that query's
+    baseline; the safe region is [min cool value, max fast-enough value].
+    """
+    points = pd.concat([df.assign(param=p) for p, df in dfs.items() if not df.empty], ignore_index=True)
+    points["baseline_value"] = points["param"].map(BASELINES)
+    keys = ["param", "query"]
+
+    base = points[points["param_value"] == points["baseline_value"]]
+    base = base.groupby(keys)["latency"].first().rename("baseline_latency")
+    # queries without a baseline run have no reference and are left out, as before
+    points = points.join(base, on=keys, how="inner")
+
+    points["temp_ok"] = points["avg_temp"] <= safe_temp
+    points["latency_ok"] = points["latency"] <= (1 + overshoot) * points["baseline_latency"]
+    points["candidate"] = points["temp_ok"] & points["latency_ok"]
+
+    # Pareto front (both minimized): sorted by latency, a point is on the
+    # front when it is cooler than everything faster in its group
+    points = points.sort_values(keys + ["latency", "avg_temp"]).reset_index(drop=True)
+    points["coolest"] = points.groupby(keys)["avg_temp"].cummin()
+    coolest_before = points.groupby(keys)["coolest"].shift(fill_value=np.inf)
+    points["pareto"] = points["avg_temp"] < coolest_before
+
+    g = points.groupby(keys)
+    summary = pd.DataFrame({
+        "baseline_latency": g["baseline_latency"].first(),
+        "points": g.size(),
+        "min_val": points[points["temp_ok"]].groupby(keys)["param_value"].min(),
+        "max_val": points[points["latency_ok"]].groupby(keys)["param_value"].max(),
+        "pareto_values": points[points["pareto"]].groupby(keys)["param_value"].agg(lambda v: sorted(v.tolist())),
+    })
+    summary["has_region"] = summary["min_val"] < summary["max_val"]
+
+    cand = points[points["candidate"]].copy()
+    cols = keys + ["param_value", "latency", "avg_temp", "energy_j", "j_per_token"]
+    best_temp = cand.loc[cand.groupby(keys)["avg_temp"].idxmin(), cols]
+    best_lat = cand.loc[cand.groupby(keys)["latency"].idxmin(), cols]
+    metered = cand.dropna(subset=["energy_j"])
+    best_energy = metered.loc[metered.groupby(keys)["energy_j"].idxmin(), cols]
+
+    # Recommendation: knee of the candidate set, closest to the (fastest,
+    # coolest) corner after min-max normalizing within the group
+    cg = cand.groupby(keys)
+    for col in ("latency", "avg_temp"):
+        lo, hi = cg[col].transform("min"), cg[col].transform("max")
+        cand[f"n_{col}"] = ((cand[col] - lo) / (hi - lo)).fillna(0.0)
+    cand["knee"] = cand["n_latency"] ** 2 + cand["n_avg_temp"] ** 2
+    rec = cand.loc[cand.groupby(keys)["knee"].idxmin(), cols]
+
+    summary = (summary
+               .join(best_temp.set_index(keys).add_prefix("best_temp_"))
+               .join(best_lat.set_index(keys).add_prefix("best_lat_"))
+               .join(best_energy.set_index(keys).add_prefix("best_energy_"))
+               .join(rec.set_index(keys).add_prefix("rec_"))
+               .reset_index())
+    return points, summary
+
+# === Rendering (no computation; reads the analysis) ===
+
+def plot_safe_region(ax1, ax2, min_val, max_val):
+    ax1.axvspan(min_val, max_val, color='gray', alpha=0.2, label="Safe Region")
+    for ax in (ax1, ax2):
+        ax.axvline(min_val, linestyle='--', color='gray')
+        ax.axvline(max_val, linestyle='--', color='gray')
+
+
+def composite_plot_per_query(query_id, points_q, summary_q, out_dir):
+    fig, axs = plt.subplots(3, 1, figsize=(9, 12), sharex=False)
     colors = ['tab:blue', 'tab:red']
+    rows = summary_q.set_index("param")
 
     all_handles = []
     all_labels = []
 
-    for i, (param, df, baseline_val) in enumerate(param_info):
-        df_q = df[df["query"] == query_id].sort_values("param_value")
-        if df_q.empty:
+    for i, param in enumerate(PARAMS):
+        if param not in rows.index:
             continue
-
-        baseline_row = df_q[df_q["param_value"] == baseline_val]
-        if baseline_row.empty:
-            continue
-
-        baseline_latency = baseline_row.iloc[0]["latency"]
+        s = rows.loc[param]
+        df_q = points_q[points_q["param"] == param].sort_values("param_value")
         ax1 = axs[i]
         ax2 = ax1.twinx()
 
@@ -92,63 +114,94 @@ def composite_plot_per_query(query_id, df_freq, df_ctx, df_core, out_dir):
                      ax=ax1, color=colors[0], label="Latency (s)", errorbar=None)
         sns.lineplot(x="param_value", y="avg_temp", data=df_q, marker='o',
                      ax=ax2, color=colors[1], label="Avg Temp (°C)", errorbar=None)
+        # energy per query on a third axis, offset to the right
+        ax3 = ax1.twinx()
+        ax3.spines["right"].set_position(("axes", 1.15))
+        ax3.grid(False)
+        if df_q["energy_j"].notna().any():
+            sns.lineplot(x="param_value", y="energy_j", data=df_q, marker='s', linestyle='--',
+                         ax=ax3, color='tab:green', label="Energy (J)", errorbar=None)
 
         ax1.set_ylabel("Latency (s)")
         ax2.set_ylabel("Avg Temp (°C)")
+        ax3.set_ylabel("Energy (J)")
         ax1.set_xlabel(param.upper())
-        min_val, max_val = plot_safe_region(ax1, ax2, df_q, baseline_latency)
+        if s["has_region"]:
+            plot_safe_region(ax1, ax2, s["min_val"], s["max_val"])
 
         #tradeoff points in safe region
-        candidates = df_q[
-            (df_q["latency"] <= 1.10 * baseline_latency) &
-            (df_q["avg_temp"] <= 77)
-        ]
-
-        if not candidates.empty:
-            best_temp = candidates.loc[candidates["avg_temp"].idxmin()]
-            best_lat = candidates.loc[candidates["latency"].idxmin()]
-
-            ax1.plot(best_temp["param_value"], best_temp["latency"],
+        if pd.notna(s["best_temp_param_value"]):
+            ax1.plot(s["best_temp_param_value"], s["best_temp_latency"],
                      marker='o', color='green', markersize=10, label="Best Temp", zorder=5)
-            ax2.plot(best_temp["param_value"], best_temp["avg_temp"],
+            ax2.plot(s["best_temp_param_value"], s["best_temp_avg_temp"],
                      marker='o', color='green', markersize=10, zorder=5)
 
-            ax1.plot(best_lat["param_value"], best_lat["latency"],
+            ax1.plot(s["best_lat_param_value"], s["best_lat_latency"],
                      marker='o', color='blue', markersize=10, label="Best Latency", zorder=5)
-            ax2.plot(best_lat["param_value"], best_lat["avg_temp"],
+            ax2.plot(s["best_lat_param_value"], s["best_lat_avg_temp"],
                      marker='o', color='blue', markersize=10, zorder=5)
 
+            ax1.plot(s["rec_param_value"], s["rec_latency"], marker='*', color='black',
+                     markersize=14, label="Recommended", zorder=6)
+        if pd.notna(s.get("best_energy_param_value")):
+            ax3.plot(s["best_energy_param_value"], s["best_energy_energy_j"], marker='D', color='darkgreen',
+                     markersize=9, label="Least Energy", zorder=5)
+
         ax1.set_title(f"Query {query_id} — {param.upper()} Sweep")
 
-        h1, l1 = ax1.get_legend_handles_labels()
-        all_handles += h1
-        all_labels += l1
+        for ax in (ax1, ax2, ax3):
+            h, l = ax.get_legend_handles_labels()
+            all_handles += h
+            all_labels += l
+            if ax.get_legend():
+                ax.get_legend().remove()
     unique = dict(zip(all_labels, all_handles))
     fig.legend(unique.values(), unique.keys(),
-               loc='lower center', ncol=4, bbox_to_anchor=(0.5, -0.02))
+               loc='lower center', ncol=5, bbox_to_anchor=(0.5, -0.02))
 
     fig.tight_layout(rect=[0, 0.04, 1, 1])
-    os.makedirs(out_dir, exist_ok=True)
     fig.savefig(os.path.join(out_dir, f"query_{query_id}_composite.png"))
-    plt.close()
+    plt.close(fig)
+
+def _render(job):
+    composite_plot_per_query(*job)
+
+def render_all(points, summary, out_dir, workers=None):
+    os.makedirs(out_dir, exist_ok=True)
+    by_query = dict(tuple(summary.groupby("query")))
+    jobs = [(qid, pts, by_query[qid], out_dir) for qid, pts in points.groupby("query")]
+    if workers == 1:
+        for job in jobs:
+            _render(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render, jobs, chunksize=4))
+    return len(jobs)
 
 
 if __name__ == "__main__":
-    BASE = "/home/rise/models/scripts/python/exp0703/results/sweep"
-    OUT = "composite_plots"
-    os.makedirs(OUT, exist_ok=True)
-
-    df_freq = collect_query_data(BASE, "freq")
-    df_ctx  = collect_query_data(BASE, "ctx")
-    df_core = collect_query_data(BASE, "core")
-
-    all_queries = sorted(set(df_freq["query"]) | set(df_ctx["query"]) | set(df_core["query"]))
-
-    for qid in all_queries:
-        composite_plot_per_query(
-            query_id=qid,
-            df_freq=df_freq,
-            df_ctx=df_ctx,
-            df_core=df_core,
-            out_dir=OUT
-        )
+    parser = argparse.ArgumentParser(description="Safe regions, Pareto fronts and recommendations per query.")
+    parser.add_argument("--base", default="/home/rise/models/scripts/python/exp0703/results/sweep")
+    parser.add_argument("--out", default="composite_plots")
+    parser.add_argument("--workers", type=int, help="Rendering processes (default: one per CPU).")
+    parser.add_argument("--no_render", action="store_true", help="Only write the summary table.")
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    t0 = time.time()
+    dfs = {param: collect_query_data(args.base, param) for param in PARAMS}
+    t1 = time.time()
+    for param in [p for p, df in dfs.items() if df.empty]:
+        print(f"No {param} runs under {args.base}; skipping")
+        del dfs[param]
+    if not dfs:
+        raise SystemExit(f"No sweep runs under {args.base}")
+    points, summary = analyze(dfs)
+    t2 = time.time()
+    summary_path = os.path.join(args.out, "safe_regions_summary.csv")
+    summary.to_csv(summary_path, index=False)
+    print(f"Loaded in {t1 - t0:.2f}s, analyzed {len(summary)} (query, param) pairs in {t2 - t1:.2f}s → {summary_path}")
+
+    if not args.no_render:
+        n = render_all(points, summary, args.out, args.workers)
+        print(f"Rendered {n} figures in {time.time() - t2:.2f}s")
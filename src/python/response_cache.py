@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# Persistent answer cache in front of run_inference, for the exact and
+# near-duplicate (question, context) pairs that repeat in real traffic.
+#
+#   exact    : sha256 of the whitespace-normalized question and context,
+#              the model and max_tokens
+#   semantic : same context, model and max_tokens, and a question whose
+#              embedding (RAG/embeddings.py) is at least `similarity` cosine
+#              to a cached one. Only within one context: the same question
+#              about a different passage has a different answer.
+#
+# One SQLite file, so answers survive restarts. Entries expire TTL_S after
+# they were answered and the least recently used go first past MAX_ENTRIES
+# or MAX_MB. Every hit counts the inference seconds (and joules, when the
+# original run was metered) it did not spend.
+#
+#   python3 response_cache.py stats --db ~/.cache/edge_response_cache.db
+#   python3 response_cache.py purge --db ~/.cache/edge_response_cache.db
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+import contextlib
+from pathlib import Path
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "RAG"))
+
+# === Configuration ===
+CACHE_FILE  = os.path.expanduser("~/.cache/edge_response_cache.db")
+SIMILARITY  = 0.92     # cosine; the hashing embedder puts "start"->"end" and "start"->"begin"
+                       # both at ~0.88, so only case, punctuation and filler-word edits pass
+EMBEDDER    = "hashing"  # no second model in RAM next to the GGUF; or a sentence-transformers name
+TTL_S       = 7 * 24 * 3600.0
+MAX_ENTRIES = 20000
+MAX_MB      = 64.0
+KEPT_FIELDS = ("response", "completion_tokens", "max_tokens")   # what a hit returns of the original
+TIERS = ("exact", "semantic", "miss")
+ENTRY_SQL = "SELECT result, compute_s, energy_j, question, created FROM entries"
+
+def normalize(text):
+    return " ".join((text or "").split())
+
+def digest(*parts):
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Exact-hash and embedding-similarity answer cache in SQLite; safe to share between threads."""
+
+    def __init__(self, path=CACHE_FILE, model="", similarity=SIMILARITY, embedder=EMBEDDER, ttl_s=TTL_S,
+                 max_entries=MAX_ENTRIES, max_mb=MAX_MB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.model = os.path.basename(model or "")
+        self.similarity = similarity
+        self.ttl_s, self.max_entries, self.max_bytes = ttl_s, max_entries, max_mb * 1024 * 1024
+        self.embedder = None
+        if similarity is not None and similarity < 1.0:
+            try:
+                from embeddings import get_embedding_function
+                self.embedder = get_embedding_function(embedder)
+            except ImportError as e:
+                print(f"Semantic tier disabled (embeddings.py unavailable: {e})")
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")   # a power cut may lose the last answers, not the file
+        self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, scope TEXT, ctx_hash TEXT, question TEXT, embedder TEXT, embedding BLOB,
+            result TEXT, compute_s REAL, energy_j REAL, bytes INTEGER, created REAL, last_used REAL,
+            hits INTEGER DEFAULT 0)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_ctx ON entries (scope, ctx_hash)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value REAL)")
+        self.counts = dict.fromkeys(TIERS, 0)
+        self.saved_s = self.saved_j = self.lookup_s = 0.0
+        self.evicted = 0
+
+    # Answers depend on the model and the generation length as well as the text
+    def scope(self, max_tokens):
+        return f"{self.model}:{max_tokens}"
+
+    def keys(self, question, context, max_tokens):
+        scope, ctx_hash = self.scope(max_tokens), digest(normalize(context))
+        return digest(scope, ctx_hash, normalize(question)), scope, ctx_hash
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def _count(self, tier, saved_s=0.0, saved_j=0.0):
+        self.counts[tier] += 1
+        self.saved_s += saved_s
+        self.saved_j += saved_j
+        self.db.executemany("INSERT INTO totals VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                            [(name, v, v) for name, v in ((tier, 1), ("saved_s", saved_s), ("saved_j", saved_j))])
+
+    def _semantic(self, question, scope, ctx_hash, fresh_after):
+        rows = self.db.execute("""SELECT key, embedding FROM entries
+            WHERE scope = ? AND ctx_hash = ? AND embedder = ? AND created > ?""",
+                               (scope, ctx_hash, self.embedder.name, fresh_after)).fetchall()
+        if not rows:
+            return None, None
+        q = self.embedder.embed_query(normalize(question))
+        sims = np.frombuffer(b"".join(blob for _, blob in rows), dtype=np.float32).reshape(len(rows), -1) @ q
+        best = int(np.argmax(sims))
+        return (rows[best][0], float(sims[best])) if sims[best] >= self.similarity else (None, None)
+
+    def get(self, question, context, max_tokens):
+        """A result dict shaped like run_inference's, or None on a miss."""
+        t0 = time.time()
+        key, scope, ctx_hash = self.keys(question, context, max_tokens)
+        fresh_after = t0 - self.ttl_s
+        with self.lock, self.transaction():
+            tier, similarity, hit_key = "exact", 1.0, key
+            row = self.db.execute(ENTRY_SQL + " WHERE key = ? AND created > ?", (key, fresh_after)).fetchone()
+            if row is None and self.embedder is not None:
+                tier = "semantic"
+                hit_key, similarity = self._semantic(question, scope, ctx_hash, fresh_after)
+                row = self.db.execute(ENTRY_SQL + " WHERE key = ?", (hit_key,)).fetchone() if hit_key else None
+            if row is None:
+                self._count("miss")
+                self.lookup_s += time.time() - t0
+                return None
+            result, compute_s, energy_j, cached_question, created = row
+            self.db.execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?", (t0, hit_key))
+            self._count(tier, compute_s or 0.0, energy_j or 0.0)
+        elapsed = time.time() - t0
+        self.lookup_s += elapsed
+        # nothing was evaluated: no tokens, heat or telemetry of its own
+        return {"question": question, "context": context, **json.loads(result),
+                "elapsed_time": elapsed, "total_tokens": 0, "token_rate": 0, "started_at": t0,
+                "cache": {"tier": tier, "similarity": similarity, "matched_question": cached_question,
+                          "answered_at": created, "saved_s": compute_s, "saved_j": energy_j}}
+
+    def put(self, question, context, max_tokens, result):
+        if not result or "cache" in result:
+            return
+        key, scope, ctx_hash = self.keys(question, context, max_tokens)
+        payload = json.dumps({k: result[k] for k in KEPT_FIELDS if k in result})
+        embedding = (self.embedder.embed_query(normalize(question)).astype(np.float32).tobytes()
+                     if self.embedder is not None else None)
+        now = time.time()
+        size = len(payload) + len(embedding or b"") + len(question) + len(key)
+        with self.lock, self.transaction():
+            self.db.execute("""INSERT OR REPLACE INTO entries
+                (key, scope, ctx_hash, question, embedder, embedding, result, compute_s, energy_j, bytes,
+                 created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                            (key, scope, ctx_hash, question, self.embedder.name if self.embedder else None,
+                             embedding, payload, result.get("elapsed_time"),
+                             (result.get("energy") or {}).get("energy_j"), size, now, now))
+            self.evict(now)
+
+    def evict(self, now=None):
+        now = time.time() if now is None else now
+        removed = self.db.execute("DELETE FROM entries WHERE created <= ?", (now - self.ttl_s,)).rowcount
+        count, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+        if count > self.max_entries or size > self.max_bytes:
+            # walk the LRU end until both caps hold
+            drop, keep_count, keep_size = [], count, size
+            for key, n in self.db.execute("SELECT key, bytes FROM entries ORDER BY last_used"):
+                if keep_count <= self.max_entries and keep_size <= self.max_bytes:
+                    break
+                drop.append((key,))
+                keep_count, keep_size = keep_count - 1, keep_size - n
+            self.db.executemany("DELETE FROM entries WHERE key = ?", drop)
+            removed += len(drop)
+        self.evicted += removed
+        return removed
+
+    def stats(self):
+        looked_up = sum(self.counts.values())
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+            totals = dict(self.db.execute("SELECT name, value FROM totals").fetchall())
+        lifetime = sum(totals.get(t, 0) for t in TIERS)
+        return {"entries": entries, "size_mb": size / 1024 / 1024, "evicted": self.evicted,
+                "exact_hits": self.counts["exact"], "semantic_hits": self.counts["semantic"],
+                "misses": self.counts["miss"],
+                "hit_rate": (looked_up - self.counts["miss"]) / looked_up if looked_up else None,
+                "saved_s": self.saved_s, "saved_j": self.saved_j,
+                "mean_lookup_ms": self.lookup_s / looked_up * 1000 if looked_up else None,
+                "lifetime": {"lookups": int(lifetime),
+                             "hit_rate": (lifetime - totals.get("miss", 0)) / lifetime if lifetime else None,
+                             "saved_s": totals.get("saved_s", 0.0), "saved_j": totals.get("saved_j", 0.0)}}
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the persistent response cache.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, help_text in (("stats", "Entries, size and lifetime hit rate / avoided compute."),
+                            ("purge", "Drop expired entries, or everything with --all.")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--db", default=CACHE_FILE)
+        p.add_argument("--ttl_s", type=float, default=TTL_S)
+    sub.choices["purge"].add_argument("--all", action="store_true")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.db, similarity=None, ttl_s=args.ttl_s)
+    if args.cmd == "purge":
+        removed = (cache.db.execute("DELETE FROM entries").rowcount if args.all else cache.evict())
+        cache.db.execute("VACUUM")
+        print(f"Removed {removed} entries from {args.db}")
+    print(json.dumps({k: v for k, v in cache.stats().items() if k in ("entries", "size_mb", "lifetime")}, indent=4))
+    cache.close()
@@ -2,10 +2,12 @@
 import json
 import time
 import os
-import subprocess
 from llama_cpp import Llama
 import psutil
 from datetime import datetime 
+from config_space import ConfigSpace, AnalyticSurrogate, FirstFeasible, DecisionTable, load_surrogate
+from core_control import apply_cores
+from cost_estimator import CostEstimator
 
 # === Configuration ===
 MODEL_PATH = "/home/rise/Downloads/Llama-3.2-3B-Q4_0.gguf"
@@ -46,29 +48,26 @@ def set_cpu_freq(freq_mhz):
             except:
                 pass
 
-# Set active core count (via taskset mask)
-def set_core_affinity(pid, cores):
-    mask = (1 << cores) - 1
-    subprocess.run(["taskset", "-p", hex(mask), str(pid)], stdout=subprocess.DEVNULL)
+# Set active core count: every thread pinned + llama n_threads matched
+def set_core_affinity(llm, cores):
+    return apply_cores(llm, cores)
 
-# Surrogate model for latency and temp
-def surrogate_runtime(K, freq_ghz, cores):
-    return K * (30.0 / (freq_ghz * cores))  # Arbitrary scaling
-
-def surrogate_temp(base_temp, K, freq_ghz, cores):
-    return base_temp + K * (freq_ghz * cores) * 0.05
+# Config search: first safe config in (cores desc, freq desc) order,
+# memoized per (K, ambient) bucket; models fitted by surrogate_fit.py when
+# surrogate.npz exists, the hand-written ones otherwise
+SPACE = ConfigSpace(cores=CORES_LIST, freqs=FREQ_LIST, ctxs=[4096],
+                    surrogate=load_surrogate(AnalyticSurrogate(use_ctx=False)),
+                    safe_temp=SAFE_TEMP_C, overshoot=MAX_RUNTIME_OVERSHOOT,
+                    baseline=(DEFAULT_CORES, DEFAULT_FREQ, 4096))
+TABLE = DecisionTable(SPACE, FirstFeasible(), temp_bucket=0.5)
 
 # Decision function
 def select_config(K, ambient_temp):
-    base_L = surrogate_runtime(K, 1.5, 4)
-    for cores in CORES_LIST:
-        for freq in FREQ_LIST:
-            f_ghz = freq / 1000
-            L = surrogate_runtime(K, f_ghz, cores)
-            T = surrogate_temp(ambient_temp, K, f_ghz, cores)
-            if T <= SAFE_TEMP_C and L <= base_L * (1 + MAX_RUNTIME_OVERSHOOT):
-                return cores, freq, L, T
-    return 2, 1000, base_L * 10, 85.0  # fallback
+    best = TABLE.lookup(K, ambient_temp)
+    if best is None:
+        return 2, 1000, float(SPACE.baseline_latency(K)) * 10, 85.0  # fallback
+    cores, freq, _, L, T = best
+    return cores, freq, L, T
 
 # Main test loop
 def run_test():
@@ -81,18 +80,22 @@ def run_test():
         data = json.load(f)
         # [:40]
 
+    # token-accurate load for the whole dataset before the first query
+    costs = CostEstimator(MODEL_PATH).estimate_dataset(data)
+    TABLE.precompute({c.K for c in costs}, [get_cpu_temp() or 40.0])
+
     llm = Llama(model_path=MODEL_PATH)
 
     for i, item in enumerate(data):
-        text = item["context"] + " " + item["question"]
-        K = (len(text.strip().split()) + 128) // 16
+        K = costs[i].K
         ambient = get_cpu_temp() or 40.0
         cores, freq, L, T = select_config(K, ambient)
 
-        print(f"→ Query {i+1}: K={K}, {cores} cores @ {freq} MHz | Est. L={L:.1f}s, T={T:.1f}°C")
+        print(f"→ Query {i+1}: K={K:.1f}, {cores} cores @ {freq} MHz | Est. L={L:.1f}s, T={T:.1f}°C")
 
         # Set hardware
         set_cpu_freq(freq)
+        core_report = set_core_affinity(llm, cores)
 
         t0 = time.time()
         output = llm(f"Context: {item['context']}\nQuestion: {item['question']}\nAnswer:")#, max_tokens=128)
@@ -102,7 +105,9 @@ def run_test():
             "question": item["question"],
             "response": output["choices"][0]["text"].strip(),
             "elapsed_time": elapsed,
-            "config": {"cores": cores, "freq_mhz": freq},
+            "config": {"cores": cores, "freq_mhz": freq, "n_threads": core_report["n_threads"]},
+            "cores_applied": core_report["ok"],
+            "cost_estimate": costs[i].as_dict(),
             "temp_start": ambient,
             "temp_end": get_cpu_temp()
         }
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# Speculative decoding. A drafter proposes the next few tokens and the target
+# model checks them all in one batched eval; every proposal it agrees with is
+# a decode step saved, and the output is the same as plain greedy decoding.
+#
+# Drafters, passed to llama-cpp-python as Llama(..., draft_model=...):
+#   lookup  n-gram match against the prompt. SQuAD answers are mostly spans
+#           of the context, so this is free and usually the better choice.
+#   <gguf>  a small model sharing the target's vocabulary. Llama-2-7B
+#           (32000-token SentencePiece) and Llama-3.2-3B (128256-token BPE)
+#           do not share one, so neither can draft for the other: pair the 3B
+#           with Llama-3.2-1B, or the 7B with a Llama-2-vocabulary model.
+#
+# A speculative instance keeps logits for every position (n_ctx x n_vocab
+# float32: ~0.5 GB for the 7B at 4096, ~2 GB for the 3B), so give it the
+# smallest n_ctx that fits.
+#
+#   python3 speculative.py profile --dataset squad_val_100.json --limit 20
+#   python3 speculative.py profile --draft /path/to/Llama-3.2-1B-Q4_0.gguf --model /path/to/Llama-3.2-3B-Q4_0.gguf
+import os
+import json
+import argparse
+import numpy as np
+from config_space import ConfigSpace
+
+# === Configuration ===
+MODEL_PATH   = "/home/rise/Downloads/llama-2-7b-chat.Q4_0.gguf"
+PROFILE_FILE = os.path.expanduser("~/.cache/edge_speculative_profile.json")
+DRAFT_TOKENS = 10     # proposals per verification eval
+MAX_NGRAM    = 3      # longest suffix prompt lookup tries to match
+DRAFT_CTX    = 2048   # size it to the largest target n_ctx it drafts for
+VOCAB_PROBE  = "Context: The Normans were in Normandy in the 10th and 11th centuries.\nQuestion: When?\nAnswer:"
+MODES = ("plain", "speculative")
+
+# === Drafters: __call__(input_ids) -> proposed token ids ===
+
+class PromptLookupDraft:
+    """Proposes what followed the first earlier occurrence of the latest n-gram."""
+
+    def __init__(self, max_ngram=MAX_NGRAM, num_pred_tokens=DRAFT_TOKENS):
+        self.max_ngram = max_ngram
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, **kwargs):
+        ids = np.asarray(input_ids)
+        for n in range(min(self.max_ngram, len(ids) - 1), 0, -1):
+            # windows over ids[:-1] never include the suffix itself and always
+            # have at least one token after them
+            windows = np.lib.stride_tricks.sliding_window_view(ids[:-1], n)
+            hits = np.flatnonzero((windows == ids[-n:]).all(axis=1))
+            if hits.size:
+                start = hits[0] + n
+                return ids[start:start + self.num_pred_tokens]
+        return np.empty(0, dtype=np.intc)
+
+
+class ModelDraft:
+    """Greedy proposals from a small GGUF that shares the target's vocabulary."""
+
+    def __init__(self, llm, num_pred_tokens=DRAFT_TOKENS):
+        self.llm = llm
+        self.num_pred_tokens = num_pred_tokens
+        self.eos = llm.token_eos()
+        self.n_ctx = llm.n_ctx()
+
+    def __call__(self, input_ids, **kwargs):
+        out = []
+        if len(input_ids) + self.num_pred_tokens > self.n_ctx:
+            return np.array(out, dtype=np.intc)   # past the draft's context: the target decodes alone
+        # generate() reuses the longest prefix already in the draft's KV cache
+        for token in self.llm.generate([int(t) for t in input_ids], top_k=1, temp=0.0, reset=True):
+            if token == self.eos:
+                break
+            out.append(token)
+            if len(out) >= self.num_pred_tokens:
+                break
+        return np.array(out, dtype=np.intc)
+
+
+class CountingDraft:
+    """Wraps a drafter and measures how much of each draft the target kept.
+
+    llama-cpp-python calls the drafter with the accepted sequence plus the
+    target's next token, so the previous draft's accepted length is its
+    common prefix with what now follows the previous input.
+    """
+
+    def __init__(self, drafter, name):
+        self.drafter = drafter
+        self.name = name
+        self.calls = self.proposed = self.accepted = 0
+        self.pending = None   # (input length, draft) not yet verified
+
+    def __call__(self, input_ids, **kwargs):
+        input_ids = np.asarray(input_ids)
+        if self.pending is not None:
+            start, draft = self.pending
+            kept = input_ids[start:start + len(draft)]
+            mismatch = np.flatnonzero(kept != draft[:len(kept)])
+            self.accepted += int(mismatch[0]) if mismatch.size else len(kept)
+            self.proposed += len(draft)
+        draft = np.asarray(self.drafter(input_ids, **kwargs), dtype=np.intc)
+        self.pending = (len(input_ids), draft) if len(draft) else None
+        self.calls += 1
+        return draft
+
+    # Before a generation: the last draft of the previous one is never verified
+    def mark(self):
+        self.pending = None
+        return self.calls, self.proposed, self.accepted
+
+    def report(self, mark, result):
+        calls, proposed, accepted = (now - then for now, then in zip(self.mark(), mark))
+        tokens = result.get("completion_tokens") or 0
+        elapsed = result.get("decode_time") or result.get("elapsed_time")
+        return {"drafter": self.name,
+                "proposed": proposed,
+                "accepted": accepted,
+                "acceptance_rate": accepted / proposed if proposed else None,
+                "tokens_per_eval": tokens / (calls + 1) if tokens else None,
+                "effective_tokens_per_s": (tokens - 1 if result.get("decode_time") else tokens) / elapsed
+                                          if elapsed else None}
+
+
+def check_vocab(target, draft):
+    if target.n_vocab() != draft.n_vocab():
+        raise ValueError(f"draft vocabulary has {draft.n_vocab()} tokens, target {target.n_vocab()}: "
+                         "the target would reject every proposal")
+    probe = VOCAB_PROBE.encode("utf-8")
+    if target.tokenize(probe) != draft.tokenize(probe):
+        raise ValueError("draft and target tokenize differently")
+
+def make_drafter(draft="lookup", target_path=MODEL_PATH, n_threads=None, n_ctx=DRAFT_CTX):
+    if draft == "lookup":
+        return CountingDraft(PromptLookupDraft(), "lookup")
+    from llama_cpp import Llama
+    # tokenizer-only loads are cheap; fail before paying for the weights
+    check_vocab(Llama(model_path=target_path, vocab_only=True, verbose=False),
+                Llama(model_path=draft, vocab_only=True, verbose=False))
+    kwargs = {"n_threads": n_threads} if n_threads else {}
+    llm = Llama(model_path=draft, n_ctx=n_ctx, use_mmap=True, verbose=False, **kwargs)
+    return CountingDraft(ModelDraft(llm), os.path.basename(draft))
+
+# === Profile and selection ===
+
+class SpeculativeProfile:
+    # Decode speed-up, the share of plain latency spent decoding, and the
+    # power while speculating relative to plain; the priors never prefer
+    # speculation until a profile has been measured on the board
+    def __init__(self, speedup=1.0, decode_share=0.7, power_ratio=1.1, acceptance=None, drafter=None,
+                 measured_on=0):
+        self.speedup, self.decode_share, self.power_ratio = speedup, decode_share, power_ratio
+        self.acceptance, self.drafter = acceptance, drafter
+        self.measured_on = measured_on
+
+    @classmethod
+    def from_runs(cls, plain, speculative):
+        pairs = [(p, s) for p, s in zip(plain, speculative) if p and s and p.get("decode_rate") and s.get("decode_rate")]
+        if not pairs:
+            return cls()
+        speedup = float(np.median([s["decode_rate"] / p["decode_rate"] for p, s in pairs]))
+        share = float(np.mean([p["decode_time"] / p["elapsed_time"] for p, _ in pairs]))
+        power = [(s["energy"]["avg_power_w"], p["energy"]["avg_power_w"]) for p, s in pairs
+                 if s.get("energy", {}).get("avg_power_w") and p.get("energy", {}).get("avg_power_w")]
+        ratio = float(np.mean([a / b for a, b in power])) if power else cls().power_ratio
+        rates = [s["speculative"]["acceptance_rate"] for _, s in pairs
+                 if s.get("speculative", {}).get("acceptance_rate") is not None]
+        return cls(speedup, share, ratio, float(np.mean(rates)) if rates else None,
+                   pairs[0][1].get("speculative", {}).get("drafter"), len(pairs))
+
+    def as_dict(self):
+        return {"speedup": self.speedup, "decode_share": self.decode_share, "power_ratio": self.power_ratio,
+                "acceptance": self.acceptance, "drafter": self.drafter, "measured_on": self.measured_on}
+
+    def save(self, path=PROFILE_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f)
+
+    @classmethod
+    def load(cls, path=PROFILE_FILE):
+        try:
+            with open(path) as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+
+class SpeculativeSurrogate:
+    # The plain surrogate with decode `speedup` times faster; the rise over
+    # ambient follows the energy put in, power_ratio x the shorter latency
+    def __init__(self, base, profile):
+        self.base = base
+        self.profile = profile
+
+    def predict(self, K, ambient, cores, freq_ghz, ctx):
+        L, T = self.base.predict(K, ambient, cores, freq_ghz, ctx)
+        p = self.profile
+        scale = 1 - p.decode_share + p.decode_share / p.speedup
+        return L * scale, ambient + (T - ambient) * scale * p.power_ratio
+
+
+class ModeSpace(ConfigSpace):
+    """The same grid twice, plain then speculative, for DecisionTable and the objectives.
+
+    Feasibility stays relative to the plain baseline; config() appends the mode.
+    """
+
+    def __init__(self, space, profile):
+        self.__dict__.update(vars(space))
+        self.n = len(space)
+        self.speculative = SpeculativeSurrogate(space.surrogate, profile)
+        self.cores, self.freqs, self.ctxs = (np.tile(a, 2) for a in (space.cores, space.freqs, space.ctxs))
+        self.modes = np.repeat(MODES, self.n)
+        self.power_scale = np.repeat([1.0, profile.power_ratio], self.n)   # for EnergyObjective
+
+    def evaluate(self, K, ambient):
+        K = np.atleast_1d(np.asarray(K, dtype=float))[:, None]
+        ambient = np.atleast_1d(np.asarray(ambient, dtype=float))[:, None]
+        grid = (K, ambient, self.cores[:self.n], self.freqs[:self.n] / 1000.0, self.ctxs[:self.n])
+        Lp, Tp = np.broadcast_arrays(*self.surrogate.predict(*grid))
+        Ls, Ts = np.broadcast_arrays(*self.speculative.predict(*grid))
+        L, T = np.hstack([Lp, Ls]), np.hstack([Tp, Ts])
+        base_L = self.baseline_latency(K, ambient)
+        feasible = (T <= self.safe_temp) & (L <= base_L * (1 + self.overshoot))
+        return L, T, feasible
+
+    def config(self, i, L, T):
+        return super().config(i, L, T) + (str(self.modes[i]),)
+
+# === Measuring the profile on the board ===
+
+def profile(model_path, items, max_tokens, draft="lookup", n_ctx=DRAFT_CTX, sampler=None):
+    from model_mt import load_model, run_inference
+    plain_llm = load_model(model_path, n_ctx=n_ctx)
+    spec_llm = load_model(model_path, n_ctx=n_ctx, draft_model=make_drafter(draft, model_path, n_ctx=n_ctx))
+    plain, speculative = [], []
+    for i, item in enumerate(items):
+        # alternate which goes first so heat soak does not favour either
+        order = [(plain_llm, plain), (spec_llm, speculative)][::1 if i % 2 == 0 else -1]
+        for llm, out in order:
+            out.append(run_inference(llm, item["question"], item["context"], max_tokens, stream=True,
+                                     sampler=sampler))
+        p, s = plain[-1], speculative[-1]
+        if p and s and s.get("speculative"):
+            print(f"q{i}: plain {p['completion_tokens'] / p['elapsed_time']:.2f} tok/s, speculative "
+                  f"{s['speculative']['effective_tokens_per_s'] or 0:.2f} tok/s, "
+                  f"acceptance {s['speculative']['acceptance_rate'] or 0:.0%}")
+    return SpeculativeProfile.from_runs(plain, speculative)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speculative decoding profile for the config selector.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    prof = sub.add_parser("profile", help="Run a dataset plain and speculative; save the measured profile.")
+    prof.add_argument("--model", default=MODEL_PATH)
+    prof.add_argument("--draft", default="lookup", help="'lookup' or a draft GGUF sharing the vocabulary.")
+    prof.add_argument("--dataset", required=True, help="JSON array of {question, context}.")
+    prof.add_argument("--limit", type=int, default=20)
+    prof.add_argument("--max_tokens", type=int, default=128)
+    prof.add_argument("--n_ctx", type=int, default=DRAFT_CTX)
+    prof.add_argument("--telemetry_hz", type=float, default=20, help="For the power ratio (0 = prior).")
+    prof.add_argument("--out", default=PROFILE_FILE)
+    sub.add_parser("show", help="Print the saved profile.")
+    args = parser.parse_args()
+
+    if args.cmd == "show":
+        print(json.dumps(SpeculativeProfile.load().as_dict(), indent=4))
+    else:
+        from telemetry import TelemetrySampler
+        with open(args.dataset) as f:
+            items = json.load(f)[:args.limit]
+        sampler = TelemetrySampler(hz=args.telemetry_hz) if args.telemetry_hz else None
+        if sampler:
+            sampler.start()
+        try:
+            result = profile(args.model, items, args.max_tokens, args.draft, args.n_ctx, sampler)
+        finally:
+            if sampler:
+                sampler.stop()
+        result.save(args.out)
+        print(f"{json.dumps(result.as_dict())} → {args.out}")
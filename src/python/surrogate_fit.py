@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from plot_column_safe_regions import collect_query_data
+from config_space import SURROGATE_PATH, TOKENS_PER_K, LearnedSurrogate
+
+# === Configuration ===
+SWEEP_DIR   = "/home/rise/models/scripts/python/gguf/results/sweep"
+PARAMS      = ["freq", "core", "ctx"]
+N_TREES     = 300
+DEPTH       = 4
+LEARN_RATE  = 0.1
+N_BINS      = 32     # candidate thresholds per feature (quantiles)
+L2          = 1.0    # leaf shrinkage towards 0
+TEST_FRAC   = 0.2    # share of queries held out for the error report
+FEATURE_COLUMNS = ["query", "latency", "peak_temp", "tokens", "freq", "cores", "ctx", "ambient"]
+
+# Same feature order as LearnedSurrogate.FEATURES
+def features(df):
+    return np.column_stack([df["tokens"], df["freq"] / 1000.0, df["cores"], df["ctx"], df["ambient"]]).astype(float)
+
+def load_training_data(base_dir):
+    parts = [collect_query_data(base_dir, param, FEATURE_COLUMNS).assign(sweep=param) for param in PARAMS]
+    df = pd.concat(parts, ignore_index=True)
+    df = df.dropna(subset=FEATURE_COLUMNS)
+    return df[df["latency"] > 0].reset_index(drop=True)
+
+# === Gradient-boosted oblivious trees ===
+# Each tree uses one (feature, threshold) per level for every node, so a
+# depth-d tree is d comparisons and a 2**d leaf table: tiny to store and
+# vectorizes to a handful of array ops at predict time.
+
+def candidate_thresholds(X, n_bins=N_BINS):
+    qs = np.linspace(0, 1, n_bins + 2)[1:-1]
+    return [np.unique(np.quantile(X[:, j], qs)) for j in range(X.shape[1])]
+
+def fit_tree(X, r, cands, depth, l2):
+    n_leaves = 2 ** depth
+    leaf = np.zeros(len(r), dtype=np.int64)
+    feats, thrs = [], []
+    for d in range(depth):
+        best = (-np.inf, 0, 0.0)
+        for j, ts in enumerate(cands):
+            for t in ts:
+                idx = leaf | ((X[:, j] > t).astype(np.int64) << d)
+                s = np.bincount(idx, weights=r, minlength=n_leaves)
+                n = np.bincount(idx, minlength=n_leaves)
+                gain = (s ** 2 / (n + l2)).sum()
+                if gain > best[0]:
+                    best = (gain, j, t)
+        _, j, t = best
+        leaf |= (X[:, j] > t).astype(np.int64) << d
+        feats.append(j)
+        thrs.append(t)
+    s = np.bincount(leaf, weights=r, minlength=n_leaves)
+    n = np.bincount(leaf, minlength=n_leaves)
+    return np.array(feats), np.array(thrs), s / (n + l2), leaf
+
+def fit_gbm(X, y, n_trees=N_TREES, depth=DEPTH, lr=LEARN_RATE, l2=L2, log_target=False, offset=-1):
+    # offset: feature added to the output as is (ambient for temperature, so
+    # the trees only learn the rise and extrapolate to unseen ambients)
+    target = np.log(y) if log_target else y.astype(float)
+    if offset >= 0:
+        target = target - X[:, offset]
+    base = float(target.mean())
+    pred = np.full(len(y), base)
+    cands = candidate_thresholds(X)
+    F, Tr, Lv = [], [], []
+    for _ in range(n_trees):
+        f, t, leaves, leaf = fit_tree(X, target - pred, cands, depth, l2)
+        leaves = leaves * lr
+        pred += leaves[leaf]
+        F.append(f)
+        Tr.append(t)
+        Lv.append(leaves)
+    return {"features": np.array(F), "thresholds": np.array(Tr), "leaves": np.array(Lv),
+            "base": np.array(base), "log_target": np.array(log_target), "offset": np.array(offset)}
+
+def fit_models(df, **kwargs):
+    X = features(df)
+    return {"latency": fit_gbm(X, df["latency"].to_numpy(), log_target=True, **kwargs),
+            "temp": fit_gbm(X, df["peak_temp"].to_numpy(), offset=4, **kwargs)}
+
+def export(models, path=SURROGATE_PATH):
+    arrays = {f"{name}_{k}": v for name, m in models.items() for k, v in m.items()}
+    np.savez(path, **arrays)
+
+# === Held-out evaluation ===
+
+def errors(y, pred):
+    err = pred - y
+    return {"mae": float(np.abs(err).mean()),
+            "rmse": float(np.sqrt((err ** 2).mean())),
+            "mape": float((np.abs(err) / np.abs(y)).mean()),
+            "n": int(len(y))}
+
+# Split by query so held-out rows are prompts the models never saw
+def split_by_query(df, test_frac=TEST_FRAC, seed=0):
+    queries = df["query"].unique()
+    rng = np.random.default_rng(seed)
+    test = set(rng.choice(queries, max(1, int(len(queries) * test_frac)), replace=False))
+    mask = df["query"].isin(test)
+    return df[~mask], df[mask]
+
+def held_out_report(df, path, test_frac=TEST_FRAC, seed=0, **kwargs):
+    train, test = split_by_query(df, test_frac, seed)
+    export(fit_models(train, **kwargs), path)
+    surrogate = LearnedSurrogate(path)
+    X = features(test)
+    L, T = surrogate.predict(X[:, 0] / TOKENS_PER_K, X[:, 4], X[:, 2], X[:, 1], X[:, 3])
+    report = {"train_rows": len(train), "test_rows": len(test),
+              "test_queries": int(test["query"].nunique()),
+              "latency_s": errors(test["latency"].to_numpy(), L),
+              "peak_temp_C": errors(test["peak_temp"].to_numpy(), T),
+              # what predicting the training mean would score, for scale
+              "latency_s_mean_baseline": errors(test["latency"].to_numpy(),
+                                                np.full(len(test), train["latency"].mean())),
+              "peak_temp_C_mean_baseline": errors(test["peak_temp"].to_numpy(),
+                                                  np.full(len(test), train["peak_temp"].mean()))}
+    for sweep, rows in test.groupby("sweep"):
+        idx = test.index.get_indexer(rows.index)
+        report[f"latency_s[{sweep}]"] = errors(rows["latency"].to_numpy(), L[idx])
+        report[f"peak_temp_C[{sweep}]"] = errors(rows["peak_temp"].to_numpy(), T[idx])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit latency/peak-temperature surrogates from sweep results.")
+    parser.add_argument("--base_dir", default=SWEEP_DIR, help="Directory holding freq/, core/ and ctx/.")
+    parser.add_argument("--out", default=SURROGATE_PATH)
+    parser.add_argument("--trees", type=int, default=N_TREES)
+    parser.add_argument("--depth", type=int, default=DEPTH)
+    parser.add_argument("--lr", type=float, default=LEARN_RATE)
+    parser.add_argument("--test_frac", type=float, default=TEST_FRAC)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = load_training_data(args.base_dir)
+    if df.empty:
+        raise SystemExit(f"No usable sweep runs under {args.base_dir}")
+    print(f"Loaded {len(df)} runs over {df['query'].nunique()} queries")
+    gbm = dict(n_trees=args.trees, depth=args.depth, lr=args.lr)
+
+    report = held_out_report(df, args.out, args.test_frac, args.seed, **gbm)
+    for key, e in report.items():
+        if isinstance(e, dict):
+            print(f"{key:28s} MAE {e['mae']:8.3f}  RMSE {e['rmse']:8.3f}  MAPE {e['mape']:6.1%}  (n={e['n']})")
+
+    # the shipped artifact is refitted on every run, held-out ones included
+    t0 = time.time()
+    export(fit_models(df, **gbm), args.out)
+    fit_time = time.time() - t0
+    t0 = time.perf_counter()
+    LearnedSurrogate(args.out)
+    report.update(fit_time_s=fit_time, load_time_ms=(time.perf_counter() - t0) * 1000,
+                  artifact_bytes=os.path.getsize(args.out))
+    report_path = os.path.splitext(args.out)[0] + "_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {args.out} ({report['artifact_bytes'] / 1024:.0f} KB, loads in "
+          f"{report['load_time_ms']:.1f} ms); report → {report_path}")
@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import glob
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from config_space import DEFAULT_FREQ, DEFAULT_CORES, DEFAULT_CTX
+from energy import run_dir_energy, power_model_mtime, METER_NAME
+
+# === Configuration ===
+CACHE_NAME = ".sweep_cache.parquet"
+TEMP_COLUMNS = ["cpu_temp_C", "CPU_Temperature", "cpu_temp"]
+PARAM_FIELDS = {"freq": "cpu_freq_set", "core": "cpu_cores_start", "ctx": "n_ctx"}
+PARAM_DEFAULTS = {"freq": DEFAULT_FREQ, "core": DEFAULT_CORES, "ctx": DEFAULT_CTX}
+MIN_PARALLEL = 32   # below this many dirs a process pool costs more than it saves
+
+# q<N>_[<param><value>_][<date>_<time>][_r<repeat>]; the value needs its
+# param's letters, or q3_20250101_101500 would read the date as the value
+RUN_DIR = re.compile(r"q(\d+)_(?:[a-z]+(\d+)_)?(\d{8}_\d{6})?(?:_r(\d+))?")
+COLUMNS = ["query", "param_value", "repeat", "latency", "avg_temp", "timestamp", "path", "mtime",
+           # surrogate features: the swept knob plus the two held at baseline
+           "tokens", "freq", "cores", "ctx", "ambient", "peak_temp",
+           # metered, or from the power model over the telemetry (energy.py)
+           "energy_j", "j_per_token"]
+MEAN_COLUMNS = ["latency", "avg_temp", "tokens", "freq", "cores", "ctx", "ambient", "peak_temp",
+                "energy_j", "j_per_token"]
+LAST_COLUMNS = ["timestamp", "path", "mtime"]
+# numeric even when every row is unusable or the param has no runs (all
+# None -> object), so callers can concat sweeps and group numerically
+NUMERIC_COLUMNS = ["param_value", "mtime"] + MEAN_COLUMNS
+
+def run_mtime(run_dir):
+    try:
+        mtime = max(os.stat(os.path.join(run_dir, name)).st_mtime
+                    for name in ("output.json", "metrics.csv"))
+    except FileNotFoundError:
+        return None
+    try:   # a meter log added later must invalidate the cached energy
+        return max(mtime, os.stat(os.path.join(run_dir, METER_NAME)).st_mtime)
+    except FileNotFoundError:
+        return mtime
+
+# Parse one q*_* run directory into a row; param_value is None when unusable
+def parse_run(args):
+    run_dir, param, mtime = args
+    row = dict.fromkeys(COLUMNS)
+    row.update(path=run_dir, mtime=mtime)
+    m = RUN_DIR.match(os.path.basename(run_dir))
+    if not m:
+        return row
+    row["query"] = int(m.group(1))
+    row["timestamp"] = m.group(3) or ""
+    row["repeat"] = int(m.group(4) or 0)
+    try:
+        with open(os.path.join(run_dir, "output.json")) as f:
+            j = json.load(f)
+        df = pd.read_csv(os.path.join(run_dir, "metrics.csv"))
+    except Exception as e:
+        print(f"Skipping {run_dir}: {e}")
+        return row
+
+    temp_col = next((col for col in TEMP_COLUMNS if col in df.columns), None)
+    if temp_col is None:
+        return row
+
+    param_value = j.get(PARAM_FIELDS[param])
+    if param_value is None and m.group(2) is not None:
+        param_value = int(m.group(2))
+    temps = df[temp_col].dropna()
+    knobs = {p: j.get(field, param_value if p == param else PARAM_DEFAULTS[p])
+             for p, field in PARAM_FIELDS.items()}
+    row.update(param_value=param_value,
+               latency=j.get("elapsed_time"),
+               avg_temp=temps.mean(),
+               tokens=j.get("total_tokens"),
+               freq=knobs["freq"], cores=knobs["core"], ctx=knobs["ctx"],
+               ambient=temps.iloc[0] if len(temps) else None,
+               peak_temp=temps.max())
+    configured = {**j, PARAM_FIELDS["freq"]: knobs["freq"], PARAM_FIELDS["core"]: knobs["core"]}
+    energy = run_dir_energy(run_dir, configured, df)
+    row.update(energy_j=energy.get("energy_j"), j_per_token=energy.get("j_per_token"))
+    return row
+
+def read_cache(cache_path):
+    try:
+        df = pd.read_parquet(cache_path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring sweep cache {cache_path}: {e}")
+        return None
+    # written before a column was added: reparse everything once
+    return df if set(COLUMNS) <= set(df.columns) else None
+
+def write_cache(df, cache_path):
+    try:
+        df.to_parquet(cache_path, index=False)
+    except ImportError as e:
+        print(f"Sweep cache disabled (needs pyarrow): {e}")
+    except Exception as e:   # OSError, or pyarrow rejecting a mixed-type column
+        print(f"Could not write sweep cache {cache_path}: {e}")
+
+# One row per (query, param_value): the latest run of each repeat, then the
+# mean over repeats (sweep_orchestrator's _r<k> dirs), counted in "repeats"
+def latest_runs(df):
+    df = df.sort_values(["query", "param_value", "repeat", "timestamp"])
+    df = df.drop_duplicates(["query", "param_value", "repeat"], keep="last")
+    columns = [c for c in COLUMNS if c != "repeat"] + ["repeats"]
+    if not df.duplicated(["query", "param_value"]).any():   # single-repeat sweeps: nothing to average
+        return df.assign(repeats=1)[columns].reset_index(drop=True)
+    df = df.assign(**{c: pd.to_numeric(df[c], errors="coerce") for c in MEAN_COLUMNS})
+    g = df.groupby(["query", "param_value"], sort=True)
+    out = g.agg({**{c: "mean" for c in MEAN_COLUMNS}, **{c: "last" for c in LAST_COLUMNS}})
+    out["repeats"] = g.size()
+    return out.reset_index()[columns]
+
+def load_sweep(base_dir, param, workers=None, use_cache=True, dedup=True):
+    sweep_dir = os.path.join(base_dir, param)
+    cache_path = os.path.join(sweep_dir, CACHE_NAME)
+
+    # unmetered energy comes from the power model: `energy.py calibrate`
+    # must invalidate it like an edited run does
+    model_mtime = power_model_mtime()
+    runs = {}
+    for run_dir in glob.glob(os.path.join(sweep_dir, "q*_*")):
+        mtime = run_mtime(run_dir)
+        if mtime is not None:
+            runs[run_dir] = max(mtime, model_mtime)
+
+    cached = read_cache(cache_path) if use_cache else None
+    keep, stale = [], False
+    if cached is not None and not cached.empty:
+        fresh = cached["path"].map(runs).eq(cached["mtime"])
+        keep, stale = [cached[fresh]], not fresh.all()
+        done = set(cached.loc[fresh, "path"])
+        runs = {p: t for p, t in runs.items() if p not in done}
+
+    jobs = [(run_dir, param, mtime) for run_dir, mtime in runs.items()]
+    if len(jobs) >= MIN_PARALLEL and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(parse_run, jobs, chunksize=16))
+    else:
+        rows = [parse_run(job) for job in jobs]
+
+    parts = keep + ([pd.DataFrame(rows, columns=COLUMNS)] if rows else [])
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+    if use_cache and (rows or stale):
+        write_cache(df, cache_path)
+
+    # unusable runs stay in the cache so they are not re-parsed every time
+    df = df[df["param_value"].notna()]
+    retype = {c: "float64" for c in NUMERIC_COLUMNS if df[c].dtype == object}
+    if retype:
+        df = df.astype(retype)
+    if dedup:
+        df = latest_runs(df)
+    return df.reset_index(drop=True)
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# Spread a freq/core/ctx sweep over several boards.
+#
+#   spec    : {"params": {"freq": [...], "core": [...], "ctx": [...]},
+#              "queries": 30 | [0, 4, 7], "repeats": 1, "baseline": {"freq": 1500, ...},
+#              "dataset": "<path on the boards>", "max_tokens": 128, "safe_temp": 55}
+#             or explicit "points": [{"param", "value", "query", "repeat"}, ...].
+#             One knob varies at a time, the others stay at baseline, as in
+#             results/sweep/{freq,core,ctx}.
+#   queue   : a sqlite file of jobs with leases; a worker that dies or
+#             hangs loses its lease and the job goes back to pending, up to
+#             MAX_ATTEMPTS tries. Re-running the same spec resumes.
+#   workers : one agent process per board, kept alive across jobs (the model
+#             stays loaded), over SSH or as local processes simulating a Pi
+#             with benchmarks/fake_llama + fake_sysfs. The agent speaks JSON
+#             lines on stdin/stdout.
+#   results : <results>/<param>/q<N>_<param><value>_<timestamp>_r<repeat>/
+#             {output.json, metrics.csv}, what sweep_loader.py reads.
+#
+#   python3 sweep_orchestrator.py run --spec sweep.json --results results/sweep --hosts pi1 pi2 pi3
+#   python3 sweep_orchestrator.py run --spec sweep.json --results /tmp/sweep --local 4
+#   python3 sweep_orchestrator.py status --queue results/sweep/sweep_queue.db
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import select
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from config_space import DEFAULT_FREQ, DEFAULT_CORES, DEFAULT_CTX
+from sweep_loader import PARAM_FIELDS
+
+# === Configuration ===
+REMOTE_SCRIPT = "/home/rise/models/scripts/python/gguf/scripts/model/sweep_orchestrator.py"
+MODEL_PATH    = "/home/rise/Downloads/llama-2-7b-chat.Q4_0.gguf"
+QUEUE_NAME    = "sweep_queue.db"
+LEASE_S       = 120.0   # renewed every HEARTBEAT_S while the agent works
+HEARTBEAT_S   = 30.0
+JOB_TIMEOUT_S = 3600.0  # cool-down included
+MAX_ATTEMPTS  = 3
+MAX_RESTARTS  = 5       # agent restarts before a worker gives up on its board
+POLL_S        = 2.0
+REPO_ROOT     = Path(__file__).resolve().parents[2]
+
+# === Spec → jobs ===
+
+def expand(spec, seed=0):
+    baseline = {"freq": DEFAULT_FREQ, "core": DEFAULT_CORES, "ctx": DEFAULT_CTX, **spec.get("baseline", {})}
+    common = {k: spec[k] for k in ("dataset", "max_tokens", "safe_temp") if k in spec}
+    queries = spec.get("queries", 0)
+    queries = range(queries) if isinstance(queries, int) else queries
+    points = [(param, value, q, r) for param, values in spec.get("params", {}).items()
+              for value in values for q in queries for r in range(spec.get("repeats", 1))]
+    # explicit points, e.g. the next round from adaptive_sweep.py
+    points += [(p["param"], p["value"], p["query"], p.get("repeat", 0)) for p in spec.get("points", [])]
+    jobs = []
+    for param, value, q, r in points:
+        if param not in PARAM_FIELDS:
+            raise ValueError(f"unknown sweep parameter {param!r}, expected one of {sorted(PARAM_FIELDS)}")
+        knobs = {**baseline, param: value}
+        jobs.append({"id": f"{param}/q{q}_{param}{value}_r{r}", "param": param, "value": value,
+                     "query": q, "repeat": r, "freq": knobs["freq"], "cores": knobs["core"],
+                     "ctx": knobs["ctx"], **common})
+    # shuffled once, so board drift over a day does not line up with a parameter
+    random.Random(seed).shuffle(jobs)
+    return jobs
+
+def run_name(job, timestamp):
+    return f"q{job['query']}_{job['param']}{job['value']}_{timestamp}_r{job['repeat']}"
+
+
+class JobQueue:
+    """Jobs in sqlite: pending → leased → done, or back to pending on failure
+    until MAX_ATTEMPTS. One instance per thread."""
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, seq INTEGER, payload TEXT, state TEXT DEFAULT 'pending',
+            worker TEXT, lease_until REAL, attempts INTEGER DEFAULT 0, error TEXT, run_dir TEXT, updated REAL)""")
+        self.max_attempts = max_attempts
+
+    def add(self, jobs):
+        start = self.db.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM jobs").fetchone()[0]
+        before = self.db.total_changes
+        self.db.executemany("INSERT OR IGNORE INTO jobs (id, seq, payload, updated) VALUES (?, ?, ?, ?)",
+                            [(j["id"], start + i, json.dumps(j), time.time()) for i, j in enumerate(jobs)])
+        return self.db.total_changes - before
+
+    def lease(self, worker, lease_s=LEASE_S):
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute("""SELECT id, payload FROM jobs
+                WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?)
+                ORDER BY seq LIMIT 1""", (now,)).fetchone()
+            if row:
+                self.db.execute("""UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?,
+                    attempts = attempts + 1, updated = ? WHERE id = ?""", (worker, now + lease_s, now, row[0]))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return json.loads(row[1]) if row else None
+
+    def _owned(self, sql, args, job_id, worker):
+        cur = self.db.execute(sql + " WHERE id = ? AND state = 'leased' AND worker = ?", (*args, job_id, worker))
+        return cur.rowcount == 1
+
+    def renew(self, job_id, worker, lease_s=LEASE_S):
+        return self._owned("UPDATE jobs SET lease_until = ?", (time.time() + lease_s,), job_id, worker)
+
+    def complete(self, job_id, worker, run_dir):
+        return self._owned("UPDATE jobs SET state = 'done', run_dir = ?, error = NULL, updated = ?",
+                           (run_dir, time.time()), job_id, worker)
+
+    def fail(self, job_id, worker, error):
+        return self._owned("""UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                              worker = NULL, error = ?, updated = ?""",
+                           (self.max_attempts, error, time.time()), job_id, worker)
+
+    # Leases held under these names belong to a previous run of this orchestrator
+    def release(self, workers):
+        self.db.executemany("UPDATE jobs SET state = 'pending', worker = NULL, attempts = MAX(attempts - 1, 0) "
+                            "WHERE state = 'leased' AND worker = ?", [(w,) for w in workers])
+
+    def reset_failed(self):
+        return self.db.execute("UPDATE jobs SET state = 'pending', attempts = 0 WHERE state = 'failed'").rowcount
+
+    def counts(self):
+        out = dict.fromkeys(("pending", "leased", "done", "failed"), 0)
+        out.update(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        return out
+
+    def failures(self):
+        return self.db.execute("SELECT id, attempts, error FROM jobs WHERE state = 'failed' ORDER BY id").fetchall()
+
+    def close(self):
+        self.db.close()
+
+# === Orchestrator side ===
+
+class AgentError(Exception):
+    pass
+
+
+class AgentWorker(threading.Thread):
+    """Feeds leased jobs to one agent process and files its results."""
+
+    def __init__(self, name, command, queue_path, results_dir, job_timeout=JOB_TIMEOUT_S):
+        super().__init__(daemon=True)
+        self.name = name
+        self.command = command
+        self.queue_path = queue_path
+        self.results_dir = results_dir
+        self.job_timeout = job_timeout
+        self.proc = None
+        self.done = self.failed = self.restarts = 0
+        self.stop_event = threading.Event()
+
+    def spawn(self):
+        self.close()
+        self.proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                                     bufsize=1)
+        return self.proc
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    # One request/response; renews the lease while waiting
+    def call(self, job, queue):
+        proc = self.proc if self.proc and self.proc.poll() is None else self.spawn()
+        try:
+            proc.stdin.write(json.dumps(job) + "\n")
+            proc.stdin.flush()
+        except OSError as e:
+            raise AgentError(f"agent stdin: {e}")
+        deadline = time.time() + self.job_timeout
+        while True:
+            ready, _, _ = select.select([proc.stdout], [], [], HEARTBEAT_S)
+            if ready:
+                line = proc.stdout.readline()
+                if not line:
+                    raise AgentError(f"agent exited with {proc.wait()}")
+                return json.loads(line)
+            if proc.poll() is not None:
+                raise AgentError(f"agent exited with {proc.returncode}")
+            if time.time() > deadline:
+                raise AgentError(f"timed out after {self.job_timeout:.0f}s")
+            if not queue.renew(job["id"], self.name):
+                raise AgentError("lease lost")
+
+    # Written under a dot-name first so a half-copied run is never globbed
+    def store(self, reply, job):
+        param_dir = os.path.join(self.results_dir, job["param"])
+        os.makedirs(param_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".incoming_", dir=param_dir)
+        for name, text in reply["files"].items():
+            with open(os.path.join(tmp, name), "w") as f:
+                f.write(text)
+        final = os.path.join(param_dir, reply["name"])
+        os.rename(tmp, final)
+        return final
+
+    def run(self):
+        queue = JobQueue(self.queue_path)
+        try:
+            while not self.stop_event.is_set():
+                job = queue.lease(self.name)
+                if job is None:
+                    c = queue.counts()
+                    if not c["pending"] and not c["leased"]:
+                        break
+                    self.stop_event.wait(POLL_S)   # others still hold leases that may come back
+                    continue
+                try:
+                    reply = self.call(job, queue)
+                except (AgentError, ValueError) as e:
+                    queue.fail(job["id"], self.name, str(e))
+                    self.failed += 1
+                    self.restarts += 1
+                    print(f"[{self.name}] {job['id']}: {e}")
+                    self.close()
+                    if self.restarts > MAX_RESTARTS:
+                        print(f"[{self.name}] giving up after {self.restarts} agent restarts")
+                        break
+                    continue
+                if not reply.get("ok"):
+                    queue.fail(job["id"], self.name, reply.get("error", "unknown error"))
+                    self.failed += 1
+                    print(f"[{self.name}] {job['id']}: {reply.get('error')}")
+                    continue
+                run_dir = self.store(reply, job)
+                if queue.complete(job["id"], self.name, run_dir):
+                    self.done += 1
+                else:   # lease expired and someone else has the job now
+                    shutil.rmtree(run_dir, ignore_errors=True)
+        finally:
+            self.close()
+            queue.close()
+
+def local_command(i, args):
+    return [sys.executable, os.path.abspath(__file__), "agent", "--simulate", "--name", f"sim{i}",
+            "--seed", str(i), "--time_scale", str(args.time_scale)]
+
+def ssh_command(host, args):
+    return ["ssh", "-o", "BatchMode=yes", "-o", "ServerAliveInterval=30", host,
+            "python3", args.remote_script, "agent", "--name", host, "--model", args.model,
+            "--sysfs_root", args.sysfs_root]
+
+def orchestrate(spec, results_dir, queue_path, workers, job_timeout=JOB_TIMEOUT_S, seed=0):
+    os.makedirs(results_dir, exist_ok=True)
+    queue = JobQueue(queue_path)
+    added = queue.add(expand(spec, seed))
+    queue.release([name for name, _ in workers])
+    print(f"{added} new jobs, queue now {queue.counts()}")
+
+    threads = [AgentWorker(name, command, queue_path, results_dir, job_timeout) for name, command in workers]
+    for t in threads:
+        t.start()
+    t0, start_done = time.time(), queue.counts()["done"]
+    try:
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=HEARTBEAT_S / len(threads))
+            c = queue.counts()
+            rate = (c["done"] - start_done) / (time.time() - t0)
+            left = c["pending"] + c["leased"]
+            eta = f", ETA {left / rate / 3600:.1f} h" if rate > 0 else ""
+            print(f"{c['done']} done, {c['leased']} running, {c['pending']} pending, {c['failed']} failed{eta}")
+    except KeyboardInterrupt:
+        print("Stopping workers; leased jobs go back to pending on the next run")
+        for t in threads:
+            t.stop_event.set()
+        for t in threads:
+            t.join()
+    for t in threads:
+        print(f"  {t.name}: {t.done} done, {t.failed} failed attempts, {t.restarts} agent restarts")
+    counts = queue.counts()
+    queue.close()
+    return counts
+
+# === Board side (agent) ===
+
+class BoardDevice:
+    def __init__(self, name, model_path, sysfs_root="/", telemetry_hz=20):
+        from model_pool import ModelPool
+        from governor import CpuControl
+        from telemetry import TelemetrySampler
+        from cooldown_scheduler import ThermalModel, STATE_FILE
+        self.name = name
+        self.pool = ModelPool(model_path)
+        self.control = CpuControl(sysfs_root)
+        self.sysfs_root = sysfs_root
+        self.thermal = ThermalModel.load(STATE_FILE)
+        self.state_file = STATE_FILE
+        self.sampler = TelemetrySampler(hz=telemetry_hz, root=sysfs_root)
+        self.sampler.start()
+
+    def cool(self, safe_temp):
+        from cooldown_scheduler import wait_until_cool
+        wait = wait_until_cool(safe_temp, self.thermal, self.sysfs_root)
+        self.thermal.save(self.state_file)
+        return wait
+
+    # every core stays online; the core count is affinity + n_threads
+    def configure(self, freq, cores, ctx):
+        from core_control import apply_cores
+        llm = self.pool.get(ctx).llm
+        self.control.apply(freq, len(self.control.cpus))
+        apply_cores(llm, cores)
+        return llm
+
+    def mark(self):
+        return self.sampler.count
+
+    def finish(self, result, mark, metrics_path):
+        self.sampler.dump(metrics_path, mark)
+
+    def close(self):
+        self.sampler.stop()
+
+
+class SimulatedDevice:
+    """A Pi on this box: fake sysfs with its own ambient and cooling, fake
+    Llama timed by the configured freq/cores. Simulated seconds run
+    time_scale times faster than real ones."""
+
+    def __init__(self, name, seed=0, time_scale=0.001):
+        sys.path.insert(0, str(REPO_ROOT))
+        from benchmarks import fake_llama
+        from benchmarks.fake_sysfs import FakeSysfs
+        from governor import CpuControl
+        fake_llama.install()
+        rng = random.Random(seed)
+        self.name = name
+        self.time_scale = time_scale
+        self.sysfs = FakeSysfs(ambient=rng.uniform(36, 44), temp=rng.uniform(45, 60), tau=rng.uniform(120, 180),
+                               heat_per_ghz_core=rng.uniform(3.5, 4.5))
+        self.control = CpuControl(self.sysfs.root)
+        self.llms = {}
+        self.sampler = None
+        self.clock = 0.0
+        self.trace = []   # (simulated time, temp) after every step of the plant
+        advance = self.sysfs.advance
+
+        def traced(dt, busy_cores=0):
+            self.clock += dt
+            temp = advance(dt, busy_cores)
+            self.trace.append((self.clock, temp))
+            return temp
+        self.sysfs.advance = traced
+
+    def cool(self, safe_temp, step=5.0):
+        t0 = self.clock
+        while self.sysfs.temp > safe_temp:
+            self.sysfs.advance(step, 0)
+            time.sleep(step * self.time_scale)
+        return self.clock - t0, self.sysfs.temp
+
+    def configure(self, freq, cores, ctx):
+        from benchmarks.fake_llama import FakeLlama
+        llm = self.llms.get(ctx) or self.llms.setdefault(
+            ctx, FakeLlama(n_ctx=ctx, sysfs=self.sysfs, time_scale=self.time_scale))
+        self.control.apply(freq, len(self.control.cpus))
+        llm.n_threads = cores
+        return llm
+
+    def mark(self):
+        return len(self.trace), self.clock
+
+    def finish(self, result, mark, metrics_path):
+        start, t0 = mark
+        result["elapsed_time"] = self.clock - t0
+        result["token_rate"] = result["total_tokens"] / result["elapsed_time"] if result["elapsed_time"] else 0
+        result["simulated"] = True
+        with open(metrics_path, "w") as f:
+            f.write("time,cpu_temp_C\n")
+            f.writelines(f"{t - t0:.4f},{temp:.3f}\n" for t, temp in self.trace[start:])
+
+    def close(self):
+        self.sysfs.cleanup()
+
+
+def load_items(path, cache):
+    if path not in cache:
+        from batch_runner import iter_dataset
+        cache[path] = [item for _, item in iter_dataset(path)]
+    return cache[path]
+
+def run_job(device, job, datasets):
+    from model_mt import run_inference
+    items = load_items(job["dataset"], datasets)
+    item = items[job["query"] % len(items)]
+    cool_wait, start_temp = device.cool(job.get("safe_temp", 55.0))
+    llm = device.configure(job["freq"], job["cores"], job["ctx"])
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics_path = os.path.join(tmp, "metrics.csv")
+        mark = device.mark()
+        result = run_inference(llm, item["question"], item["context"], job.get("max_tokens", 128),
+                               sampler=device.sampler)
+        if result is None:
+            return {"id": job["id"], "ok": False, "error": "inference failed"}
+        device.finish(result, mark, metrics_path)
+        with open(metrics_path) as f:
+            metrics = f.read()
+    result.update({PARAM_FIELDS["freq"]: job["freq"], PARAM_FIELDS["core"]: job["cores"],
+                   PARAM_FIELDS["ctx"]: job["ctx"]},
+                  query=job["query"], repeat=job["repeat"], device=device.name, cool_wait=cool_wait,
+                  start_temp=start_temp, ground_truth=item.get("answer", item.get("answers", "N/A")))
+    return {"id": job["id"], "ok": True, "name": run_name(job, time.strftime("%Y%m%d_%H%M%S")),
+            "files": {"output.json": json.dumps(result, indent=4), "metrics.csv": metrics}}
+
+# Jobs in on stdin, one reply per line out on the real stdout; everything
+# the model code prints goes to stderr so it cannot corrupt the protocol
+def agent(device):
+    proto = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+    datasets = {}
+    try:
+        for line in sys.stdin:
+            job = json.loads(line)
+            try:
+                reply = run_job(device, job, datasets)
+            except Exception as e:
+                reply = {"id": job["id"], "ok": False, "error": f"{type(e).__name__}: {e}"}
+            proto.write(json.dumps(reply) + "\n")
+    finally:
+        device.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distribute a freq/core/ctx sweep across boards.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="Queue a spec and run it to completion.")
+    run.add_argument("--spec", required=True)
+    run.add_argument("--results", required=True, help="Sweep root: <results>/<param>/q*_*/")
+    run.add_argument("--queue", help=f"Default: <results>/{QUEUE_NAME}")
+    run.add_argument("--hosts", nargs="*", default=[], help="Boards reachable with key-based ssh.")
+    run.add_argument("--local", type=int, default=0, help="Simulated boards as local processes.")
+    run.add_argument("--time_scale", type=float, default=0.001, help="Real seconds per simulated second.")
+    run.add_argument("--remote_script", default=REMOTE_SCRIPT)
+    run.add_argument("--model", default=MODEL_PATH, help="Model path on the boards.")
+    run.add_argument("--sysfs_root", default="/")
+    run.add_argument("--job_timeout", type=float, default=JOB_TIMEOUT_S)
+    run.add_argument("--seed", type=int, default=0)
+
+    status = sub.add_parser("status", help="Show queue state and failed jobs.")
+    status.add_argument("--queue", required=True)
+    status.add_argument("--reset_failed", action="store_true", help="Give failed jobs another MAX_ATTEMPTS.")
+
+    ag = sub.add_parser("agent", help="Board side: run jobs read from stdin.")
+    ag.add_argument("--name", default=os.uname().nodename)
+    ag.add_argument("--simulate", action="store_true")
+    ag.add_argument("--seed", type=int, default=0)
+    ag.add_argument("--time_scale", type=float, default=0.001)
+    ag.add_argument("--model", default=MODEL_PATH)
+    ag.add_argument("--sysfs_root", default="/")
+    ag.add_argument("--telemetry_hz", type=float, default=20)
+    args = parser.parse_args()
+
+    if args.cmd == "agent":
+        agent(SimulatedDevice(args.name, args.seed, args.time_scale) if args.simulate
+              else BoardDevice(args.name, args.model, args.sysfs_root, args.telemetry_hz))
+    elif args.cmd == "status":
+        queue = JobQueue(args.queue)
+        if args.reset_failed:
+            print(f"{queue.reset_failed()} failed jobs back to pending")
+        print(queue.counts())
+        for job_id, attempts, error in queue.failures():
+            print(f"  {job_id} ({attempts} attempts): {error}")
+    else:
+        workers = [(host, ssh_command(host, args)) for host in args.hosts]
+        workers += [(f"sim{i}", local_command(i, args)) for i in range(args.local)]
+        if not workers:
+            parser.error("give --hosts and/or --local")
+        with open(args.spec) as f:
+            spec = json.load(f)
+        counts = orchestrate(spec, args.results, args.queue or os.path.join(args.results, QUEUE_NAME),
+                             workers, args.job_timeout, args.seed)
+        print(f"Final: {counts}. Plot with plot_column_safe_regions.py --base {args.results}")
+        sys.exit(1 if counts["failed"] else 0)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import os
+import re
+import glob
+import time
+import argparse
+import threading
+import numpy as np
+from core_control import pin_current_thread, unpin_thread
+
+# === Configuration ===
+SYSFS_ROOT   = "/"
+SAMPLE_HZ    = 20
+CAPACITY     = 65536     # samples kept in the ring (~55 min at 20 Hz)
+HOUSEKEEPING_CPU = None  # pin the sampler here, away from the inference cores
+
+# sysfs values are integers: millidegrees C for thermal zones, kHz for cpufreq
+def discover_sensors(root=SYSFS_ROOT):
+    sensors = []
+    for path in sorted(glob.glob(os.path.join(root, "sys/class/thermal/thermal_zone*/temp"))):
+        zone = os.path.basename(os.path.dirname(path))
+        sensors.append((f"{zone}_temp_C", path, 1e-3))
+    cpus = glob.glob(os.path.join(root, "sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq"))
+    for path in sorted(cpus, key=lambda p: int(re.search(r"cpu(\d+)/cpufreq", p).group(1))):
+        cpu = path.split(os.sep)[-3]
+        sensors.append((f"{cpu}_freq_MHz", path, 1e-3))
+    return sensors
+
+
+class SysfsReader:
+    """Keeps each sensor file open and re-reads it with pread."""
+
+    def __init__(self, sensors):
+        self.names = [name for name, _, _ in sensors]
+        self.scales = np.array([scale for _, _, scale in sensors])
+        self.fds = [os.open(path, os.O_RDONLY) for _, path, _ in sensors]
+
+    def read_into(self, out):
+        for i, fd in enumerate(self.fds):
+            try:
+                out[i] = int(os.pread(fd, 32, 0)) * self.scales[i]
+            except (OSError, ValueError):
+                out[i] = np.nan
+        return out
+
+    def read(self):
+        return dict(zip(self.names, self.read_into(np.empty(len(self.fds)))))
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+
+class CpuLoadReader:
+    """Busy cores (0..n_cpus) since the previous read, from the first line of /proc/stat."""
+
+    def __init__(self, root=SYSFS_ROOT):
+        self.fd = os.open(os.path.join(root, "proc/stat"), os.O_RDONLY)
+        self.n_cpus = os.cpu_count() or 1
+        self.last = None
+
+    def read(self):
+        try:
+            ticks = [int(x) for x in os.pread(self.fd, 256, 0).split(b"\n", 1)[0].split()[1:9]]
+        except (OSError, ValueError):
+            return np.nan
+        idle, total = ticks[3] + ticks[4], sum(ticks)   # idle + iowait
+        last, self.last = self.last, (idle, total)
+        if last is None or total <= last[1]:
+            return np.nan
+        return (1.0 - (idle - last[0]) / (total - last[1])) * self.n_cpus
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TelemetrySampler(threading.Thread):
+    def __init__(self, sensors=None, hz=SAMPLE_HZ, capacity=CAPACITY, root=SYSFS_ROOT,
+                 cpu=HOUSEKEEPING_CPU, load=True):
+        super().__init__(daemon=True)
+        self.reader = SysfsReader(sensors if sensors is not None else discover_sensors(root))
+        # utilization for the energy estimate (energy.py), where /proc is under root
+        self.load = CpuLoadReader(root) if load and os.path.exists(os.path.join(root, "proc/stat")) else None
+        self.columns = ["time"] + self.reader.names + (["busy_cores"] if self.load else [])
+        self.period = 1.0 / hz
+        self.cpu = cpu
+        # preallocated ring: column 0 is time since start, then one per sensor
+        self.ring = np.full((capacity, len(self.columns)), np.nan)
+        self.count = 0
+        self.t0 = None
+        self.stop_event = threading.Event()
+
+    def run(self):
+        tid = pin_current_thread({self.cpu}) if self.cpu is not None else None
+        try:
+            self.sample()
+        finally:
+            if tid is not None:
+                unpin_thread(tid)
+
+    def sample(self):
+        self.t0 = time.perf_counter()
+        next_t = self.t0
+        capacity = len(self.ring)
+        while not self.stop_event.is_set():
+            row = self.ring[self.count % capacity]
+            row[0] = time.perf_counter() - self.t0
+            self.reader.read_into(row[1:])
+            if self.load:
+                row[-1] = self.load.read()
+            self.count += 1
+            next_t += self.period
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                next_t = time.perf_counter()   # fell behind; don't burst to catch up
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.reader.close()
+        if self.load:
+            self.load.close()
+
+    # Samples in time order, oldest first; `start` is a previous self.count
+    # mark, e.g. taken when a request began
+    def samples(self, start=0):
+        n, capacity = self.count, len(self.ring)
+        start = max(start, n - capacity)
+        idx = np.arange(start, n) % capacity
+        return self.ring[idx]
+
+    def summary(self, start=0):
+        data = self.samples(start)
+        out = {"samples": len(data), "dropped": max(self.count - len(self.ring) - start, 0)}
+        for i, name in enumerate(self.columns[1:], start=1):
+            col = data[:, i]
+            if len(col) and not np.isnan(col).all():
+                out[f"{name}_mean"] = float(np.nanmean(col))
+                out[f"{name}_max"] = float(np.nanmax(col))
+        return out
+
+    # CSV for the plotting scripts; cpu_temp_C is the first thermal zone
+    def dump(self, path, start=0):
+        data = self.samples(start)
+        header = list(self.columns)
+        temps = [i for i, name in enumerate(header) if name.endswith("_temp_C")]
+        if temps:
+            header.append("cpu_temp_C")
+            data = np.column_stack([data, data[:, temps[0]]])
+        np.savetxt(path, data, delimiter=",", header=",".join(header), comments="", fmt="%.4f")
+        return path
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sample sysfs temperature/frequency into a ring buffer.")
+    parser.add_argument("--hz", type=float, default=SAMPLE_HZ)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--out", default="metrics.csv")
+    parser.add_argument("--sysfs_root", default=SYSFS_ROOT, help="Root of a real or fake sysfs tree.")
+    parser.add_argument("--cpu", type=int, default=HOUSEKEEPING_CPU, help="CPU to pin the sampler to.")
+    args = parser.parse_args()
+
+    with TelemetrySampler(hz=args.hz, root=args.sysfs_root, cpu=args.cpu) as sampler:
+        time.sleep(args.duration)
+    print(sampler.summary())
+    print(f"Samples saved to {sampler.dump(args.out)}")
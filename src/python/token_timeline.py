@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import struct
+import numpy as np
+
+# Per-token arrival times, in seconds since the request started, stored as a
+# raw little-endian float32 sidecar next to the result JSON. Each token is
+# appended as it arrives so a controller can tail the file mid-generation.
+DTYPE = "<f4"
+PACK = "<f"
+SUFFIX = ".tokens.f32"
+EVENTS_SUFFIX = ".events.jsonl"   # control changes made mid-generation
+
+def sidecar_path(result_path):
+    root, _ = os.path.splitext(result_path)
+    return root + SUFFIX
+
+def events_path(timeline_path):
+    root = timeline_path[:-len(SUFFIX)] if timeline_path.endswith(SUFFIX) else os.path.splitext(timeline_path)[0]
+    return root + EVENTS_SUFFIX
+
+
+class TokenTimeline:
+    def __init__(self, path=None, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.times = []
+        self.events = []
+        self.path = path
+        self.f = open(path, "wb") if path else None
+        self.events_f = None
+
+    def mark(self):
+        t = time.perf_counter() - self.t0
+        self.times.append(t)
+        if self.f:
+            self.f.write(struct.pack(PACK, t))
+            self.f.flush()
+        return t
+
+    # Something changed between tokens; `token` is how many had arrived
+    def event(self, **fields):
+        e = {"token": len(self.times), "t": time.perf_counter() - self.t0, **fields}
+        self.events.append(e)
+        if self.path:
+            if self.events_f is None:
+                self.events_f = open(events_path(self.path), "w")
+            self.events_f.write(json.dumps(e) + "\n")
+            self.events_f.flush()
+        return e
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
+        if self.events_f:
+            self.events_f.close()
+            self.events_f = None
+
+    def summary(self):
+        # Time to first token covers prompt eval; the rest is decode
+        if not self.times:
+            return {"ttft": None, "prompt_eval_time": None, "decode_time": None, "decode_rate": None}
+        ttft = self.times[0]
+        decode = self.times[-1] - ttft
+        n = len(self.times) - 1
+        summary = {
+            "ttft": ttft,
+            "prompt_eval_time": ttft,
+            "decode_time": decode,
+            "decode_rate": n / decode if decode > 0 else None,
+        }
+        if self.events:
+            summary["control_events"] = self.events
+        return summary
+
+
+def read_timeline(path):
+    return np.fromfile(path, dtype=DTYPE)
+
+def read_events(timeline_path):
+    try:
+        with open(events_path(timeline_path)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+# Gap between the last two tokens written so far, without reading the whole file
+def last_token_interval(path):
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < 8:
+                return None
+            f.seek(-8, os.SEEK_END)
+            a, b = np.frombuffer(f.read(8), dtype=DTYPE)
+            return float(b - a)
+    except OSError:
+        return None